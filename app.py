@@ -1,9 +1,21 @@
 import streamlit as st
 import os
-from utils.face_swap import swap_face, estimate_cost, get_available_models, get_model_info
-from utils.file_handler import save_uploaded_file, cleanup_old_files
+import time
+from utils.face_swap import (
+    estimate_cost, estimate_processing_time, check_cost_limit, get_available_models, get_model_info
+)
+from utils.file_handler import save_uploaded_file, cleanup_old_files, deferred_file_reader
+from utils.video_probe import probe_video_file
 from utils.auth import AuthManager, show_login_page
-from config import UPLOAD_DIR, RESULT_DIR, FACE_SWAP_MODEL, AKOOL_API_KEY, REPLICATE_API_TOKEN
+from utils.batch_ui import show_batch_page
+from utils.job_queue import Job, get_job_manager
+from utils.backends import get_backend
+from utils.circuit_breaker import get_breaker
+from utils.router import get_router
+from config import (
+    UPLOAD_DIR, RESULT_DIR, FACE_SWAP_MODEL, JOB_POLL_SECONDS, ROUTING_ENABLED,
+    STORAGE_BACKEND, STORAGE_LOCAL_DIR, STORAGE_LOCAL_RETENTION_HOURS
+)
 
 # 页面配置
 st.set_page_config(
@@ -26,6 +38,22 @@ if "processing_complete" not in st.session_state:
     st.session_state.processing_complete = False
 if "result_url" not in st.session_state:
     st.session_state.result_url = None
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None
+
+# 后台任务管理器（所有会话共享）
+job_manager = get_job_manager()
+
+# 页面刷新后从 URL 找回未完成的任务
+if st.session_state.job_id is None and "job" in st.query_params:
+    restored_job = job_manager.get(st.query_params["job"])
+    if restored_job and restored_job["owner"] == auth.get_current_user():
+        if restored_job["status"] == Job.STATUS_SUCCEEDED:
+            st.session_state.result_url = restored_job["result_url"]
+            st.session_state.result_path = restored_job["result_path"]
+            st.session_state.processing_complete = True
+        elif restored_job["status"] != Job.STATUS_FAILED:
+            st.session_state.job_id = restored_job["job_id"]
 
 # 标题
 st.title("🎭 营销视频换脸工具")
@@ -46,6 +74,10 @@ with st.sidebar:
         auth.logout()
         st.rerun()
 
+    # 批量模式：一个视频换成多张脸（URL 中有批次 ID 时默认进入）
+    mode = st.radio("处理模式", ["单个视频", "批量换脸"], index=1 if "batch" in st.query_params else 0,
+                    horizontal=True)
+
     st.markdown("---")
 
     st.header("📖 使用说明")
@@ -62,7 +94,7 @@ with st.sidebar:
     - **照片大小**：< 10MB
     - **视频格式**：MP4, MOV
     - **视频大小**：< 500MB
-    - **视频时长**：建议 < 60秒
+    - **视频时长**：建议 < 60秒（更长的视频会自动分段并行处理，需要安装 ffmpeg）
 
     ### 💰 成本：
     - 每次处理：约 ¥0.6 ($0.089)
@@ -94,6 +126,10 @@ with st.sidebar:
     - 添加 `REPLICATE_API_TOKEN=xxx`
     """)
 
+if mode == "批量换脸":
+    show_batch_page(job_manager, auth.get_current_user())
+    st.stop()
+
 # 主界面 - 分两列
 col1, col2 = st.columns(2)
 
@@ -113,6 +149,14 @@ with col1:
         st.image(face_image, caption="上传的头像", use_container_width=True)
         st.success(f"✅ 照片已上传: {face_image.name}")
 
+        # 提前上传照片并检测人脸关键点，点击开始换脸时直接命中缓存
+        backend = get_backend()
+        if backend.capabilities()["prefetch_landmarks"] and backend.is_available() \
+                and st.session_state.get("face_file_id") != face_image.file_id:
+            st.session_state.face_file_id = face_image.file_id
+            st.session_state.face_path = save_uploaded_file(face_image, "image")
+            job_manager.prefetch_landmarks(st.session_state.face_path)
+
     st.markdown("---")
 
     # 上传视频
@@ -127,9 +171,19 @@ with col1:
         st.video(video_file)
         st.success(f"✅ 视频已上传: {video_file.name}")
 
-        # 显示文件信息
+        # 显示文件信息（只解析文件头，不解码视频）
         file_size_mb = video_file.size / (1024 * 1024)
-        st.info(f"📊 文件大小: {file_size_mb:.2f} MB")
+        if st.session_state.get("video_info_file_id") != video_file.file_id:
+            st.session_state.video_info_file_id = video_file.file_id
+            st.session_state.video_info = probe_video_file(video_file)
+        video_info = st.session_state.video_info
+
+        details = [f"文件大小: {file_size_mb:.2f} MB"]
+        if video_info.get("duration"):
+            details.append(f"时长: {video_info['duration']:.1f} 秒")
+        if video_info.get("width"):
+            details.append(f"分辨率: {video_info['width']}x{video_info['height']}")
+        st.info("📊 " + " | ".join(details))
 
 # 右列 - 处理和结果
 with col2:
@@ -144,70 +198,125 @@ with col2:
     if model_info.get('description'):
         st.caption(model_info.get('description'))
 
+    # 主模型熔断期间新任务会改用备用模型
+    breaker_state = get_breaker(FACE_SWAP_MODEL).snapshot()
+    if breaker_state["state"] == "open":
+        st.warning(f"⚠️ {model_info.get('name', FACE_SWAP_MODEL)} 最近多次失败，"
+                   f"约 {max(1, round(breaker_state['retry_in']))} 秒内的新任务将改用备用模型（未配置备用模型时直接失败）")
+
     # 检查是否配置了 API Token
-    api_configured = False
-    if FACE_SWAP_MODEL == "akool":
-        if AKOOL_API_KEY:
-            st.success("✅ Akool API Key 已配置")
-            api_configured = True
-        else:
-            st.error("❌ 未配置 Akool API Key！")
-            st.info("请查看左侧说明配置 API Key")
-    elif FACE_SWAP_MODEL == "okaris_roop":
-        if REPLICATE_API_TOKEN:
-            st.success("✅ Replicate API Token 已配置")
-            api_configured = True
-        else:
-            st.error("❌ 未配置 Replicate API Token！")
+    backend = get_backend()
+    api_configured = backend.is_available()
+    if api_configured:
+        st.success(f"✅ {backend.display_name} 已配置")
+        for note in backend.status_notes():
+            st.caption(note)
+    else:
+        st.error(f"❌ 未配置 {backend.config.get('requires', 'API Key')}！")
+        st.info("请查看左侧说明配置 API Key")
+
+    # 提交前显示预估成本和耗时，超过成本上限时不允许提交
+    cost_error = None
+    eta_seconds = None
+    if video_file and st.session_state.get("video_info", {}).get("duration"):
+        video_info = st.session_state.video_info
+        # 开启自动路由时按当前会选中的模型预估（实际在开始处理时再选择）
+        planned_model = None
+        try:
+            if ROUTING_ENABLED:
+                planned_model = get_router().choose(video_info, auth.get_current_user())
+                backend = get_backend(planned_model)
+                st.caption(f"🔀 自动路由：预计使用 {backend.display_name}")
+            cost = check_cost_limit(video_info, planned_model, auth.get_current_user())
+        except ValueError as e:
+            cost_error = str(e)
+            cost = estimate_cost(video_info["duration"], planned_model)
+        eta_seconds = estimate_processing_time(video_info, planned_model)
+
+        col_cost, col_eta = st.columns(2)
+        col_cost.metric("预估成本", f"${cost:.2f}")
+        col_eta.metric("预估耗时", f"约 {max(1, round(eta_seconds / 60))} 分钟")
+        if job_manager.active_count() >= job_manager.max_workers:
+            st.caption(f"⏳ 当前有 {job_manager.active_count()} 个任务在处理，可能需要排队")
+        elif backend.queued_jobs():
+            # 后端的并发任务数有上限，超出的任务在本地排队
+            st.caption(f"⏳ {backend.display_name} 并发已满，{backend.queued_jobs()} 个任务在排队等待")
+        if cost_error:
+            st.error(f"❌ {cost_error}")
 
     # 开始换脸按钮
-    if st.button("🚀 开始换脸", type="primary", use_container_width=True, disabled=not api_configured):
+    job_running = st.session_state.get("job_id") is not None
+    if st.button("🚀 开始换脸", type="primary", use_container_width=True,
+                 disabled=not api_configured or job_running or cost_error is not None):
         if not face_image or not video_file:
             st.error("❌ 请先上传头像照片和视频！")
         else:
             try:
-                # 创建进度容器
-                progress_container = st.container()
-
-                with progress_container:
-                    # 进度条
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-
-                    # 步骤1: 保存文件
-                    status_text.text("📁 正在保存文件...")
-                    progress_bar.progress(20)
-                    face_path = save_uploaded_file(face_image, "image")
+                # 保存文件后提交到后台任务队列，立即返回
+                with st.spinner("📁 正在保存文件..."):
+                    if st.session_state.get("face_file_id") == face_image.file_id:
+                        face_path = st.session_state.face_path
+                    else:
+                        face_path = save_uploaded_file(face_image, "image")
                     video_path = save_uploaded_file(video_file, "video")
 
-                    # 步骤2: 调用API
-                    status_text.text("🎨 正在调用换脸 API，请稍候（约2-5分钟）...")
-                    progress_bar.progress(40)
-
-                    # 进度回调
-                    def update_progress(status, message):
-                        status_text.text(f"🎨 {message}")
+                job_id = job_manager.submit(face_path, video_path, owner=auth.get_current_user())
+                st.session_state.job_id = job_id
+                st.session_state.processing_complete = False
+                st.session_state.result_url = None
+                # 写入 URL，刷新页面后仍可找回任务
+                st.query_params["job"] = job_id
+                st.rerun()
 
-                    result_url = swap_face(face_path, video_path, progress_callback=update_progress)
+            except Exception as e:
+                st.error(f"❌ 提交失败: {str(e)}")
+                st.exception(e)
 
-                    # 步骤3: 完成
-                    progress_bar.progress(100)
-                    status_text.text("✅ 处理完成！")
+    # 任务进度（局部定时刷新，不重跑整个页面）
+    @st.fragment(run_every=JOB_POLL_SECONDS)
+    def show_job_status():
+        job_id = st.session_state.get("job_id")
+        if not job_id:
+            return
+
+        job = job_manager.get(job_id)
+        if job is None:
+            st.warning("⚠️ 任务不存在或已过期")
+            st.session_state.job_id = None
+            st.query_params.pop("job", None)
+            return
+
+        if job["status"] == Job.STATUS_SUCCEEDED:
+            st.session_state.job_id = None
+            st.session_state.result_url = job["result_url"]
+            st.session_state.result_path = job["result_path"]
+            st.session_state.processing_complete = True
+            st.session_state.show_balloons = True
+            st.rerun()
+        elif job["status"] == Job.STATUS_FAILED:
+            st.session_state.job_id = None
+            st.query_params.pop("job", None)
+            st.session_state.job_error = job["error"]
+            st.rerun()
+        else:
+            st.progress(job["progress"])
+            st.text(f"🎨 {job['message']}")
+            elapsed = time.time() - (job["started_at"] or job["created_at"])
+            st.caption(f"⏱️ 已用时 {int(elapsed)} 秒，可以离开或刷新页面，任务会在后台继续")
 
-                    # 保存结果到 session state
-                    st.session_state.result_url = result_url
-                    st.session_state.processing_complete = True
+    show_job_status()
 
-                st.success("✅ 视频换脸完成！")
-                st.balloons()
+    job_error = st.session_state.pop("job_error", None)
+    if job_error:
+        st.error(f"❌ 处理失败: {job_error}")
 
-            except Exception as e:
-                st.error(f"❌ 处理失败: {str(e)}")
-                st.exception(e)
+        # 常见错误提示
+        if "authentication" in job_error.lower() or "api" in job_error.lower():
+            st.info("💡 可能是 API Token 配置错误，请检查 .env 文件")
 
-                # 常见错误提示
-                if "authentication" in str(e).lower() or "api" in str(e).lower():
-                    st.info("💡 可能是 API Token 配置错误，请检查 .env 文件")
+    if st.session_state.pop("show_balloons", False):
+        st.success("✅ 视频换脸完成！")
+        st.balloons()
 
     # 显示结果
     if st.session_state.get("processing_complete", False):
@@ -215,8 +324,20 @@ with col2:
         st.subheader("📥 步骤3: 下载结果")
 
         result_url = st.session_state.get("result_url")
-
-        if result_url:
+        result_path = st.session_state.get("result_path")
+
+        if result_path and os.path.isfile(result_path):
+            # 结果已保存到本地，供应商链接过期后仍可下载
+            st.video(result_path)
+            st.download_button(
+                "⬇️ 下载视频",
+                data=deferred_file_reader(result_path),
+                file_name=os.path.basename(result_path),
+                mime="video/mp4",
+                use_container_width=True
+            )
+
+        if result_url and not os.path.isfile(str(result_url)):
             # 将 FileOutput 对象转换为字符串
             result_url_str = str(result_url)
 
@@ -233,12 +354,15 @@ with col2:
             ```
             """)
 
+        if result_url:
             st.success("🎉 视频换脸完成！您可以下载使用了。")
 
             # 重新开始按钮
             if st.button("🔄 处理新视频", use_container_width=True):
                 st.session_state.processing_complete = False
                 st.session_state.result_url = None
+                st.session_state.result_path = None
+                st.query_params.pop("job", None)
                 st.rerun()
 
 # 页面底部
@@ -248,19 +372,17 @@ st.markdown("---")
 col_stat1, col_stat2, col_stat3 = st.columns(3)
 
 # 根据当前模型显示成本
-if FACE_SWAP_MODEL == "akool":
-    cost_text = "¥0.7/10秒"
-    cost_help = "使用 Akool API，效果最佳"
-    model_text = "Akool 4K"
-else:
-    cost_text = "¥0.6/次"
-    cost_help = "使用 okaris/roop API"
-    model_text = "Roop"
+cost_text = model_info.get("price_text", "-")
+cost_help = f"使用 {model_info.get('name', FACE_SWAP_MODEL)}"
+model_text = model_info.get("short_name", FACE_SWAP_MODEL)
 
 with col_stat1:
     st.metric("处理成本", cost_text, help=cost_help)
 with col_stat2:
-    st.metric("处理时长", "约2-5分钟", help="根据视频大小而定")
+    if eta_seconds:
+        st.metric("处理时长", f"约{max(1, round(eta_seconds / 60))}分钟", help="根据视频时长、分辨率和最近任务的耗时估算")
+    else:
+        st.metric("处理时长", "约2-5分钟", help="根据视频大小而定")
 with col_stat3:
     st.metric("当前模型", model_text, help="支持格式: MP4, MOV")
 
@@ -276,5 +398,7 @@ st.markdown(f"""
 try:
     cleanup_old_files(UPLOAD_DIR, max_age_hours=24)
     cleanup_old_files(RESULT_DIR, max_age_hours=24)
+    if STORAGE_BACKEND == "local":
+        cleanup_old_files(STORAGE_LOCAL_DIR, max_age_hours=STORAGE_LOCAL_RETENTION_HOURS)
 except Exception as e:
     pass  # 静默失败，不影响主流程
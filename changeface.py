@@ -0,0 +1,182 @@
+"""
+命令行批量换脸（不依赖 Streamlit，适合不占用网页进程的夜间批量任务）
+
+用法:
+    python -m changeface run manifest.csv [--video promo.mp4] [--workers 8] [--model akool]
+
+清单格式见 utils.batch.parse_manifest。任务与网页共用任务库、上传缓存和结果缓存，
+每个任务结束后立即更新报告（默认为清单旁的 <清单名>_report.csv）并把结果复制到输出目录。
+中断后再次运行同一命令：已完成的任务跳过，已提交到 API 的任务继续等待结果（不会重复付费），
+失败的任务重新提交
+"""
+import argparse
+import csv
+import os
+import shutil
+import sys
+import time
+
+from config import JOB_WORKERS, JOB_POLL_SECONDS
+from utils.batch import batch_summary, parse_manifest, result_file, result_name, write_report
+from utils.job_queue import Job, JobManager
+
+
+def load_report(report_path: str) -> list:
+    """
+    读取上次运行的报告
+
+    Returns:
+        list: 报告中的行（按清单顺序），没有报告时为空列表
+    """
+    if not os.path.isfile(report_path):
+        return []
+    with open(report_path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def save_report(rows: list, report_path: str):
+    """写入报告（先写临时文件再改名，中断时不会留下半个文件）"""
+    tmp_path = f"{report_path}.tmp"
+    # 带 BOM，Excel 打开时中文不乱码
+    with open(tmp_path, "w", newline="", encoding="utf-8-sig") as f:
+        write_report(rows, f)
+    os.replace(tmp_path, report_path)
+
+
+def plan(items: list, previous: list, manager: JobManager) -> tuple:
+    """
+    对照上次的报告决定每个任务如何处理
+
+    同一行的照片和视频都没变时：结果文件仍在的成功任务跳过；任务库中未结束的任务继续等待；
+    已成功但结果未保存的任务只保存结果；其余（失败或从未提交）重新提交
+
+    Returns:
+        (rows, resume_ids, submit_rows): 报告行、要恢复的任务 ID、要提交的行
+    """
+    rows = []
+    resume_ids = []
+    submit_rows = []
+    for index, item in enumerate(items):
+        old = previous[index] if index < len(previous) else None
+        if old and (old["face_path"], old["video_path"]) != (item["face_path"], item["video_path"]):
+            old = None
+
+        if old and old["status"] == Job.STATUS_SUCCEEDED and os.path.isfile(old["result_path"] or ""):
+            rows.append(dict(old, label=item["label"]))
+            continue
+
+        row = dict(item, status=Job.STATUS_QUEUED)
+        job = manager.get(old["job_id"]) if old and old.get("job_id") else None
+        # 未结束的任务只有由本报告的运行创建时才能接管（报告被移动过时重新提交）
+        if job and job["status"] != Job.STATUS_FAILED and (Job.is_finished(job) or job["runner"] == manager.runner):
+            row["job_id"] = job["job_id"]
+            if not Job.is_finished(job):
+                resume_ids.append(job["job_id"])
+        else:
+            submit_rows.append(row)
+        rows.append(row)
+    return rows, resume_ids, submit_rows
+
+
+def finish(row: dict, job: dict, output_dir: str, used_names: set):
+    """把结束的任务写入报告行，成功时把结果复制到输出目录"""
+    row.update(status=job["status"], model=job["model"], result_url=job["result_url"], error=job["error"])
+    if job["status"] != Job.STATUS_SUCCEEDED:
+        return
+    try:
+        source = result_file(job)
+        name = result_name(row["label"], os.path.splitext(source)[1] or ".mp4", used_names)
+        row["result_path"] = os.path.join(output_dir, name)
+        shutil.copyfile(source, row["result_path"])
+    except Exception as e:
+        # 任务本身已成功，再次运行时只重新保存结果
+        row["result_path"] = None
+        row["error"] = f"保存结果失败: {e}"
+
+
+def run(args) -> int:
+    """
+    按清单批量换脸
+
+    Returns:
+        int: 退出码（全部成功为 0，有失败的任务为 1，清单错误为 2）
+    """
+    try:
+        items = parse_manifest(args.manifest, args.video)
+    except (OSError, ValueError) as e:
+        print(f"清单无效: {e}", file=sys.stderr)
+        return 2
+
+    stem = os.path.splitext(os.path.abspath(args.manifest))[0]
+    report_path = args.report or f"{stem}_report.csv"
+    output_dir = args.output_dir or f"{stem}_results"
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 不调用 get_job_manager()：不启动网页的任务恢复，只处理本清单的任务。
+    # 任务标记为本报告创建，网页重启时不会接管（重复提交）这些任务
+    manager = JobManager(max_workers=args.workers, runner=f"cli:{os.path.abspath(report_path)}")
+    rows, resume_ids, submit_rows = plan(items, load_report(report_path), manager)
+    used_names = {os.path.basename(row["result_path"]) for row in rows if row.get("result_path")}
+
+    skipped = sum(1 for row in rows if row["status"] == Job.STATUS_SUCCEEDED)
+    print(f"共 {len(rows)} 个任务：跳过已完成 {skipped} 个，继续等待 {len(resume_ids)} 个，提交 {len(submit_rows)} 个")
+
+    try:
+        if resume_ids:
+            manager.recover(job_ids=resume_ids)
+        for row in submit_rows:
+            try:
+                row["job_id"] = manager.submit(row["face_path"], row["video_path"], model=args.model, owner=args.owner)
+            except Exception as e:
+                row.update(status=Job.STATUS_FAILED, error=str(e))
+                print(f"提交失败 {row['label']}: {e}")
+        save_report(rows, report_path)
+
+        pending = [row for row in rows if row["status"] not in Job.FINISHED_STATUSES]
+        while pending:
+            time.sleep(JOB_POLL_SECONDS)
+            for row in list(pending):
+                job = manager.get(row["job_id"])
+                if job is None:
+                    # 任务记录已被删除（或任务库被替换），不会再有结果
+                    job = dict(status=Job.STATUS_FAILED, model=row.get("model"), result_url=None,
+                               error="任务库中找不到该任务")
+                elif not Job.is_finished(job):
+                    continue
+                pending.remove(row)
+                finish(row, job, output_dir, used_names)
+                summary = batch_summary(rows)
+                print(f"[{summary['succeeded'] + summary['failed']}/{summary['total']}] {row['label']}: "
+                      f"{row['status']} {row.get('result_path') or row.get('error') or ''}")
+                save_report(rows, report_path)
+    except KeyboardInterrupt:
+        save_report(rows, report_path)
+        print(f"\n已中断，报告已保存到 {report_path}；再次运行同一命令继续处理")
+        # 工作线程可能阻塞在网络等待中，不等它们结束；已提交的任务下次运行时继续等待结果
+        os._exit(130)
+
+    manager.shutdown()
+    summary = batch_summary(rows)
+    print(f"完成 {summary['succeeded']} 个，失败 {summary['failed']} 个；报告: {report_path}，结果: {output_dir}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m changeface", description="视频换脸命令行工具")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="按 CSV 清单批量换脸（可中断后继续）")
+    run_parser.add_argument("manifest", help="CSV 清单，表头为 face,video,label（video 和 label 可省略）")
+    run_parser.add_argument("--video", help="所有任务共用的视频（清单中没有 video 列时必填）")
+    run_parser.add_argument("--model", help="使用的模型（默认与网页相同）")
+    run_parser.add_argument("--workers", type=int, default=JOB_WORKERS, help=f"同时处理的任务数（默认 {JOB_WORKERS}）")
+    run_parser.add_argument("--report", help="报告路径（默认为 <清单名>_report.csv）")
+    run_parser.add_argument("--output-dir", help="结果保存目录（默认为 <清单名>_results）")
+    run_parser.add_argument("--owner", default="cli", help="任务所属用户（决定成本上限，默认 cli）")
+
+    args = parser.parse_args(argv)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,23 +6,159 @@ load_dotenv()
 # Replicate API 配置
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
 
+# VModel API 配置（可选）
+VMODEL_API_KEY = os.getenv("VMODEL_API_KEY")
+
+# 本地模拟后端（压测用）：不调用任何 API，按视频时长 x FAKE_BACKEND_SECONDS_PER_SECOND 模拟处理，
+# 结果为原视频的副本；FAKE_BACKEND_FAILURE_RATE 为随机失败的比例
+FAKE_BACKEND_ENABLED = os.getenv("FAKE_BACKEND_ENABLED", "false").lower() == "true"
+FAKE_BACKEND_SECONDS_PER_SECOND = float(os.getenv("FAKE_BACKEND_SECONDS_PER_SECOND", "0.1"))
+FAKE_BACKEND_FAILURE_RATE = float(os.getenv("FAKE_BACKEND_FAILURE_RATE", "0"))
+
 # Akool API 配置
 # 获取方式: https://akool.com -> 登录 -> 点击API图标 -> API Credentials
 AKOOL_API_KEY = os.getenv("AKOOL_API_KEY")
+# 多个 API Key（逗号分隔，可来自不同账号）：任务分配给并发余量和余额最多的 Key，
+# 余额不足的 Key 不再接新任务。AKOOL_API_KEY 也会加入 Key 池
+AKOOL_API_KEYS = [key.strip() for key in os.getenv("AKOOL_API_KEYS", "").split(",") if key.strip()]
+if AKOOL_API_KEY and AKOOL_API_KEY not in AKOOL_API_KEYS:
+    AKOOL_API_KEYS.insert(0, AKOOL_API_KEY)
+AKOOL_API_KEY = AKOOL_API_KEY or (AKOOL_API_KEYS[0] if AKOOL_API_KEYS else None)
+# 余额缓存时长（秒），以及 Key 停止接新任务的余额下限（credits）
+AKOOL_CREDIT_REFRESH_SECONDS = float(os.getenv("AKOOL_CREDIT_REFRESH_SECONDS", "60"))
+AKOOL_MIN_CREDIT = float(os.getenv("AKOOL_MIN_CREDIT", "10"))
+
+# Akool 回调配置（可选）
+# 开启后任务完成由 Akool 主动回调通知，轮询只作为低频兜底
+# WEBHOOK_PUBLIC_URL 为 Akool 可访问的回调地址（反向代理到 WEBHOOK_HOST:WEBHOOK_PORT）
+WEBHOOK_ENABLED = os.getenv("WEBHOOK_ENABLED", "false").lower() == "true"
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8502"))
+WEBHOOK_PUBLIC_URL = os.getenv("WEBHOOK_PUBLIC_URL")
+# 开启回调时的兜底轮询间隔（秒）
+WEBHOOK_FALLBACK_POLL_SECONDS = float(os.getenv("WEBHOOK_FALLBACK_POLL_SECONDS", "60"))
+# 用于校验和解密回调内容（Akool 控制台 -> API Credentials）
+AKOOL_CLIENT_ID = os.getenv("AKOOL_CLIENT_ID")
+AKOOL_CLIENT_SECRET = os.getenv("AKOOL_CLIENT_SECRET")
+# 接受未签名的明文回调（任何能访问端口的人都可以伪造，仅用于本地测试）
+WEBHOOK_ALLOW_UNSIGNED = os.getenv("WEBHOOK_ALLOW_UNSIGNED", "false").lower() == "true"
+
+# Akool 客户端限流（同一 API Key 的所有会话共享）
+# 每秒最多发出的 API 请求数和允许的突发请求数（0 = 不限制）
+AKOOL_RATE_LIMIT_PER_SECOND = float(os.getenv("AKOOL_RATE_LIMIT_PER_SECOND", "5"))
+AKOOL_RATE_BURST = float(os.getenv("AKOOL_RATE_BURST", "10"))
+# 同时在 Akool 处理的任务数上限，超出的任务排队等待（0 = 不限制）
+AKOOL_MAX_CONCURRENT_JOBS = int(os.getenv("AKOOL_MAX_CONCURRENT_JOBS", "5"))
 
 # 文件配置
 UPLOAD_DIR = "temp/uploads"
 RESULT_DIR = "temp/results"
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
 
+# 上传前压缩视频：分辨率或码率超过模型的预处理策略（API_CONFIGS 中的 preprocess）时
+# 先用 ffmpeg 转成较小的代理文件再上传，缩短上传和处理时间
+VIDEO_PREPROCESS_ENABLED = os.getenv("VIDEO_PREPROCESS_ENABLED", "true").lower() == "true"
+
+# 单个任务的预估成本上限（美元），超过时拒绝提交；0 表示不限制
+MAX_JOB_COST_USD = float(os.getenv("MAX_JOB_COST_USD", "0"))
+# 按用户设置的成本上限，例如 "alice:1.5,bob:0.5"（未列出的用户使用 MAX_JOB_COST_USD）
+USER_COST_CEILINGS = {
+    name.strip(): float(limit)
+    for name, _, limit in (item.partition(":") for item in os.getenv("USER_COST_CEILINGS", "").split(","))
+    if name.strip() and limit.strip()
+}
+
+# 自动路由：开启后新任务在开始处理时分配给预计最快完成、且成本不超过用户上限的已配置模型
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "false").lower() == "true"
+# 每个模型统计最近多少个结束的任务
+ROUTING_WINDOW = int(os.getenv("ROUTING_WINDOW", "50"))
+
+# 结果下载到本地 RESULT_DIR（供应商链接过期后仍可下载）
+RESULT_MIRROR_ENABLED = os.getenv("RESULT_MIRROR_ENABLED", "true").lower() == "true"
+# 大文件并行下载的线程数
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+# 共享 HTTP 连接池每个主机保持的空闲连接数，应不少于同时访问同一主机的线程数
+# （任务线程数 x 并行下载线程数）
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+
+# 长视频分段处理（Akool，需要本机安装 ffmpeg）
+# 超过 SEGMENT_MIN_DURATION 秒的视频按关键帧切成约 SEGMENT_SECONDS 秒的片段并行换脸，再拼接回原音轨
+# SEGMENT_MIN_DURATION=0 关闭分段
+SEGMENT_MIN_DURATION = float(os.getenv("SEGMENT_MIN_DURATION", "60"))
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", "30"))
+# 单个视频同时处理的片段数
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "4"))
+
+# 任务数据库（SQLite），服务重启后据此恢复未完成的任务
+DB_PATH = os.getenv("DB_PATH", "temp/changeface.db")
+
+# 输入文件存储后端（Akool 需要公网 URL）
+# 可选值: "temp_hosting" (公共临时托管，仅适合测试), "local" (本机目录), "s3" (S3 兼容对象存储)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "temp_hosting")
+# local/s3 的对外访问地址，例如 https://files.example.com/inputs/
+STORAGE_PUBLIC_BASE_URL = os.getenv("STORAGE_PUBLIC_BASE_URL")
+# local: 存储目录、保留时长，以及内置文件服务器端口（0 表示不启动，由 nginx 等提供访问）
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "temp/storage")
+STORAGE_LOCAL_RETENTION_HOURS = int(os.getenv("STORAGE_LOCAL_RETENTION_HOURS", "24"))
+STORAGE_LOCAL_SERVE_PORT = int(os.getenv("STORAGE_LOCAL_SERVE_PORT", "0"))
+# s3: 存储桶配置（需要 pip install boto3）
+STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET")
+STORAGE_S3_ENDPOINT_URL = os.getenv("STORAGE_S3_ENDPOINT_URL")
+STORAGE_S3_REGION = os.getenv("STORAGE_S3_REGION")
+STORAGE_S3_ACCESS_KEY = os.getenv("STORAGE_S3_ACCESS_KEY")
+STORAGE_S3_SECRET_KEY = os.getenv("STORAGE_S3_SECRET_KEY")
+STORAGE_S3_PREFIX = os.getenv("STORAGE_S3_PREFIX", "changeface/")
+# s3 预签名 URL 有效期（秒）
+STORAGE_URL_EXPIRY_SECONDS = int(os.getenv("STORAGE_URL_EXPIRY_SECONDS", "7200"))
+
+# 上传缓存：相同内容的文件在托管 URL 仍有效时直接复用
+# 复用的 URL 至少还需有效的秒数（需覆盖排队和 Akool 下载文件的时间）
+UPLOAD_CACHE_MIN_VALIDITY_SECONDS = int(os.getenv("UPLOAD_CACHE_MIN_VALIDITY_SECONDS", "1200"))
+
+# 临时托管上传的对冲时间：当前服务超过该秒数没有进展时并行启动备用服务，先完成者胜出（0 = 失败后才切换）
+UPLOAD_HEDGE_SECONDS = int(os.getenv("UPLOAD_HEDGE_SECONDS", "15"))
+
+# 结果缓存：相同照片、视频和处理参数在该时长内再次提交时直接返回之前的结果（小时）
+RESULT_CACHE_TTL_HOURS = float(os.getenv("RESULT_CACHE_TTL_HOURS", "72"))
+# 结果没有保存到本地（未开启或保存失败）时，供应商的结果链接会过期，只复用该时长（小时）
+RESULT_URL_CACHE_TTL_HOURS = float(os.getenv("RESULT_URL_CACHE_TTL_HOURS", "1"))
+
+# 人脸关键点缓存最多保存的照片数（按最近使用淘汰）
+LANDMARK_CACHE_MAX_ENTRIES = int(os.getenv("LANDMARK_CACHE_MAX_ENTRIES", "5000"))
+
 # 确保目录存在
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULT_DIR, exist_ok=True)
 
+# 后台任务队列配置
+# 同时运行的换脸任务数（每个任务占用一个工作线程，主要在等待网络 I/O）
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# 页面轮询任务状态的间隔（秒）
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# 批量任务：一个批次同时处理的任务数（其余任务在批次内排队，不占满所有工作线程）
+BATCH_MAX_CONCURRENT_JOBS = int(os.getenv("BATCH_MAX_CONCURRENT_JOBS", "4"))
+# 一个批次最多包含的任务数
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+# 批量任务提前检测人脸关键点的线程数（独立于工作线程，不占用换脸任务的名额）
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+
 # 换脸 API 选择
-# 可选值: "akool" (推荐，效果最好), "okaris_roop" (备选)
+# 可选值: "akool" (推荐，效果最好), "okaris_roop" (备选), "vmodel", "fake" (本地模拟，压测用)
 FACE_SWAP_MODEL = os.getenv("FACE_SWAP_MODEL", "akool")
 
+# 备用模型（逗号分隔，按顺序尝试）：主模型熔断或处理失败时自动切换；留空关闭切换
+FAILOVER_MODELS = [name.strip() for name in os.getenv("FAILOVER_MODELS", "okaris_roop").split(",") if name.strip()]
+
+# 熔断器：统计每个模型最近 CIRCUIT_WINDOW 次调用（至少 CIRCUIT_MIN_CALLS 次），
+# 失败率或慢调用率达到阈值时熔断 CIRCUIT_OPEN_SECONDS 秒，之后放行一个探测任务
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "10"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "4"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_SLOW_RATE = float(os.getenv("CIRCUIT_SLOW_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "120"))
+# 耗时超过预估耗时的多少倍算慢调用
+CIRCUIT_SLOW_FACTOR = float(os.getenv("CIRCUIT_SLOW_FACTOR", "3"))
+
 # API 配置
 API_CONFIGS = {
     "akool": {
@@ -32,21 +168,44 @@ API_CONFIGS = {
         "cost_per_10s": 0.10,  # USD per 10 seconds of video
         "max_resolution": "4K",
         "face_enhance": True,
-        "requires": "AKOOL_API_KEY"
+        "requires": "AKOOL_API_KEY",
+        "short_name": "Akool 4K",
+        "price_text": "¥0.7/10秒",
+        # 上传前压缩：短边超过 1080 像素或码率超过 12 Mbps 时转码
+        "preprocess": {"max_short_side": 1080, "max_bit_rate": 12_000_000}
     },
     "okaris_roop": {
         "name": "Replicate Roop",
         "description": "开源模型，成本较低",
         "model": "okaris/roop:8c1e100ecabb3151cf1e6c62879b6de7a4b84602de464ed249b6cff0b86211d8",
         "cost": 0.089,  # USD (~$0.089 per run)
-        "requires": "REPLICATE_API_TOKEN"
+        "requires": "REPLICATE_API_TOKEN",
+        "short_name": "Roop",
+        "price_text": "¥0.6/次",
+        # 同时运行的预测数
+        "max_concurrent_jobs": int(os.getenv("REPLICATE_MAX_CONCURRENT_JOBS", "4")),
+        # roop 只输出 720p 左右，更大的输入只会拖慢上传
+        "preprocess": {"max_short_side": 720, "max_bit_rate": 6_000_000}
     },
     "replicate_roop": {
         "model": "arabyai-replicate/roop_face_swap",
         "cost": 0.11  # USD
     },
     "vmodel": {
+        "name": "VModel Face Swap",
+        "description": "按秒计费",
         "api_url": "https://api.vmodel.ai/v1/video-face-swap",
-        "cost_per_second": 0.03  # USD
+        "cost_per_second": 0.03,  # USD
+        "requires": "VMODEL_API_KEY",
+        "short_name": "VModel",
+        "price_text": "$0.03/秒",
+        "max_concurrent_jobs": int(os.getenv("VMODEL_MAX_CONCURRENT_JOBS", "4"))
+    },
+    "fake": {
+        "name": "本地模拟后端",
+        "description": "不调用 API，仅用于压测",
+        "requires": "FAKE_BACKEND_ENABLED",
+        "short_name": "Fake",
+        "price_text": "免费"
     }
 }
@@ -0,0 +1,29 @@
+"""
+测试公共设置
+任务库和各类缓存的进程内单例都改为每个测试自己的临时数据库，
+测试不会读写配置的 DB_PATH（temp/changeface.db），也不会留下 -wal/-shm 文件
+"""
+
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import job_queue, job_store, landmark_cache, result_cache, router, upload_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_db(tmp_path, monkeypatch):
+    """共享单例使用 tmp_path 下的数据库，返回其路径"""
+    db_path = str(tmp_path / "changeface.db")
+    monkeypatch.setattr(job_store, "_store", job_store.JobStore(db_path))
+    monkeypatch.setattr(result_cache, "_cache", result_cache.ResultCache(db_path))
+    monkeypatch.setattr(landmark_cache, "_cache", landmark_cache.LandmarkCache(db_path))
+    monkeypatch.setattr(upload_cache, "_cache", upload_cache.UploadCache(db_path))
+    # 依赖任务库的单例在测试中按需重新创建
+    monkeypatch.setattr(router, "_router", None)
+    monkeypatch.setattr(job_queue, "_manager", None)
+    return db_path
@@ -0,0 +1,191 @@
+"""
+AsyncAkoolClient 测试
+用本地假 Akool 服务代替真实 API，不需要 API Key 和网络
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import http.server
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils.akool_async import AsyncAkoolClient, async_swap_face_akool, async_upload_with_expiry
+from utils.akool_client import AkoolAPIError
+from utils.poll_policy import PollingPolicy
+from utils.rate_limit import KeyLimiter
+
+
+class FakeAkool(http.server.BaseHTTPRequestHandler):
+    """任务提交后第一次查询返回处理中，之后返回成功；名字含 fail 的视频返回失败"""
+
+    jobs = {}
+    requests = []
+    lock = threading.Lock()
+
+    def _reply(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        with self.lock:
+            self.requests.append(path)
+
+        if path.endswith("/detect_faces"):
+            self._reply({"error_code": 0, "faces_obj": {"0": {"landmarks": [[[1, 2], [3, 4]]], "region": [[0, 0, 9, 9]]}}})
+        elif path.endswith("/specifyvideo"):
+            payload = json.loads(body)
+            with self.lock:
+                job_id = f"job-{len(self.jobs)}"
+                self.jobs[job_id] = {"polls": 0, "video": payload["modifyVideo"]}
+            self._reply({"code": 1000, "data": {"_id": job_id}})
+        elif path == "/upload":
+            self._reply({"status": "success", "data": {"url": f"http://tmpfiles.org/{len(body)}/file"}})
+        else:
+            self._reply({"code": 404, "msg": "not found"}, 404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        with self.lock:
+            self.requests.append(url.path)
+
+        if url.path.endswith("/listbyids"):
+            items = []
+            with self.lock:
+                for job_id in parse_qs(url.query)["_ids"][0].split(","):
+                    job = self.jobs[job_id]
+                    job["polls"] += 1
+                    if job["polls"] < 2:
+                        items.append({"_id": job_id, "faceswap_status": 1})
+                    elif "fail" in job["video"]:
+                        items.append({"_id": job_id, "faceswap_status": 3, "alg_msg": "no face"})
+                    else:
+                        items.append({"_id": job_id, "faceswap_status": 2, "url": f"https://r/{job_id}.mp4"})
+            self._reply({"code": 1000, "data": {"result": items}})
+        elif url.path.endswith("/quota/info"):
+            self._reply({"code": 1000, "data": {"credit": 42}})
+        else:
+            self._reply({"code": 404, "msg": "not found"}, 404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServer(http.server.ThreadingHTTPServer):
+    # 默认的 listen backlog 只有 5，并发连接多时会被重置
+    request_queue_size = 256
+    daemon_threads = True
+
+
+@pytest.fixture
+def akool():
+    FakeAkool.jobs = {}
+    FakeAkool.requests = []
+    httpd = FakeServer(("127.0.0.1", 0), FakeAkool)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def make_client(base_url):
+    # 不限流：这里测的是并发，限流见 test_rate_limit.py
+    return AsyncAkoolClient(
+        "test-key", base_url=base_url, face_detect_url=base_url,
+        limiter=KeyLimiter(rate=0, burst=1, max_jobs=0)
+    )
+
+
+FAST = PollingPolicy.fixed(interval=0.05, timeout=10)
+
+
+def test_submit_and_wait(akool):
+    async def run():
+        async with make_client(akool) as client:
+            assert (await client.get_credit_info())["data"]["credit"] == 42
+            result = await client.swap_face_video("https://f.jpg", "https://v.mp4", source_landmarks="1,2:3,4")
+            return await client.wait_for_result(result["data"]["_id"], policy=FAST)
+
+    assert asyncio.run(run()) == "https://r/job-0.mp4"
+
+
+def test_failed_job_raises(akool):
+    async def run():
+        async with make_client(akool) as client:
+            result = await client.swap_face_video("https://f.jpg", "https://fail.mp4", source_landmarks="1,2")
+            await client.wait_for_result(result["data"]["_id"], policy=FAST)
+
+    with pytest.raises(AkoolAPIError):
+        asyncio.run(run())
+
+
+def test_one_loop_supervises_many_jobs(akool):
+    async def run():
+        async with make_client(akool) as client:
+            async def job(i):
+                result = await client.swap_face_video("https://f.jpg", f"https://v{i}.mp4", source_landmarks="1,2")
+                return await client.wait_for_result(result["data"]["_id"], policy=FAST)
+            return await asyncio.gather(*(job(i) for i in range(200)))
+
+    urls = asyncio.run(run())
+    assert len(set(urls)) == 200
+
+
+def test_swap_face_end_to_end(akool, tmp_path):
+    face = tmp_path / "face.jpg"
+    video = tmp_path / "video.mp4"
+    face.write_bytes(b"face" * 100)
+    video.write_bytes(b"video" * 10000)
+
+    async def upload_to_fake(client, file_path, progress_callback=None, cancel_event=None):
+        from utils.akool_async import _post_multipart
+        from utils.multipart import MultipartFileStream
+        with MultipartFileStream(file_path, progress_callback=progress_callback, cancel_event=cancel_event) as body:
+            response = await _post_multipart(client, akool + "/upload", body)
+        return response.json()["data"]["url"]
+
+    async def upload(file_path):
+        return await async_upload_with_expiry(file_path, services=[("fake", upload_to_fake, 3600)])
+
+    async def run():
+        async with make_client(akool) as client:
+            return await async_swap_face_akool(
+                str(face), str(video), client=client, upload=upload, polling_policy=FAST
+            )
+
+    assert asyncio.run(run()) == "https://r/job-0.mp4"
+    assert FakeAkool.requests.count("/upload") == 2
+
+
+def test_upload_hedges_past_a_stalled_service(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"x" * 1000)
+
+    async def stalled(client, file_path, progress_callback=None, cancel_event=None):
+        await asyncio.sleep(30)
+
+    async def healthy(client, file_path, progress_callback=None, cancel_event=None):
+        return "https://ok"
+
+    async def run():
+        return await async_upload_with_expiry(
+            str(path), hedge_after=0.2, services=[("stalled", stalled, 3600), ("healthy", healthy, None)]
+        )
+
+    assert asyncio.run(run()) == ("https://ok", None)
@@ -0,0 +1,116 @@
+"""
+Akool Key 池测试
+用假的余额接口代替 Akool，不需要网络
+"""
+
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import akool_keys
+from utils.akool_client import AkoolAPIError
+from utils.akool_keys import KeyPool, key_fingerprint
+
+
+@pytest.fixture
+def credits(monkeypatch):
+    balances = {}
+    fetches = []
+
+    class FakeClient:
+        def __init__(self, api_key):
+            self.api_key = api_key
+
+        def get_credit_info(self):
+            fetches.append(self.api_key)
+            return {"code": 1000, "data": {"credit": balances[self.api_key]}}
+
+    monkeypatch.setattr(akool_keys, "get_akool_client", FakeClient)
+    return balances, fetches
+
+
+def test_routes_to_key_with_most_headroom(credits):
+    balances, fetches = credits
+    balances.update({"key-a": 500, "key-b": 100})
+    pool = KeyPool(["key-a", "key-b"], refresh_seconds=3600, min_credit=10)
+
+    with pool.lease({"duration": 30}) as first:
+        # key-a 已有一个在途任务，第二个任务分给空闲的 key-b
+        with pool.lease({"duration": 30}) as second:
+            assert (first, second) == ("key-a", "key-b")
+    assert sorted(fetches) == ["key-a", "key-b"]
+
+
+def test_drains_exhausted_keys(credits):
+    balances, _ = credits
+    balances.update({"key-a": 5, "key-b": 40})
+    pool = KeyPool(["key-a", "key-b"], refresh_seconds=3600, min_credit=10)
+
+    with pool.lease({"duration": 20}) as api_key:
+        assert api_key == "key-b"
+        # 本地扣除预估用量后 key-b 剩 20，不够再处理 30 秒的视频
+        with pytest.raises(AkoolAPIError):
+            with pool.lease({"duration": 30}):
+                pass
+
+    assert [key["drained"] for key in pool.status()] == [True, False]
+
+
+def test_resume_uses_recorded_key(credits):
+    pool = KeyPool(["key-a", "key-b"])
+
+    with pool.lease(fingerprint=key_fingerprint("key-b")) as api_key:
+        assert api_key == "key-b"
+        assert [key["in_flight"] for key in pool.status()] == [0, 1]
+
+    with pytest.raises(KeyError):
+        with pool.lease(fingerprint="unknown"):
+            pass
+
+
+def test_balance_is_tracked_locally_until_stale_or_rejected(credits):
+    balances, fetches = credits
+    balances.update({"key-a": 500})
+    pool = KeyPool(["key-a"], refresh_seconds=3600, min_credit=10)
+
+    for _ in range(3):
+        with pool.lease({"duration": 30}):
+            pass
+    # 每个任务只在本地扣除预估用量，不重新查询余额
+    assert fetches == ["key-a"]
+    assert pool.status()[0]["credit"] == 410
+
+    # Akool 因余额不足拒绝任务时，下一个任务前重新查询
+    balances["key-a"] = 200
+    with pytest.raises(AkoolAPIError):
+        with pool.lease({"duration": 30}):
+            raise AkoolAPIError(1101, "Insufficient credit")
+    with pool.lease({"duration": 30}):
+        pass
+    assert fetches == ["key-a", "key-a"]
+    assert pool.status()[0]["credit"] == 170
+
+
+def test_concurrent_leases_fetch_balance_once(credits):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    balances, fetches = credits
+    balances.update({"key-a": 500, "key-b": 500})
+    pool = KeyPool(["key-a", "key-b"], refresh_seconds=3600, min_credit=10)
+    barrier = threading.Barrier(8)
+
+    def lease(_):
+        barrier.wait()
+        with pool.lease({"duration": 10}) as api_key:
+            return api_key
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        leased = list(executor.map(lease, range(8)))
+
+    assert sorted(fetches) == ["key-a", "key-b"]
+    assert set(leased) == {"key-a", "key-b"}
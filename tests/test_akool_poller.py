@@ -0,0 +1,216 @@
+"""
+Akool 批量轮询测试
+用假的 Akool 客户端代替 listbyids 接口，不需要网络
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils.akool_client import AkoolAPIError, AkoolClient
+from utils.akool_poller import AkoolPoller
+from utils.poll_policy import PollingPolicy
+
+
+class FakeClient:
+    """按任务 ID 返回预设状态，记录每次请求的 ID"""
+
+    parse_result_items = staticmethod(AkoolClient.parse_result_items)
+    parse_result_item = AkoolClient.parse_result_item
+
+    def __init__(self):
+        self.items = {}
+        self.requests = []
+        self.request_times = []
+        self.error = None
+
+    def get_results(self, job_ids):
+        self.requests.append(sorted(job_ids))
+        self.request_times.append(time.time())
+        if self.error:
+            raise self.error
+        return {"code": 1000, "data": {"result": [self.items[i] for i in job_ids if i in self.items]}}
+
+
+def fast_policy():
+    return PollingPolicy.fixed(0.05, timeout=5)
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} Client Error", response=response)
+
+
+def wait_in_thread(poller, job_id, results):
+    def run():
+        try:
+            results[job_id] = poller.wait(job_id, policy=fast_policy())
+        except Exception as e:
+            results[job_id] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_waiters_share_one_request_per_tick():
+    client = FakeClient()
+    poller = AkoolPoller(client)
+    results = {}
+    threads = [wait_in_thread(poller, job_id, results) for job_id in ("a", "b", "c")]
+
+    # 还没有结果的任务继续等待
+    while len(client.requests) < 2:
+        threading.Event().wait(0.01)
+    client.items["a"] = {"_id": "a", "faceswap_status": AkoolClient.STATUS_SUCCESS, "url": "https://a.mp4"}
+    client.items["b"] = {"_id": "b", "faceswap_status": AkoolClient.STATUS_FAILED, "alg_msg": "no face"}
+    client.items["c"] = {"_id": "c", "faceswap_status": AkoolClient.STATUS_SUCCESS, "url": "https://c.mp4"}
+    for thread in threads:
+        thread.join(5)
+
+    assert results["a"] == "https://a.mp4" and results["c"] == "https://c.mp4"
+    assert isinstance(results["b"], AkoolAPIError) and "no face" in str(results["b"])
+    # 每次请求都包含全部等待中的任务
+    assert ["a", "b", "c"] in client.requests
+    assert poller.requests_sent == len(client.requests)
+    assert poller.pending_ids() == []
+
+
+def test_large_batches_are_split():
+    client = FakeClient()
+    poller = AkoolPoller(client)
+    poller.MAX_IDS_PER_REQUEST = 2
+    for job_id in "abc":
+        client.items[job_id] = {"_id": job_id, "faceswap_status": AkoolClient.STATUS_SUCCESS, "url": job_id}
+    results = {}
+
+    def run(job_id):
+        # 第一次查询前三个任务都已登记
+        results[job_id] = poller.wait(job_id, policy=PollingPolicy.fixed(0.3, timeout=5))
+    threads = [threading.Thread(target=run, args=(job_id,)) for job_id in "abc"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == {"a": "a", "b": "b", "c": "c"}
+    # 分块顺序取决于线程登记的先后
+    assert [len(ids) for ids in client.requests] == [2, 1]
+    assert sorted(sum(client.requests, [])) == ["a", "b", "c"]
+
+
+def test_transient_errors_keep_waiting():
+    client = FakeClient()
+    client.error = requests.ConnectionError("connection reset")
+    poller = AkoolPoller(client)
+    poller.RETRY_BACKOFF_SECONDS = 0.01
+    results = {}
+    thread = wait_in_thread(poller, "a", results)
+
+    while len(client.requests) < 2:
+        threading.Event().wait(0.01)
+    client.error = http_error(503)
+    while len(client.requests) < 4:
+        threading.Event().wait(0.01)
+    client.error = None
+    client.items["a"] = {"_id": "a", "faceswap_status": AkoolClient.STATUS_SUCCESS, "url": "https://a.mp4"}
+    thread.join(5)
+    assert results["a"] == "https://a.mp4"
+
+
+def test_other_api_errors_back_off_and_keep_waiting():
+    client = FakeClient()
+    client.error = AkoolAPIError(1005, "Operation is too frequent")
+    poller = AkoolPoller(client)
+    poller.RETRY_BACKOFF_SECONDS = 0.1
+    results = {}
+    job_ids = ["64f0c2a1e4b0a1b2c3d4e5f6", "64f0c2a1e4b0a1b2c3d4e5f7"]
+    threads = [wait_in_thread(poller, job_id, results) for job_id in job_ids]
+
+    while len(client.requests) < 3:
+        threading.Event().wait(0.01)
+    # 已付费的任务不因非鉴权错误失败，请求间隔逐次加倍
+    assert results == {}
+    first, second = (b - a for a, b in zip(client.request_times, client.request_times[1:]))
+    assert first >= 0.1 and second >= 0.2
+
+    client.error = None
+    for job_id in job_ids:
+        client.items[job_id] = {"_id": job_id, "faceswap_status": AkoolClient.STATUS_SUCCESS, "url": job_id}
+    for thread in threads:
+        thread.join(5)
+    assert results == {job_id: job_id for job_id in job_ids}
+    assert poller._failures == 0
+
+
+def test_error_naming_one_job_fails_only_that_job():
+    bad, good = "64f0c2a1e4b0a1b2c3d4e5f6", "64f0c2a1e4b0a1b2c3d4e5f7"
+
+    class OneBadId(FakeClient):
+        def get_results(self, job_ids):
+            if bad in job_ids:
+                self.requests.append(sorted(job_ids))
+                raise AkoolAPIError(1003, f"Invalid _id: {bad}")
+            return super().get_results(job_ids)
+
+    client = OneBadId()
+    client.items[good] = {"_id": good, "faceswap_status": AkoolClient.STATUS_SUCCESS, "url": "https://good.mp4"}
+    poller = AkoolPoller(client)
+    results = {}
+
+    def run(job_id):
+        try:
+            results[job_id] = poller.wait(job_id, policy=PollingPolicy.fixed(0.3, timeout=5))
+        except Exception as e:
+            results[job_id] = e
+    threads = [threading.Thread(target=run, args=(job_id,)) for job_id in (bad, good)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # 出错的任务失败，同批的其他任务立即单独查询
+    assert isinstance(results[bad], AkoolAPIError)
+    assert results[good] == "https://good.mp4"
+    assert client.requests == [sorted([bad, good]), [good]]
+
+
+@pytest.mark.parametrize("error", [AkoolAPIError(1101, "Invalid authorization"), http_error(401)])
+def test_rejected_requests_fail_waiters_immediately(error):
+    client = FakeClient()
+    client.error = error
+    poller = AkoolPoller(client)
+    results = {}
+    threads = [wait_in_thread(poller, job_id, results) for job_id in ("a", "b")]
+    for thread in threads:
+        thread.join(5)
+
+    # 不等到各自超时
+    assert results == {"a": error, "b": error}
+    assert len(client.requests) <= 2
+
+
+def test_deliver_wakes_waiter_without_polling():
+    client = FakeClient()
+    poller = AkoolPoller(client)
+    results = {}
+
+    def run():
+        results["a"] = poller.wait("a", policy=PollingPolicy.fixed(60, timeout=120))
+    thread = threading.Thread(target=run)
+    thread.start()
+    while not poller.pending_ids():
+        threading.Event().wait(0.01)
+
+    assert poller.deliver("a", AkoolClient.STATUS_SUCCESS, "https://a.mp4")
+    thread.join(5)
+    assert results["a"] == "https://a.mp4"
+    assert client.requests == []
+    assert not poller.deliver("missing", AkoolClient.STATUS_SUCCESS, "https://x.mp4")
@@ -0,0 +1,179 @@
+"""
+换脸后端注册表测试
+只使用本地模拟后端，不需要网络
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import backends
+from utils.backends import FakeBackend, FaceSwapBackend, get_backend
+from utils.face_swap import estimate_cost
+from utils.poll_policy import PollingPolicy
+
+
+@pytest.fixture
+def video(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, "RESULT_DIR", str(tmp_path / "results"))
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"video")
+    return str(path)
+
+
+def test_registry_replaces_model_branches():
+    assert get_backend("akool").capabilities()["segmenting"]
+    assert get_backend("okaris_roop").capabilities()["cancel"]
+    assert estimate_cost(20, "akool") == pytest.approx(0.2)
+    assert estimate_cost(20, "vmodel") == pytest.approx(0.6)
+    with pytest.raises(ValueError):
+        get_backend("unknown")
+
+
+def test_fake_backend_submit_poll_cancel(video):
+    backend = FakeBackend(seconds_per_second=0.01, enabled=True)
+
+    handle = backend.submit("face.jpg", video, {"duration": 5})
+    assert backend.poll(handle)[0] == FaceSwapBackend.STATUS_PENDING
+    time.sleep(0.06)
+    status, result_path, _ = backend.poll(handle)
+    assert status == FaceSwapBackend.STATUS_SUCCEEDED
+    assert open(result_path, "rb").read() == b"video"
+
+    handle = backend.submit("face.jpg", video, {"duration": 5})
+    assert backend.cancel(handle)
+    assert backend.poll(handle)[0] == FaceSwapBackend.STATUS_FAILED
+
+
+def test_swap_respects_concurrency_limit(video, monkeypatch):
+    monkeypatch.setitem(backends.API_CONFIGS, "fake", {"max_concurrent_jobs": 2})
+    backend = FakeBackend(seconds_per_second=0.02, enabled=True)
+    monkeypatch.setattr(backend, "polling_policy", lambda video_info: PollingPolicy.fixed(interval=0.01, timeout=10))
+    peak = []
+    original_submit = backend.submit
+
+    def submit(*args):
+        peak.append(backend.jobs.running)
+        return original_submit(*args)
+
+    backend.submit = submit
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda _: backend.swap("face.jpg", video, video_info={"duration": 1}), range(6)))
+
+    assert len(results) == 6
+    assert max(peak) == 2
+
+
+def test_akool_handle_polls_with_submitting_key(monkeypatch):
+    from utils import akool_client, akool_keys, akool_poller
+    from utils.akool_client import AkoolClient
+    from utils.akool_keys import KeyPool
+    from utils.rate_limit import get_key_limiter
+
+    balances = {"key-a": 100, "key-b": 500}
+    polled_with = []
+
+    class FakeClient:
+        parse_result_items = staticmethod(AkoolClient.parse_result_items)
+        parse_result_item = AkoolClient.parse_result_item
+
+        def __init__(self, api_key):
+            self.api_key = api_key
+
+        def get_credit_info(self):
+            return {"code": 1000, "data": {"credit": balances[self.api_key]}}
+
+        def get_results(self, akool_ids):
+            # 与同一 Key 的其他任务共用批量查询
+            polled_with.append((self.api_key, list(akool_ids)))
+            # 任务只属于提交它的 Key；用错 Key 查询永远查不到
+            assert get_key_limiter(self.api_key).jobs.running == 1
+            return {"code": 1000, "data": {"result": [
+                {"_id": akool_id, "faceswap_status": 2 if akool_id == f"job-on-{self.api_key}" else 1,
+                 "video": "https://r/1.mp4"}
+                for akool_id in akool_ids
+            ]}}
+
+    monkeypatch.setattr(akool_keys, "get_akool_client", FakeClient)
+    monkeypatch.setattr(akool_client, "get_akool_client", FakeClient)
+    monkeypatch.setattr(akool_poller, "get_akool_client", FakeClient)
+    monkeypatch.setattr(akool_poller, "_pollers", {})
+    monkeypatch.setattr(akool_keys, "_pool", KeyPool(["key-a", "key-b"], refresh_seconds=3600))
+    monkeypatch.setattr(akool_client, "swap_face_akool", lambda *args, api_key, wait: f"job-on-{api_key}")
+
+    backend = get_backend("akool")
+    monkeypatch.setattr(backend, "polling_policy", lambda video_info: PollingPolicy.fixed(interval=0.01, timeout=1))
+    handle = backend.submit("face.jpg", "video.mp4", {"duration": 10})
+    # 余额更多的 key-b 接到任务，轮询也必须用 key-b
+    assert handle.endswith(":job-on-key-b")
+    assert backend.wait(handle) == "https://r/1.mp4"
+    assert polled_with == [("key-b", ["job-on-key-b"])]
+    assert get_key_limiter("key-b").jobs.running == 0
+
+
+class FlakyBackend(FakeBackend):
+    """前几次查询抛出指定错误，之后照常查询"""
+
+    def __init__(self, errors):
+        super().__init__(seconds_per_second=0, enabled=True)
+        self.errors = list(errors)
+        self.polls = 0
+
+    def poll(self, handle):
+        self.polls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super().poll(handle)
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} Error", response=response)
+
+
+def test_wait_retries_transient_poll_errors(video, monkeypatch):
+    backend = FlakyBackend([requests.ConnectionError("reset"), http_error(503), http_error(429)])
+    monkeypatch.setattr(backend, "RETRY_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(backend, "polling_policy", lambda video_info: PollingPolicy.fixed(interval=0.01, timeout=10))
+
+    # 已提交的任务不因一次查询失败而判为失败
+    handle = backend.submit("face.jpg", video, {"duration": 1})
+    assert open(backend.wait(handle), "rb").read() == b"video"
+    assert backend.polls == 4
+
+
+def test_wait_stops_on_client_errors_and_at_deadline(video, monkeypatch):
+    backend = FlakyBackend([http_error(404)])
+    monkeypatch.setattr(backend, "polling_policy", lambda video_info: PollingPolicy.fixed(interval=0.01, timeout=10))
+    handle = backend.submit("face.jpg", video, {"duration": 1})
+    with pytest.raises(requests.HTTPError):
+        backend.wait(handle)
+
+    # 一直查询失败时等到超时为止
+    backend = FlakyBackend([requests.ConnectionError("down")] * 1000)
+    monkeypatch.setattr(backend, "RETRY_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(backend, "MAX_RETRY_BACKOFF_SECONDS", 0.02)
+    monkeypatch.setattr(backend, "polling_policy", lambda video_info: PollingPolicy.fixed(interval=0.01, timeout=0.2))
+    handle = backend.submit("face.jpg", video, {"duration": 1})
+    with pytest.raises(TimeoutError):
+        backend.wait(handle)
+    assert backend.polls > 3
+
+
+def test_akool_backend_does_not_read_key_pool_when_registered(monkeypatch):
+    from utils import akool_keys
+
+    def get_key_pool():
+        raise AssertionError("key pool read at registration")
+
+    monkeypatch.setattr(akool_keys, "get_key_pool", get_key_pool)
+    backend = backends.AkoolBackend("akool")
+    assert backend.name == "akool"
@@ -0,0 +1,192 @@
+"""
+批量任务测试
+使用临时任务库和本地模拟后端，不需要网络
+"""
+
+import os
+import sys
+import threading
+import time
+import zipfile
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import backends, job_queue
+from utils.backends import FakeBackend
+from utils.batch import batch_summary, batch_zip_path, export_batch_zip, export_errors, load_batch_archive, parse_manifest
+from utils.job_queue import JobManager
+from utils.job_store import JobStore
+from utils.result_cache import ResultCache
+
+VIDEO = os.path.join(PROJECT_ROOT, "tests", "input", "target.mp4")
+
+
+class TrackingFake(FakeBackend):
+    """记录同时处理的任务数"""
+
+    def __init__(self):
+        super().__init__("fake", seconds_per_second=0, enabled=True)
+        self.current = 0
+        self.peak = 0
+        self._count_lock = threading.Lock()
+
+    def swap(self, *args, **kwargs):
+        with self._count_lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        try:
+            time.sleep(0.1)
+            return super().swap(*args, **kwargs)
+        finally:
+            with self._count_lock:
+                self.current -= 1
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, "RESULT_DIR", str(tmp_path / "results"))
+    monkeypatch.setitem(backends._backends, "fake", TrackingFake())
+    monkeypatch.setattr(job_queue, "BATCH_MAX_CONCURRENT_JOBS", 2)
+    cache = ResultCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(job_queue, "get_result_cache", lambda: cache)
+    manager = JobManager(max_workers=8, store=JobStore(str(tmp_path / "jobs.db")))
+    yield manager
+    manager.shutdown()
+
+
+def make_faces(directory, count):
+    faces = []
+    for i in range(count):
+        path = directory / f"rep{i}.jpg"
+        path.write_bytes(f"face {i}".encode())
+        faces.append(str(path))
+    return faces
+
+
+def wait_batch(manager, batch_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        jobs = manager.get_batch(batch_id)
+        if batch_summary(jobs)["finished"]:
+            return jobs
+        time.sleep(0.05)
+    raise AssertionError("batch did not finish")
+
+
+def test_batch_runs_with_bounded_concurrency_and_exports_zip(manager, tmp_path):
+    faces = make_faces(tmp_path, 5)
+    items = [{"face_path": face, "video_path": VIDEO, "label": f"销售 {i}"} for i, face in enumerate(faces)]
+
+    batch_id = manager.submit_batch(items, model="fake", owner="alice")
+    jobs = wait_batch(manager, batch_id)
+
+    assert [job["label"] for job in jobs] == [item["label"] for item in items]
+    assert batch_summary(jobs) == {
+        "total": 5, "succeeded": 5, "failed": 0, "pending": 0, "progress": 100, "finished": True
+    }
+    assert backends._backends["fake"].peak == 2
+    assert manager.list_batches(owner="alice")[0] == {
+        "batch_id": batch_id, "jobs": 5, "finished": 5, "created_at": jobs[0]["created_at"]
+    }
+
+    zip_path = export_batch_zip(jobs, str(tmp_path / "batch.zip"))
+    with zipfile.ZipFile(zip_path) as archive:
+        names = archive.namelist()
+        report = archive.read("report.csv").decode("utf-8-sig")
+    assert sorted(names) == sorted([f"销售_{i}.mp4" for i in range(5)] + ["report.csv"])
+    assert report.count("succeeded") == 5
+
+
+def test_batch_is_rejected_as_a_whole(manager, tmp_path):
+    faces = make_faces(tmp_path, 2)
+    items = [{"face_path": face, "video_path": VIDEO} for face in faces]
+    with pytest.raises(ValueError):
+        manager.submit_batch(items * 100, model="fake")
+    with pytest.raises(ValueError):
+        manager.submit_batch(items, model="unknown")
+    assert manager.list_batches() == []
+
+
+def test_manifest_and_archive(tmp_path):
+    faces = make_faces(tmp_path, 2)
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("face,label\nrep0.jpg,Alice\n\nrep1.jpg,\n", encoding="utf-8")
+    items = parse_manifest(str(manifest), video_path=VIDEO)
+    assert items == [
+        {"face_path": faces[0], "video_path": VIDEO, "label": "Alice"},
+        {"face_path": faces[1], "video_path": VIDEO, "label": "rep1"},
+    ]
+
+    manifest.write_text("face,video\nmissing.jpg,\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="第 2 行"):
+        parse_manifest(str(manifest))
+
+    archive_path = tmp_path / "faces.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.write(faces[0], "faces/alice.jpg")
+        archive.write(faces[1], "faces/bob.png")
+        archive.write(VIDEO, "promo.mp4")
+    items = load_batch_archive(str(archive_path), output_dir=str(tmp_path / "out"))
+    assert [item["label"] for item in items] == ["alice", "bob"]
+    assert items[0]["video_path"] == str(tmp_path / "out" / "promo.mp4")
+
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("../evil.jpg", b"x")
+    with pytest.raises(ValueError):
+        load_batch_archive(str(archive_path), video_path=VIDEO, output_dir=str(tmp_path / "evil"))
+
+
+def test_zip_cache_follows_succeeded_jobs_and_reports_missing_results(tmp_path, monkeypatch):
+    result = tmp_path / "result.mp4"
+    result.write_bytes(b"video")
+    jobs = [
+        {"job_id": "a", "label": "Alice", "status": "succeeded", "result_path": str(result), "result_url": None},
+        {"job_id": "b", "label": "Bob", "status": "failed", "result_path": None, "result_url": None},
+    ]
+    first = batch_zip_path("batch", jobs, str(tmp_path))
+    assert batch_zip_path("batch", list(reversed(jobs)), str(tmp_path)) == first
+
+    # 失败的任务重试成功后换一个路径，重新打包
+    jobs[1].update(status="succeeded", result_url="https://expired/b.mp4")
+    assert batch_zip_path("batch", jobs, str(tmp_path)) != first
+
+    def mirror_result(url):
+        raise ConnectionError("404 Not Found")
+
+    monkeypatch.setattr("utils.downloader.mirror_result", mirror_result)
+    zip_path = export_batch_zip(jobs, str(tmp_path / "batch.zip"))
+    assert export_errors(zip_path) == 1
+    jobs[1]["result_path"] = str(result)
+    assert export_errors(export_batch_zip(jobs, zip_path)) == 0
+
+
+def test_prefetch_uses_own_pool_and_leased_key(manager, monkeypatch, tmp_path):
+    from utils import akool_client, akool_keys
+    from utils.akool_keys import KeyPool
+
+    class FakeClient:
+        def __init__(self, api_key):
+            self.api_key = api_key
+
+        def get_credit_info(self):
+            return {"code": 1000, "data": {"credit": 1000}}
+
+    calls = []
+
+    def prefetch_face_landmarks(face_image_path, api_key):
+        calls.append((threading.current_thread().name, api_key, pool.status()[0]["in_flight"]))
+
+    pool = KeyPool(["key-pooled"], refresh_seconds=3600)
+    monkeypatch.setattr(akool_keys, "get_akool_client", FakeClient)
+    monkeypatch.setattr(akool_keys, "_pool", pool)
+    monkeypatch.setattr(akool_client, "prefetch_face_landmarks", prefetch_face_landmarks)
+
+    manager.prefetch_landmarks(make_faces(tmp_path, 1)[0])
+    manager.shutdown()
+
+    [(thread_name, api_key, in_flight)] = calls
+    assert thread_name.startswith("landmark-prefetch")
+    assert (api_key, in_flight) == ("key-pooled", 1)
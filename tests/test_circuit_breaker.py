@@ -0,0 +1,155 @@
+"""
+熔断和备用模型切换测试
+用假的 Akool 换脸函数和本地模拟后端代替真实 API，不需要网络
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import backends as backends_module
+from utils import circuit_breaker, face_swap, router
+from utils.backends import FakeBackend
+from utils.circuit_breaker import CircuitBreaker
+
+
+def test_breaker_opens_and_recovers_after_probe(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "time", lambda: now[0])
+    breaker = CircuitBreaker("akool", window=4, min_calls=4, failure_rate=0.5, open_seconds=60)
+
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success)
+    assert breaker.state == CircuitBreaker.STATE_OPEN
+    assert not breaker.allow()
+
+    # 熔断时间过后只放行一个探测任务
+    now[0] += 61
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.STATE_CLOSED
+    assert breaker.allow()
+
+
+@pytest.fixture
+def backends(monkeypatch, tmp_path):
+    calls = []
+    breakers = {}
+    monkeypatch.setattr(circuit_breaker, "get_breaker",
+                        lambda name: breakers.setdefault(name, CircuitBreaker(name, window=2, min_calls=2)))
+    monkeypatch.setattr(face_swap, "get_available_models", lambda: ["akool", "fake"])
+    monkeypatch.setattr(face_swap, "FAILOVER_MODELS", ["fake"])
+    monkeypatch.setattr(backends_module, "RESULT_DIR", str(tmp_path / "results"))
+
+    class CountingFake(FakeBackend):
+        def submit(self, *args):
+            calls.append("fake")
+            return super().submit(*args)
+
+    monkeypatch.setitem(backends_module._backends, "fake", CountingFake(seconds_per_second=0, enabled=True))
+
+    def akool(*args):
+        calls.append("akool")
+        raise TimeoutError("Video processing timed out")
+
+    monkeypatch.setattr(face_swap, "swap_face_akool", akool)
+
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"video")
+    return calls, breakers, str(video)
+
+
+def test_fails_over_and_skips_open_backend(backends):
+    calls, breakers, video = backends
+    stages = []
+
+    def stage_callback(stage, data):
+        if stage == "failover":
+            stages.append(data["model"])
+
+    for _ in range(3):
+        result = face_swap.swap_face("face.jpg", video, model="akool", stage_callback=stage_callback)
+        assert open(result, "rb").read() == b"video"
+
+    # 两次失败后 Akool 熔断，第三个任务直接交给备用模型
+    assert calls == ["akool", "fake", "akool", "fake", "fake"]
+    assert breakers["akool"].state == CircuitBreaker.STATE_OPEN
+    assert stages == ["fake"] * 3
+
+
+def test_input_errors_do_not_fail_over(backends, monkeypatch):
+    calls, breakers, video = backends
+
+    def bad_input(*args):
+        raise ValueError("No face detected")
+
+    monkeypatch.setattr(face_swap, "swap_face_akool", bad_input)
+
+    with pytest.raises(ValueError):
+        face_swap.swap_face("face.jpg", video, model="akool")
+    assert calls == []
+    assert breakers["akool"].snapshot()["calls"] == 0
+
+
+def test_no_failover_after_remote_submit(backends, monkeypatch):
+    calls, breakers, video = backends
+
+    def submitted_then_timeout(face_image_path, video_path, progress_callback, stage_callback, video_info):
+        calls.append("akool")
+        stage_callback("submitted", {"akool_id": "akool-1"})
+        raise TimeoutError("Video processing timed out")
+
+    monkeypatch.setattr(face_swap, "swap_face_akool", submitted_then_timeout)
+    stages = []
+
+    # Akool 已接受（已计费）的任务失败时不切换到备用模型重新付费
+    with pytest.raises(TimeoutError):
+        face_swap.swap_face("face.jpg", video, model="akool", stage_callback=lambda stage, data: stages.append(stage))
+    assert calls == ["akool"]
+    assert stages == ["submitted"]
+    assert breakers["akool"].snapshot()["calls"] == 1
+
+
+def test_failover_skips_models_over_cost_ceiling(backends, monkeypatch):
+    calls, breakers, video = backends
+    monkeypatch.setattr(router, "USER_COST_CEILINGS", {"alice": 1.0})
+    monkeypatch.setattr(backends_module._backends["fake"], "estimate_cost", lambda duration: 5.0)
+
+    # 备用模型超出用户的成本上限：不切换，抛出原模型的错误
+    with pytest.raises(TimeoutError):
+        face_swap.swap_face("face.jpg", video, model="akool", video_info={"duration": 10}, owner="alice")
+    assert calls == ["akool"]
+
+    # 其他用户的上限更高（MAX_JOB_COST_USD 为 0 表示不限制）时照常切换
+    monkeypatch.setattr(router, "MAX_JOB_COST_USD", 0)
+    face_swap.swap_face("face.jpg", video, model="akool", video_info={"duration": 10}, owner="bob")
+    assert calls == ["akool", "akool", "fake"]
+
+
+@pytest.mark.parametrize("queued, processing, slow", [(0.3, 0, False), (0, 0.3, True)])
+def test_slow_calls_are_timed_from_submission(backends, monkeypatch, queued, processing, slow):
+    calls, breakers, video = backends
+    monkeypatch.setattr(face_swap, "CIRCUIT_SLOW_FACTOR", 1)
+    monkeypatch.setattr(face_swap, "estimate_processing_time", lambda video_info, model: 0.2)
+
+    def akool(face_image_path, video_path, progress_callback, stage_callback, video_info):
+        # 本地排队等待并发名额不算慢，提交后处理超时才算
+        time.sleep(queued)
+        stage_callback("submitted", {"akool_id": "akool-1"})
+        time.sleep(processing)
+        return "https://example.com/result.mp4"
+
+    monkeypatch.setattr(face_swap, "swap_face_akool", akool)
+    recorded = []
+    breaker = circuit_breaker.get_breaker("akool")
+    monkeypatch.setattr(breaker, "record", lambda success, slow=False: recorded.append((success, slow)))
+
+    face_swap.swap_face("face.jpg", video, model="akool", video_info={"duration": 10})
+    assert recorded == [(True, slow)]
@@ -0,0 +1,113 @@
+"""
+命令行批量换脸测试
+使用临时任务库和本地模拟后端，不需要网络
+"""
+
+import csv
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import changeface
+from utils import backends, job_queue
+from utils.backends import FakeBackend
+from utils.job_store import JobStore
+from utils.result_cache import ResultCache
+
+VIDEO = os.path.join(PROJECT_ROOT, "tests", "input", "target.mp4")
+
+
+class CountingFake(FakeBackend):
+    """记录提交次数"""
+
+    def __init__(self):
+        super().__init__("fake", seconds_per_second=0, enabled=True)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, "RESULT_DIR", str(tmp_path / "results"))
+    monkeypatch.setitem(backends._backends, "fake", CountingFake())
+    monkeypatch.setattr(changeface, "JOB_POLL_SECONDS", 0.05)
+    store = JobStore(str(tmp_path / "jobs.db"))
+    cache = ResultCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(job_queue, "get_job_store", lambda: store)
+    monkeypatch.setattr(job_queue, "get_result_cache", lambda: cache)
+
+    for i in range(3):
+        (tmp_path / f"rep{i}.jpg").write_bytes(f"face {i}".encode())
+    manifest = tmp_path / "reps.csv"
+    manifest.write_text("face,label\nrep0.jpg,张三\nrep1.jpg,李四\nrep2.jpg,王五\n", encoding="utf-8")
+    return tmp_path, str(manifest)
+
+
+def read_report(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def test_run_writes_report_and_resumes(workspace):
+    tmp_path, manifest = workspace
+    args = ["run", manifest, "--video", VIDEO, "--model", "fake", "--workers", "2"]
+    fake = backends._backends["fake"]
+
+    assert changeface.main(args) == 0
+    rows = read_report(tmp_path / "reps_report.csv")
+    assert [(row["label"], row["status"]) for row in rows] == [("张三", "succeeded"), ("李四", "succeeded"), ("王五", "succeeded")]
+    # 任务标记为本报告创建，网页重启时不会恢复
+    runner = f"cli:{tmp_path / 'reps_report.csv'}"
+    assert {job["runner"] for job in job_queue.get_job_store().list_jobs()} == {runner}
+    assert sorted(os.listdir(tmp_path / "reps_results")) == ["张三.mp4", "李四.mp4", "王五.mp4"]
+    assert fake.submitted == 3
+
+    # 再次运行：全部跳过
+    assert changeface.main(args) == 0
+    assert fake.submitted == 3
+
+    # 一个任务失败、一个结果文件丢失：失败的任务重新提交（相同输入复用结果缓存，不再调用后端），
+    # 丢失的结果从任务库重新保存
+    rows[0].update(status="failed", job_id="", result_path="")
+    os.remove(rows[1]["result_path"])
+    with open(tmp_path / "reps_report.csv", "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    assert changeface.main(args) == 0
+    assert fake.submitted == 3
+    assert len(job_queue.get_job_store().list_jobs()) == 4
+    rows = read_report(tmp_path / "reps_report.csv")
+    assert all(row["status"] == "succeeded" and os.path.isfile(row["result_path"]) for row in rows)
+
+
+def test_missing_job_record_fails_the_row(workspace, monkeypatch):
+    tmp_path, manifest = workspace
+    # 提交后任务记录不见了（例如被删除或换了任务库）
+    monkeypatch.setattr(changeface.JobManager, "submit", lambda self, *args, **kwargs: "missing")
+
+    assert changeface.main(["run", manifest, "--video", VIDEO, "--model", "fake"]) == 1
+    rows = read_report(tmp_path / "reps_report.csv")
+    assert {(row["status"], row["error"]) for row in rows} == {("failed", "任务库中找不到该任务")}
+
+
+def test_invalid_manifest(workspace, capsys):
+    tmp_path, manifest = workspace
+    assert changeface.main(["run", manifest]) == 2
+    assert "第 2 行找不到视频" in capsys.readouterr().err
+
+
+def test_cli_does_not_import_streamlit():
+    import subprocess
+
+    code = "import sys, changeface; print('streamlit' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip().endswith("False")
@@ -0,0 +1,104 @@
+"""
+结果下载测试
+用本地支持 Range 的文件服务器代替供应商 CDN，不需要网络
+"""
+
+import hashlib
+import http.server
+import os
+import re
+import sys
+import threading
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import downloader
+from utils.downloader import DownloadError, download_file, verify_file
+
+CONTENT = os.urandom(3 * 1024 * 1024 + 123)
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """返回 CONTENT，支持单段 Range；fail_after 个分块请求后断开连接"""
+
+    range_requests = 0
+    fail_after = None
+    md5 = hashlib.md5(CONTENT).hexdigest()
+
+    def do_GET(self):
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if not match:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(CONTENT)))
+            self.end_headers()
+            self.wfile.write(CONTENT)
+            return
+
+        start, end = int(match.group(1)), int(match.group(2))
+        if end > start:
+            type(self).range_requests += 1
+            if self.fail_after is not None and self.range_requests > self.fail_after:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(CONTENT)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", f'"{self.md5}"')
+        self.send_header("x-amz-request-id", "test")
+        self.end_headers()
+        self.wfile.write(CONTENT[start:end + 1])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    RangeHandler.range_requests = 0
+    RangeHandler.fail_after = None
+    RangeHandler.md5 = hashlib.md5(CONTENT).hexdigest()
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/result.mp4"
+    httpd.shutdown()
+
+
+def test_parallel_download_verifies_checksum(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "PARALLEL_MIN_SIZE", 1024 * 1024)
+    output = str(tmp_path / "result.mp4")
+
+    download_file(server, output, workers=4, chunk_size=512 * 1024)
+
+    assert open(output, "rb").read() == CONTENT
+    assert RangeHandler.range_requests == 7
+    assert verify_file(output)
+
+
+def test_interrupted_download_resumes_from_completed_chunks(server, tmp_path):
+    output = str(tmp_path / "result.mp4")
+
+    RangeHandler.fail_after = 3
+    with pytest.raises(Exception):
+        download_file(server, output, workers=1, chunk_size=512 * 1024)
+    assert os.path.exists(output + ".part.json")
+
+    RangeHandler.fail_after = None
+    RangeHandler.range_requests = 0
+    download_file(server, output, workers=1, chunk_size=512 * 1024)
+
+    assert open(output, "rb").read() == CONTENT
+    # 只补下剩余的 4 块
+    assert RangeHandler.range_requests == 4
+    assert not os.path.exists(output + ".part.json")
+
+
+def test_checksum_mismatch_is_rejected(server, tmp_path):
+    RangeHandler.md5 = "0" * 32
+
+    with pytest.raises(DownloadError):
+        download_file(server, str(tmp_path / "result.mp4"), workers=1, chunk_size=1024 * 1024)
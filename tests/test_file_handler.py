@@ -0,0 +1,28 @@
+"""
+文件处理工具测试
+不需要网络
+"""
+
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils.file_handler import deferred_file_reader
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="需要 /proc 统计打开的文件")
+def test_deferred_reader_reads_on_call_and_closes_file(tmp_path):
+    path = tmp_path / "result.mp4"
+    path.write_bytes(b"old")
+    reader = deferred_file_reader(str(path))
+
+    # 创建回调时不读取文件，点击下载时读取最新内容
+    path.write_bytes(b"result" * 1000)
+    open_files = len(os.listdir("/proc/self/fd"))
+    for _ in range(5):
+        assert reader() == b"result" * 1000
+    assert len(os.listdir("/proc/self/fd")) == open_files
@@ -0,0 +1,96 @@
+"""
+多图床并行上传测试
+用假的上传函数代替真实图床，不需要网络
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import hedged_upload as hedged
+from utils.hedged_upload import hedged_upload
+from utils.multipart import UploadCancelled
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    monkeypatch.setattr(hedged, "_health", {})
+
+
+def hanging(started: list, cancelled: list):
+    """没有任何进度，直到被取消"""
+    def upload(file_path, progress, cancel_event):
+        started.append("hanging")
+        cancel_event.wait(5)
+        cancelled.append("hanging")
+        raise UploadCancelled()
+    return upload
+
+
+def quick(started: list, url: str = "https://backup/file"):
+    def upload(file_path, progress, cancel_event):
+        started.append("quick")
+        progress(10, 10)
+        return url
+    return upload
+
+
+def test_stalled_upload_is_hedged(monkeypatch):
+    started, cancelled = [], []
+    services = [("primary", hanging(started, cancelled), 3600), ("backup", quick(started), 60)]
+
+    assert hedged_upload("file.mp4", services, hedge_after=0.1) == ("backup", "https://backup/file", 60)
+    assert started == ["hanging", "quick"]
+    time.sleep(0.1)
+    assert cancelled == ["hanging"]
+    # 被取消的上传不计为失败
+    assert hedged.health_snapshot()["primary"]["failures"] == 0
+
+
+def test_upload_waiting_for_response_is_not_hedged():
+    started = []
+
+    def slow_response(file_path, progress, cancel_event):
+        started.append("primary")
+        progress(10, 10)
+        # 文件已全部发送，图床处理后才返回 URL
+        time.sleep(0.5)
+        return "https://primary/file"
+
+    services = [("primary", slow_response, 3600), ("backup", quick(started), 60)]
+    assert hedged_upload("file.mp4", services, hedge_after=0.1, response_timeout=2)[0] == "primary"
+    assert started == ["primary"]
+
+
+def test_upload_without_response_is_hedged_after_response_timeout():
+    started, cancelled = [], []
+
+    def no_response(file_path, progress, cancel_event):
+        started.append("primary")
+        progress(10, 10)
+        cancel_event.wait(5)
+        cancelled.append("primary")
+        raise UploadCancelled()
+
+    services = [("primary", no_response, 3600), ("backup", quick(started), 60)]
+    assert hedged_upload("file.mp4", services, hedge_after=0.1, response_timeout=0.3)[0] == "backup"
+    assert started == ["primary", "quick"]
+    time.sleep(0.1)
+    assert cancelled == ["primary"]
+
+
+def test_failures_fall_back_and_rank_services_lower():
+    def broken(file_path, progress, cancel_event):
+        raise ConnectionError("502 Bad Gateway")
+
+    services = [("primary", broken, 3600), ("backup", quick([]), 60)]
+    assert hedged_upload("file.mp4", services, hedge_after=0)[0] == "backup"
+    assert [name for name, _, _ in hedged.rank_services(services)] == ["backup", "primary"]
+
+    with pytest.raises(Exception, match="primary: 502 Bad Gateway"):
+        hedged_upload("file.mp4", [("primary", broken, 3600)], hedge_after=0)
@@ -0,0 +1,90 @@
+"""
+共享 HTTP 连接池测试
+用本地 HTTP/1.1 服务器统计 TCP 连接数，不需要网络
+"""
+
+import http.server
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import http_session
+from utils.http_session import close_sessions, create_session, get_session
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    """记录每个请求来自哪个客户端端口（即哪条 TCP 连接）"""
+
+    protocol_version = "HTTP/1.1"
+    client_ports = []
+
+    def do_GET(self):
+        type(self).client_ports.append(self.client_address[1])
+        body = self.headers.get("X-Test", "").encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    KeepAliveHandler.client_ports = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def fresh_sessions(monkeypatch):
+    monkeypatch.setattr(http_session, "_sessions", {})
+    yield
+    close_sessions()
+
+
+def test_sessions_are_shared_by_name():
+    assert get_session() is get_session("default")
+    assert get_session("downloads") is get_session("downloads")
+    assert get_session("downloads") is not get_session("uploads")
+
+    session = get_session("uploads")
+    close_sessions()
+    assert get_session("uploads") is not session
+
+
+def test_connections_are_reused(server):
+    session = get_session()
+    for _ in range(5):
+        assert session.get(server, timeout=5).status_code == 200
+    assert len(KeepAliveHandler.client_ports) == 5
+    assert len(set(KeepAliveHandler.client_ports)) == 1
+
+
+def test_concurrent_requests_stay_within_pool(server):
+    session = create_session(pool_maxsize=4)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for _ in range(5):
+            # 每轮 4 个并发请求，之后的轮次复用第一轮建立的连接
+            list(pool.map(lambda i: session.get(server, timeout=5), range(4)))
+    session.close()
+
+    assert len(KeepAliveHandler.client_ports) == 20
+    assert len(set(KeepAliveHandler.client_ports)) <= 4
+
+
+def test_per_request_headers_do_not_leak(server):
+    session = create_session(headers={"X-Client": "akool"})
+    assert session.get(server, headers={"X-Test": "one"}, timeout=5).text == "one"
+    assert session.get(server, timeout=5).text == ""
+    assert session.headers["X-Client"] == "akool" and "X-Test" not in session.headers
+    session.close()
@@ -0,0 +1,208 @@
+"""
+后台任务队列测试
+使用临时任务库和本地模拟后端，不需要网络
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import backends, face_swap, job_queue
+from utils.backends import FakeBackend
+from utils.job_queue import Job, JobManager
+from utils.job_store import JobStore
+from utils.multipart import upload_progress_reporter
+from utils.result_cache import ResultCache
+
+VIDEO = os.path.join(PROJECT_ROOT, "tests", "input", "target.mp4")
+
+
+class GatedFake(FakeBackend):
+    """提交前等待放行，记录提交次数；fail=True 时提交失败"""
+
+    def __init__(self):
+        super().__init__("fake", seconds_per_second=0, enabled=True)
+        self.gate = threading.Event()
+        self.submitted = 0
+        self.fail = False
+
+    def submit(self, *args, **kwargs):
+        self.gate.wait(5)
+        self.submitted += 1
+        if self.fail:
+            raise RuntimeError("backend exploded")
+        return super().submit(*args, **kwargs)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, "RESULT_DIR", str(tmp_path / "results"))
+    monkeypatch.setitem(backends._backends, "fake", GatedFake())
+    monkeypatch.setattr(job_queue, "ROUTING_ENABLED", False)
+    monkeypatch.setattr(face_swap, "FAILOVER_MODELS", [])
+    cache = ResultCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(job_queue, "get_result_cache", lambda: cache)
+    manager = JobManager(max_workers=4, store=JobStore(str(tmp_path / "jobs.db")))
+    yield manager
+    backends._backends["fake"].gate.set()
+    manager.shutdown()
+
+
+def make_face(directory, name="face.jpg"):
+    path = directory / name
+    path.write_bytes(name.encode())
+    return str(path)
+
+
+def wait_finished(manager, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if Job.is_finished(job):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_submit_runs_job_in_background(manager, tmp_path):
+    fake = backends._backends["fake"]
+    job_id = manager.submit(make_face(tmp_path), VIDEO, model="fake", owner="alice")
+
+    # submit 立即返回，任务在工作线程中等待后端
+    job = manager.get(job_id)
+    assert job["owner"] == "alice" and job["model"] == "fake"
+    assert not Job.is_finished(job)
+
+    fake.gate.set()
+    job = wait_finished(manager, job_id)
+    assert job["status"] == Job.STATUS_SUCCEEDED
+    assert job["progress"] == 100 and os.path.isfile(job["result_url"])
+    assert job["result_key"] and job["started_at"] and job["finished_at"]
+    assert manager.list_jobs(owner="alice")[0]["job_id"] == job_id
+    assert manager.active_count() == 0
+
+
+def test_identical_jobs_share_one_submission(manager, tmp_path):
+    fake = backends._backends["fake"]
+    face = make_face(tmp_path)
+    job_ids = [manager.submit(face, VIDEO, model="fake") for _ in range(3)]
+
+    # 第一个任务登记缓存键后，相同任务只等待它的结果
+    deadline = time.time() + 5
+    while sum(1 for job_id in job_ids if "正在处理" in (manager.get(job_id)["message"] or "")) < 2:
+        assert time.time() < deadline
+        time.sleep(0.02)
+    fake.gate.set()
+
+    jobs = [wait_finished(manager, job_id) for job_id in job_ids]
+    assert fake.submitted == 1
+    assert {job["status"] for job in jobs} == {Job.STATUS_SUCCEEDED}
+    assert len({job["result_url"] for job in jobs}) == 1
+    assert manager._inflight == {} and manager._followers == {}
+
+    # 结束后再次提交直接复用结果缓存
+    job = wait_finished(manager, manager.submit(face, VIDEO, model="fake"))
+    assert "已存在" in job["message"] and fake.submitted == 1
+
+
+def test_failure_is_recorded_and_passed_to_waiting_jobs(manager, tmp_path):
+    fake = backends._backends["fake"]
+    fake.fail = True
+    face = make_face(tmp_path)
+    leader = manager.submit(face, VIDEO, model="fake")
+    deadline = time.time() + 5
+    while not manager._inflight:
+        assert time.time() < deadline
+        time.sleep(0.02)
+    follower = manager.submit(face, VIDEO, model="fake")
+    while not manager._followers:
+        assert time.time() < deadline
+        time.sleep(0.02)
+    fake.gate.set()
+
+    for job_id in (leader, follower):
+        job = wait_finished(manager, job_id)
+        assert job["status"] == Job.STATUS_FAILED
+        assert job["error"] == "backend exploded"
+    assert fake.submitted == 1
+
+    # 失败的结果不写入缓存，重新提交会再次调用后端
+    fake.fail = False
+    assert wait_finished(manager, manager.submit(face, VIDEO, model="fake"))["status"] == Job.STATUS_SUCCEEDED
+    assert fake.submitted == 2
+
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.02)
+
+
+def test_save_errors_after_remote_success_are_retried(manager, tmp_path, monkeypatch):
+    fake = backends._backends["fake"]
+    fake.gate.set()
+    monkeypatch.setattr(manager, "FINISH_RETRY_SECONDS", 0)
+    update = manager.store.update
+    errors = []
+
+    def flaky_update(job_id, **fields):
+        if fields.get("status") == Job.STATUS_SUCCEEDED and not errors:
+            errors.append(job_id)
+            raise sqlite3.OperationalError("database is locked")
+        return update(job_id, **fields)
+
+    monkeypatch.setattr(manager.store, "update", flaky_update)
+    job = wait_finished(manager, manager.submit(make_face(tmp_path), VIDEO, model="fake"))
+
+    # 保存一次失败后重试成功，不会被标记为失败或重新提交
+    assert job["status"] == Job.STATUS_SUCCEEDED and os.path.isfile(job["result_url"])
+    assert errors == [job["job_id"]] and fake.submitted == 1
+
+
+def test_remote_result_is_kept_when_saving_keeps_failing(manager, tmp_path, monkeypatch):
+    fake = backends._backends["fake"]
+    fake.gate.set()
+    monkeypatch.setattr(manager, "FINISH_RETRY_SECONDS", 0)
+    attempts = []
+
+    def broken_succeed(job_id, result_url, **kwargs):
+        attempts.append(job_id)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(manager, "_succeed", broken_succeed)
+    job_id = manager.submit(make_face(tmp_path), VIDEO, model="fake")
+    wait_for(lambda: manager.get(job_id)["error"])
+
+    # 任务保持已提交状态（服务重启后继续查询结果），不会被标记为失败
+    job = manager.get(job_id)
+    assert job["status"] == Job.STATUS_SUBMITTED and job["remote_id"]
+    assert job["error"] == "disk full" and "保存结果时出错" in job["message"]
+    assert attempts == [job_id] * manager.FINISH_ATTEMPTS
+
+
+def test_upload_progress_is_scaled_into_its_band(manager, tmp_path):
+    job_id = manager._create(make_face(tmp_path), VIDEO, "fake", None)
+    progress_callback = manager._progress_callback(job_id)
+    report = upload_progress_reporter(progress_callback, "Uploading video", min_interval=0)
+    low, high = JobManager.UPLOAD_PROGRESS
+
+    report(0, 4 * 1048576)
+    assert manager.get(job_id)["progress"] == low
+    report(1048576, 4 * 1048576)
+    job = manager.get(job_id)
+    assert job["progress"] == low + (high - low) // 4 and job["message"].startswith("Uploading video... 25%")
+
+    # 其他消息只更新文字；提交到换脸 API 后进入处理阶段
+    progress_callback(1, "Detecting face landmarks...")
+    assert manager.get(job_id)["progress"] == low + (high - low) // 4
+    manager._stage_callback(job_id)("submitted", {"remote_id": "r-1"})
+    assert manager.get(job_id)["progress"] == high
@@ -0,0 +1,143 @@
+"""
+任务持久化和重启恢复测试
+使用临时数据库和本地模拟后端，不需要网络
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import backends, face_swap, job_queue
+from utils.backends import FakeBackend
+from utils.job_queue import Job, JobManager
+from utils.job_store import JobStore
+from utils.result_cache import ResultCache
+
+VIDEO = os.path.join(PROJECT_ROOT, "tests", "input", "target.mp4")
+
+
+class ResumableFake(FakeBackend):
+    """支持恢复的模拟后端，记录提交次数"""
+
+    CAPABILITIES = dict(FakeBackend.CAPABILITIES, resumable=True)
+
+    def __init__(self):
+        super().__init__("fake", seconds_per_second=0, enabled=True)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    backend = ResumableFake()
+    monkeypatch.setattr(backends, "RESULT_DIR", str(tmp_path / "results"))
+    monkeypatch.setitem(backends._backends, "fake", backend)
+    monkeypatch.setattr(face_swap, "FAILOVER_MODELS", [])
+    cache = ResultCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(job_queue, "get_result_cache", lambda: cache)
+    return backend
+
+
+def wait_finished(manager, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if Job.is_finished(job):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_old_database_gets_missing_columns(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE jobs (job_id TEXT PRIMARY KEY, status TEXT, akool_id TEXT)")
+    conn.execute("INSERT INTO jobs VALUES ('old', 'submitted', 'akool-1')")
+    conn.commit()
+    conn.close()
+
+    store = JobStore(db_path)
+    columns = {row["name"] for row in store._conn.execute("PRAGMA table_info(jobs)")}
+    assert columns == set(JobStore.COLUMNS)
+
+    # 旧记录保留，新列为默认值
+    job = store.get("old")
+    assert job["status"] == "submitted" and job["akool_id"] == "akool-1"
+    assert job["progress"] == 0 and job["akool_segments"] is None
+    store.update("old", remote_id="r-1")
+    assert JobStore(db_path).get("old")["remote_id"] == "r-1"
+
+
+def test_recover_resumes_submitted_jobs_without_resubmitting(tmp_path, fake):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    face = tmp_path / "face.jpg"
+    face.write_bytes(b"face")
+    # 上次进程提交后退出：后端任务仍在，任务库记录了任务 ID
+    handle = fake.submit(str(face), VIDEO)
+    store.insert({
+        "job_id": "submitted", "model": "fake", "status": Job.STATUS_SUBMITTED,
+        "face_path": str(face), "video_path": VIDEO, "remote_id": handle,
+        "created_at": time.time(), "submitted_at": time.time(),
+    })
+    store.insert({
+        "job_id": "queued", "model": "fake", "status": Job.STATUS_QUEUED,
+        "face_path": str(face), "video_path": VIDEO, "created_at": time.time(),
+    })
+    store.insert({
+        "job_id": "cleaned", "model": "fake", "status": Job.STATUS_RUNNING,
+        "face_path": str(tmp_path / "gone.jpg"), "video_path": VIDEO, "created_at": time.time(),
+    })
+
+    manager = JobManager(max_workers=2, store=store)
+    try:
+        assert manager.recover() == 2
+        resumed = wait_finished(manager, "submitted")
+        assert resumed["status"] == Job.STATUS_SUCCEEDED and os.path.isfile(resumed["result_url"])
+        assert wait_finished(manager, "queued")["status"] == Job.STATUS_SUCCEEDED
+        # 已提交的任务只继续轮询；尚未提交的任务重新提交一次
+        assert fake.submitted == 2
+
+        cleaned = manager.get("cleaned")
+        assert cleaned["status"] == Job.STATUS_FAILED and "输入文件已被清理" in cleaned["error"]
+        # 已结束的任务不再恢复
+        assert manager.recover() == 0
+    finally:
+        manager.shutdown()
+
+
+def test_recover_skips_jobs_created_by_other_runners(tmp_path, fake):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    face = tmp_path / "face.jpg"
+    face.write_bytes(b"face")
+    runner = f"cli:{tmp_path / 'reps_report.csv'}"
+    store.insert({
+        "job_id": "cli-job", "model": "fake", "status": Job.STATUS_QUEUED, "runner": runner,
+        "face_path": str(face), "video_path": VIDEO, "created_at": time.time(),
+    })
+
+    # 网页进程重启时命令行仍在运行：不接管命令行的任务
+    web = JobManager(max_workers=1, store=store)
+    try:
+        assert web.recover() == 0
+        assert store.get("cli-job")["status"] == Job.STATUS_QUEUED
+    finally:
+        web.shutdown()
+
+    cli = JobManager(max_workers=1, store=store, runner=runner)
+    try:
+        assert cli.recover(job_ids=["cli-job"]) == 1
+        assert wait_finished(cli, "cli-job")["status"] == Job.STATUS_SUCCEEDED
+        assert fake.submitted == 1
+        # 新任务记录创建它的进程
+        assert cli.get(cli.submit(str(face), VIDEO, model="fake"))["runner"] == runner
+    finally:
+        cli.shutdown()
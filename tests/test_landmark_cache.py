@@ -0,0 +1,91 @@
+"""
+人脸关键点缓存测试
+使用临时数据库和假的检测接口，不需要网络
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import akool_client, landmark_cache
+from utils.akool_client import AkoolAPIError, detect_face_landmarks, parse_face_landmarks
+from utils.landmark_cache import LandmarkCache
+
+DETECT_RESULT = {
+    "error_code": 0,
+    "faces_obj": {"0": {"landmarks": [[[10.4, 20.6], [30, 40]]], "region": [[1, 2, 3, 4]]}},
+}
+
+
+class FakeClient:
+    """记录检测次数"""
+
+    def __init__(self, error=None):
+        self.detected = []
+        self.error = error
+
+    def detect_faces(self, media_url, media_type="image"):
+        self.detected.append(media_url)
+        if self.error:
+            raise self.error
+        return DETECT_RESULT
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LandmarkCache(str(tmp_path / "cache.db"), max_entries=2)
+    monkeypatch.setattr(landmark_cache, "_cache", cache)
+    return cache
+
+
+def test_get_put_and_lru_eviction(cache):
+    assert cache.get("a") is None
+    cache.put("a", "1,2:3,4", [1, 2, 3, 4])
+    assert cache.get("a") == {"landmarks": "1,2:3,4", "region": [1, 2, 3, 4]}
+
+    cache.put("b", "5,6:7,8")
+    time.sleep(0.01)
+    # 使用 a 后再写入 c，淘汰最久未使用的 b
+    cache.get("a")
+    cache.put("c", "9,9:9,9")
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c") == {"landmarks": "9,9:9,9", "region": None}
+
+
+def test_parse_face_landmarks():
+    assert parse_face_landmarks(DETECT_RESULT) == ("10,20:30,40", [1, 2, 3, 4])
+    with pytest.raises(ValueError, match="No face detected"):
+        parse_face_landmarks({"error_code": 0, "faces_obj": {}})
+
+
+def test_detect_is_skipped_for_the_same_image(cache, tmp_path):
+    face = tmp_path / "face.jpg"
+    face.write_bytes(b"face")
+    copy = tmp_path / "copy.jpg"
+    copy.write_bytes(b"face")
+    client = FakeClient()
+
+    assert detect_face_landmarks(client, str(face), "https://host/face.jpg") == "10,20:30,40"
+    # 相同内容的照片（即使路径不同）不再调用检测接口
+    assert detect_face_landmarks(client, str(copy), "https://host/copy.jpg") == "10,20:30,40"
+    assert client.detected == ["https://host/face.jpg"]
+
+
+def test_detect_failure_is_not_cached_and_drops_upload(cache, tmp_path, monkeypatch):
+    face = tmp_path / "face.jpg"
+    face.write_bytes(b"face")
+    forgotten = []
+    monkeypatch.setattr(akool_client, "forget_uploads", lambda *paths: forgotten.extend(paths))
+
+    with pytest.raises(Exception, match="Face detection failed: URL expired"):
+        detect_face_landmarks(FakeClient(AkoolAPIError(1003, "URL expired")), str(face), "https://host/face.jpg")
+    assert forgotten == [str(face)]
+
+    client = FakeClient()
+    assert detect_face_landmarks(client, str(face), "https://host/face.jpg") == "10,20:30,40"
+    assert len(client.detected) == 1
@@ -0,0 +1,98 @@
+"""
+流式 multipart 编码测试
+不需要网络
+"""
+
+import email
+import email.policy
+import os
+import sys
+import threading
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils.multipart import MultipartFileStream, UploadCancelled, upload_progress_reporter
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(os.urandom(100_000))
+    return str(path)
+
+
+def parse(body: bytes, content_type: str):
+    message = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body, policy=email.policy.HTTP
+    )
+    return {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+
+
+def test_body_is_valid_multipart_with_declared_length(video):
+    with MultipartFileStream(video, fields={"expires": "1d"}, chunk_size=4096) as body:
+        chunks = list(body)
+        assert all(len(chunk) <= 4096 for chunk in chunks)
+        data = b"".join(chunks)
+        assert len(data) == len(body) == body.total == body.bytes_sent
+        assert body.read() == b""
+
+    parts = parse(data, body.content_type)
+    assert parts["expires"].get_content() == "1d"
+    assert parts["file"].get_filename() == "clip.mp4"
+    assert parts["file"].get_content_type() == "video/mp4"
+    with open(video, "rb") as f:
+        assert parts["file"].get_content() == f.read()
+
+
+def test_reads_across_segment_boundaries(video):
+    body = MultipartFileStream(video, chunk_size=1000)
+    # 文件在第一次读到文件内容时才打开
+    data = body.read(7)
+    assert body._file is None
+    # 一次读取可以跨越表头、文件和结尾
+    data += body.read(5000) + body.read(len(body))
+    while True:
+        chunk = body.read(333)
+        if not chunk:
+            break
+        data += chunk
+    body.close()
+
+    assert len(data) == len(body)
+    with open(video, "rb") as f:
+        assert parse(data, body.content_type)["file"].get_content() == f.read()
+
+
+def test_progress_and_cancel(video):
+    reported = []
+    cancel_event = threading.Event()
+    body = MultipartFileStream(video, progress_callback=lambda sent, total: reported.append((sent, total)),
+                               chunk_size=10_000, cancel_event=cancel_event)
+    body.read()
+    body.read()
+    assert reported == [(10_000, body.total), (20_000, body.total)]
+
+    cancel_event.set()
+    with pytest.raises(UploadCancelled):
+        body.read()
+    body.close()
+
+    other = MultipartFileStream(video)
+    other.cancel()
+    with pytest.raises(UploadCancelled):
+        other.read()
+
+
+def test_progress_reporter_is_throttled():
+    messages = []
+    report = upload_progress_reporter(lambda status, message: messages.append(message), "Uploading video",
+                                      min_interval=60)
+    report(1048576, 4194304)
+    report(2097152, 4194304)
+    # 最后一次（上传完成）总会报告
+    report(4194304, 4194304)
+    assert messages == ["Uploading video... 25% (1.0/4.0 MB)", "Uploading video... 100% (4.0/4.0 MB)"]
+    assert upload_progress_reporter(None, "Uploading video") is None
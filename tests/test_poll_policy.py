@@ -0,0 +1,78 @@
+"""
+自适应轮询策略测试
+不需要网络
+"""
+
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils.job_store import JobStore
+from utils.poll_policy import PollingPolicy
+
+
+def test_estimate_scales_with_duration_and_resolution():
+    assert PollingPolicy.estimate_seconds() == PollingPolicy.DEFAULT_EXPECTED_SECONDS
+    base = PollingPolicy.estimate_seconds(10, 1920, 1080)
+    assert base == PollingPolicy.OVERHEAD_SECONDS + 40
+    assert PollingPolicy.estimate_seconds(20, 1920, 1080) > base
+    assert PollingPolicy.estimate_seconds(10, 3840, 2160) > base
+    # 分辨率未知时按 1080p 估算，系数有上下限
+    assert PollingPolicy.estimate_seconds(10) == base
+    assert PollingPolicy.resolution_factor(100) == 0.5
+    assert PollingPolicy.resolution_factor(7680 * 4320) == 4.0
+
+
+def test_estimate_uses_history_median_once_enough_samples():
+    # 每秒视频 10 秒，另有一个在供应商队列里卡住的任务
+    history = [(10, None, 130), (20, None, 230), (10, None, 130), (10, None, 2000)]
+    assert PollingPolicy.estimate_seconds(30, history=history) == 330
+    # 样本不足时使用默认系数
+    assert PollingPolicy.estimate_seconds(30, history=history[:2]) == PollingPolicy.OVERHEAD_SECONDS + 120
+
+
+def test_interval_is_sparse_early_dense_near_finish_and_backs_off():
+    policy = PollingPolicy(100, min_interval=2, max_interval=30, jitter=0)
+    assert policy.next_interval(0) == 30
+    assert policy.next_interval(80) == 10
+    assert policy.next_interval(99) == 2
+    # 超时后间隔慢慢变长
+    assert policy.next_interval(120) == 7
+    assert policy.next_interval(1000) == 30
+    assert policy.timeout == 600
+    assert PollingPolicy(1000).timeout == 3000
+
+
+def test_jitter_and_fixed_policy():
+    policy = PollingPolicy(100, jitter=0.2)
+    intervals = {policy.next_interval(0) for _ in range(20)}
+    assert len(intervals) > 1
+    assert all(24 <= interval <= 36 for interval in intervals)
+
+    fixed = PollingPolicy.fixed(5, timeout=60)
+    assert {fixed.next_interval(elapsed) for elapsed in (0, 5, 100)} == {5}
+    assert fixed.timeout == 60
+
+
+def test_processing_history_from_job_store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    rows = [
+        ("a", "akool", "succeeded", 10, 1920, 1080, 100, 200),
+        ("b", "akool", "failed", 10, 1920, 1080, 100, 200),
+        ("c", "vmodel", "succeeded", 10, 1920, 1080, 100, 200),
+        ("d", "akool", "succeeded", 5, None, None, 300, 350),
+    ]
+    for job_id, model, status, duration, width, height, submitted, finished in rows:
+        store.insert({
+            "job_id": job_id, "model": model, "status": status, "created_at": submitted,
+            "video_duration": duration, "video_width": width, "video_height": height,
+            "submitted_at": submitted, "finished_at": finished,
+        })
+
+    assert store.processing_history("akool") == [(5, None, 50), (10, 1920 * 1080, 100)]
+    assert store.processing_history("akool", limit=1) == [(5, None, 50)]
+    assert PollingPolicy.for_video(10, history=store.processing_history("akool")).expected_seconds == pytest.approx(70)
@@ -0,0 +1,91 @@
+"""
+限流测试
+令牌桶和任务并发上限，不需要网络
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils.rate_limit import JobGovernor, KeyLimiter, TokenBucket
+
+
+def test_token_bucket_allows_burst_then_throttles():
+    bucket = TokenBucket(rate=20, capacity=5)
+
+    waits = [bucket.reserve() for _ in range(10)]
+
+    assert waits[:5] == [0.0] * 5
+    # 之后每个请求多等 1/20 秒
+    assert waits[5:] == sorted(waits[5:])
+    assert 0.2 < waits[-1] <= 0.26
+    assert bucket.throttled == 5
+
+
+def test_governor_caps_running_jobs_across_threads_and_tasks():
+    governor = JobGovernor(max_jobs=2)
+    governor.ASYNC_POLL_SECONDS = 0.01
+    peak = []
+    lock = threading.Lock()
+
+    def track():
+        with lock:
+            peak.append(governor.running)
+
+    def thread_job():
+        with governor.slot():
+            track()
+            time.sleep(0.05)
+
+    async def async_jobs():
+        async def job():
+            async with governor.async_slot():
+                track()
+                await asyncio.sleep(0.05)
+        await asyncio.gather(*(job() for _ in range(4)))
+
+    threads = [threading.Thread(target=thread_job) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(async_jobs())
+    for thread in threads:
+        thread.join()
+
+    assert len(peak) == 8
+    assert max(peak) == 2
+    assert governor.running == 0 and governor.queued == 0
+
+
+def test_forced_slot_skips_queue_and_reports_position():
+    limiter = KeyLimiter(rate=0, burst=1, max_jobs=1)
+    positions = []
+
+    with limiter.job_slot():
+        # 已在供应商处理中的任务（恢复）不排队
+        with limiter.job_slot(force=True):
+            assert limiter.metrics()["running_jobs"] == 2
+
+        entered, done = threading.Event(), threading.Event()
+
+        def waiter_job():
+            with limiter.job_slot(on_queued=positions.append):
+                entered.set()
+                done.wait(timeout=1)
+
+        waiter = threading.Thread(target=waiter_job)
+        waiter.start()
+        time.sleep(0.05)
+        assert limiter.metrics()["queued_jobs"] == 1
+        assert not entered.is_set()
+
+    assert entered.wait(timeout=1)
+    assert positions == [1]
+    assert limiter.metrics()["running_jobs"] == 1
+    done.set()
+    waiter.join(timeout=1)
+    assert limiter.metrics()["running_jobs"] == 0
@@ -0,0 +1,63 @@
+"""
+结果缓存测试
+使用临时数据库，不需要网络
+"""
+
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import job_queue
+from utils.job_queue import JobManager
+from utils.job_store import JobStore
+from utils.result_cache import ResultCache, result_key
+
+
+def expires_in_hours(cache: ResultCache, key: str) -> float:
+    row = cache._conn.execute("SELECT expires_at FROM results WHERE cache_key = ?", (key,)).fetchone()
+    return (row["expires_at"] - time.time()) / 3600
+
+
+def test_key_depends_on_inputs_model_and_options():
+    key = result_key("face", "video", "akool")
+    assert key == result_key("face", "video", "akool")
+    assert key != result_key("face", "video", "vmodel")
+    assert key != result_key("face", "video", "akool", {"face_enhance": False, "preprocess": None})
+    assert key != result_key("other", "video", "akool")
+
+
+def test_missing_local_result_is_dropped(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.db"), ttl_hours=72)
+    result = tmp_path / "result.mp4"
+    result.write_bytes(b"video")
+    cache.put("key", str(result), "job")
+    assert cache.get("key") == str(result)
+
+    result.unlink()
+    assert cache.get("key") is None
+
+
+def test_vendor_url_is_cached_only_briefly(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache.db"), ttl_hours=72)
+    monkeypatch.setattr(job_queue, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(job_queue, "RESULT_MIRROR_ENABLED", False)
+    monkeypatch.setattr(job_queue, "RESULT_URL_CACHE_TTL_HOURS", 1)
+    manager = JobManager(max_workers=1, store=JobStore(str(tmp_path / "jobs.db")))
+
+    result = tmp_path / "result.mp4"
+    result.write_bytes(b"video")
+    keys = []
+    for result_url in ("https://vendor/expiring.mp4", str(result)):
+        job_id = manager._create("face.jpg", "video.mp4", "akool", "alice")
+        keys.append(result_key(job_id, "video", "akool"))
+        manager.store.update(job_id, face_hash=job_id, video_hash="video", result_key=keys[-1])
+        manager._succeed(job_id, result_url)
+
+    # 没有本地副本时只按链接的有效期复用；本地文件按完整时长复用
+    assert cache.get(keys[0]) == "https://vendor/expiring.mp4"
+    assert 0.9 < expires_in_hours(cache, keys[0]) <= 1
+    assert expires_in_hours(cache, keys[1]) > 71
+    manager.shutdown()
@@ -0,0 +1,78 @@
+"""
+自动路由测试
+用临时任务库中的历史记录和本地模拟后端，不需要网络
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import backends, router
+from utils.backends import FakeBackend
+from utils.job_store import JobStore
+from utils.router import BackendRouter
+
+
+def add_jobs(store, model, count, seconds_per_video_second, failed=0):
+    now = time.time()
+    for i in range(count + failed):
+        store.insert({
+            "job_id": f"{model}-{i}",
+            "model": model,
+            "status": "failed" if i >= count else "succeeded",
+            "video_duration": 10,
+            "started_at": now - 100,
+            "submitted_at": now - 95,
+            "finished_at": now - 95 + 10 * seconds_per_video_second,
+        })
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setitem(backends.API_CONFIGS, "cheap", {"cost_per_second": 0.01})
+    monkeypatch.setitem(backends.API_CONFIGS, "pricey", {"cost_per_second": 0.05, "max_concurrent_jobs": 1})
+    registry = {name: FakeBackend(name, enabled=True) for name in ("cheap", "pricey")}
+    monkeypatch.setattr(backends, "_backends", registry)
+    monkeypatch.setattr(router, "USER_COST_CEILINGS", {"intern": 0.2})
+    monkeypatch.setattr(router, "FACE_SWAP_MODEL", "cheap")
+    store = JobStore(str(tmp_path / "jobs.db"))
+    return BackendRouter(store=store), store, registry
+
+
+def test_picks_fastest_backend_within_cost_ceiling(setup):
+    route, store, _ = setup
+    add_jobs(store, "cheap", 5, seconds_per_video_second=6)
+    add_jobs(store, "pricey", 5, seconds_per_video_second=2)
+
+    video_info = {"duration": 10}
+    assert route.choose(video_info) == "pricey"
+    # 0.5 美元超过 intern 的上限，只能用便宜的后端
+    assert route.choose(video_info, owner="intern") == "cheap"
+    with pytest.raises(ValueError):
+        route.choose({"duration": 60}, owner="intern")
+
+
+def test_failures_and_full_queue_push_jobs_elsewhere(setup):
+    route, store, registry = setup
+    add_jobs(store, "cheap", 5, seconds_per_video_second=4)
+    add_jobs(store, "pricey", 5, seconds_per_video_second=2, failed=5)
+
+    stats = route.stats("pricey")
+    assert stats["failure_rate"] == 0.5
+    assert stats["prepare_seconds"] == 5
+    # 失败率 50%：预期耗时翻倍，比 cheap 慢
+    assert route.choose({"duration": 10}) == "cheap"
+
+    route.store = JobStore(str(store.db_path) + ".2")
+    route._stats.clear()
+    add_jobs(route.store, "cheap", 5, seconds_per_video_second=4)
+    add_jobs(route.store, "pricey", 5, seconds_per_video_second=2)
+    assert route.choose({"duration": 10}) == "pricey"
+    # pricey 只有 1 个并发名额且已占用，要等前一个任务完成
+    with registry["pricey"].jobs.slot():
+        assert route.choose({"duration": 10}) == "cheap"
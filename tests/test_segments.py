@@ -0,0 +1,160 @@
+"""
+长视频分段处理测试
+用 ffmpeg 生成的短视频和假的 Akool 换脸函数代替真实 API，不需要网络（本机没有 ffmpeg 时跳过）
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import akool_client, akool_keys, downloader, face_swap
+from utils.akool_keys import KeyPool
+from utils.video_probe import probe_video
+from utils.video_segments import concat_segments, ffmpeg_path, split_video
+
+pytestmark = pytest.mark.skipif(ffmpeg_path() is None, reason="需要 ffmpeg")
+
+
+@pytest.fixture
+def video(tmp_path):
+    """3 秒、每秒一个关键帧、带音轨的测试视频"""
+    path = str(tmp_path / "source.mp4")
+    subprocess.run([
+        ffmpeg_path(), "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc=duration=3:size=160x120:rate=10",
+        "-f", "lavfi", "-i", "sine=duration=3",
+        "-c:v", "libx264", "-g", "10", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest",
+        path
+    ], check=True)
+    return path
+
+
+@pytest.fixture
+def fake_akool(tmp_path, monkeypatch):
+    """假的 Akool：结果 URL 就是片段路径，“下载”即复制片段"""
+    calls = []
+
+    class FakeClient:
+        def __init__(self, api_key):
+            self.api_key = api_key
+
+        def get_credit_info(self):
+            return {"code": 1000, "data": {"credit": 1000}}
+
+    def akool_swap(face_image_path, video_path, api_key, stage_callback, **kwargs):
+        index = int(os.path.basename(video_path)[len("segment_"):][:3])
+        calls.append(index)
+        stage_callback("submitted", {"akool_id": f"akool-{index}"})
+        return video_path
+
+    def download_file(url, output_path):
+        with open(url, "rb") as src, open(output_path, "wb") as dst:
+            dst.write(src.read())
+        return output_path
+
+    monkeypatch.setattr(face_swap, "RESULT_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(face_swap, "SEGMENT_SECONDS", 1)
+    monkeypatch.setattr(face_swap, "SEGMENT_WORKERS", 2)
+    monkeypatch.setattr(face_swap, "build_polling_policy", lambda model, video_info: None)
+    monkeypatch.setattr(akool_keys, "get_akool_client", FakeClient)
+    monkeypatch.setattr(akool_keys, "_pool", KeyPool(["key-a"], refresh_seconds=3600))
+    monkeypatch.setattr(akool_client, "swap_face_akool", akool_swap)
+    monkeypatch.setattr(downloader, "download_file", download_file)
+    return calls
+
+
+def test_split_and_concat_keep_duration_and_audio(video, tmp_path):
+    segments = split_video(video, 1, str(tmp_path / "segments"))
+    assert len(segments) == 3
+    assert all(probe_video(path)["duration"] == pytest.approx(1, abs=0.2) for path in segments)
+
+    output = concat_segments(segments, video, str(tmp_path / "joined.mp4"))
+    assert probe_video(output)["duration"] == pytest.approx(3, abs=0.2)
+    assert not os.path.exists(output + ".txt")
+
+
+def test_segmented_records_each_segment_id(video, fake_akool):
+    recorded = []
+    stage_callback = lambda stage, data: recorded.append((stage, sorted(data["akool_segments"]["ids"])))
+
+    output = face_swap.swap_face_akool_segmented("face.jpg", video, stage_callback=stage_callback)
+
+    assert probe_video(output)["duration"] == pytest.approx(3, abs=0.2)
+    assert sorted(fake_akool) == [0, 1, 2]
+    assert {stage for stage, _ in recorded} == {"segment_submitted"}
+    assert recorded[-1][1] == ["0", "1", "2"]
+    # 工作目录已清理，只留下拼接结果
+    assert os.listdir(os.path.dirname(output)) == [os.path.basename(output)]
+
+
+def test_resume_only_submits_missing_segments(video, fake_akool, monkeypatch):
+    from utils import video_segments
+
+    segments = {
+        "video_path": video,
+        "segment_seconds": 1,
+        "total": 3,
+        "ids": {
+            "0": {"handle": "fp-a:akool-0", "submitted_at": time.time()},
+            "1": {"handle": "fp-b:akool-1", "submitted_at": time.time()},
+        },
+    }
+    work_dirs = []
+    resumed = []
+
+    def split(video_path, segment_seconds, output_dir):
+        work_dirs.append(output_dir)
+        return split_video(video_path, segment_seconds, output_dir)
+
+    def resume_swap_akool(akool_id, progress_callback=None, video_info=None, elapsed=0, akool_key=None):
+        resumed.append((akool_id, akool_key))
+        # 结果 URL 按任务 ID 对应到重新切出的片段
+        return os.path.join(work_dirs[0], f"segment_{int(akool_id[-1]):03d}.mp4")
+
+    monkeypatch.setattr(video_segments, "split_video", split)
+    monkeypatch.setattr(face_swap, "resume_swap_akool", resume_swap_akool)
+    recorded = []
+
+    output = face_swap.resume_swap_akool_segmented(
+        "face.jpg", segments, stage_callback=lambda stage, data: recorded.append(data["akool_segments"])
+    )
+
+    assert probe_video(output)["duration"] == pytest.approx(3, abs=0.2)
+    assert sorted(resumed) == [("akool-0", "fp-a"), ("akool-1", "fp-b")]
+    # 只提交之前没有记录任务 ID 的片段
+    assert fake_akool == [2]
+    assert sorted(recorded[-1]["ids"]) == ["0", "1", "2"]
+
+
+def test_segment_failure_waits_for_running_segments(video, fake_akool, monkeypatch, tmp_path):
+    started = threading.Event()
+    finished = threading.Event()
+
+    def akool_swap(face_image_path, video_path, api_key, stage_callback, **kwargs):
+        index = int(os.path.basename(video_path)[len("segment_"):][:3])
+        fake_akool.append(index)
+        if index == 0:
+            # 片段 1 处理中时片段 0 失败
+            started.wait(5)
+            raise RuntimeError("Akool processing failed")
+        started.set()
+        time.sleep(0.2)
+        finished.set()
+        return video_path
+
+    monkeypatch.setattr(akool_client, "swap_face_akool", akool_swap)
+
+    with pytest.raises(RuntimeError, match="Akool processing failed"):
+        face_swap.swap_face_akool_segmented("face.jpg", video)
+
+    # 进行中的片段结束后才删除工作目录；排队的片段不再提交
+    assert finished.is_set()
+    assert sorted(fake_akool) == [0, 1]
+    assert os.listdir(tmp_path / "results") == []
@@ -0,0 +1,231 @@
+"""
+输入文件存储后端测试
+本机存储使用真实的 serve() 文件服务器；S3 使用模拟的 boto3 客户端（本机无需安装 boto3），
+临时托管使用假的上传函数和本地 HTTP 服务器，不需要网络
+"""
+
+import http.server
+import os
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import akool_client, storage
+from utils.storage import LocalStorage, S3Storage, StorageBackend, TempHostingStorage
+
+
+@pytest.fixture
+def face(tmp_path):
+    path = tmp_path / "Face.JPG"
+    path.write_bytes(b"face" * 1000)
+    return str(path)
+
+
+# ---------- 本机存储 ----------
+
+@pytest.fixture
+def local(tmp_path):
+    local = LocalStorage(str(tmp_path / "storage"), "http://127.0.0.1/inputs")
+    yield local
+
+
+def test_local_put_is_content_addressed(local, face, tmp_path):
+    progress = []
+    stored = local.put(face, lambda sent, total: progress.append((sent, total)))
+
+    key = StorageBackend.content_key(face)
+    assert key.endswith(".jpg") and stored.key == key
+    assert stored.url == "http://127.0.0.1/inputs/" + key
+    assert stored.reusable and stored.expires_at > time.time() + 23 * 3600
+    assert progress == [(4000, 4000)]
+
+    # 相同内容只存一份
+    copy = tmp_path / "copy.jpg"
+    copy.write_bytes(b"face" * 1000)
+    assert local.put(str(copy)).key == key
+    assert os.listdir(local.root_dir) == [key]
+
+    assert local.exists(key)
+    local.delete(key)
+    assert not local.exists(key)
+    local.delete(key)
+
+
+def test_local_serve_only_serves_exact_keys(local, face):
+    httpd = local.serve(host="127.0.0.1", port=0)
+    try:
+        base = f"http://127.0.0.1:{httpd.server_address[1]}/"
+        key = local.put(face).key
+
+        response = requests.get(base + key, timeout=5)
+        assert response.status_code == 200 and response.content == b"face" * 1000
+
+        # 不能列出目录，也不能下载不存在的对象
+        for path in ("", "./", "missing.jpg"):
+            response = requests.get(base + path, timeout=5)
+            assert response.status_code == 404 and key not in response.text
+    finally:
+        httpd.shutdown()
+
+
+def test_local_requires_public_url(tmp_path):
+    with pytest.raises(ValueError):
+        LocalStorage(str(tmp_path / "storage"), None)
+
+
+# ---------- S3 ----------
+
+class ClientError(Exception):
+    """botocore.exceptions.ClientError 的最小替身"""
+
+    def __init__(self, code):
+        super().__init__(f"An error occurred ({code})")
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """内存中的存储桶，行为与 boto3 S3 客户端的相关接口一致"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.objects = {}
+        self.uploads = []
+        self.head_error = None
+
+    def upload_file(self, file_path, bucket, key, Callback=None):
+        self.uploads.append(key)
+        with open(file_path, "rb") as f:
+            data = f.read()
+        self.objects[(bucket, key)] = data
+        if Callback:
+            # 分片上传时回调分多次
+            Callback(len(data) // 2)
+            Callback(len(data) - len(data) // 2)
+
+    def head_object(self, Bucket, Key):
+        if self.head_error:
+            raise self.head_error
+        if (Bucket, Key) not in self.objects:
+            raise ClientError("404")
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    clients = []
+
+    class FakeBoto3:
+        @staticmethod
+        def client(service, **kwargs):
+            assert service == "s3"
+            clients.append(FakeS3Client(**kwargs))
+            return clients[-1]
+
+    monkeypatch.setattr(storage, "boto3", FakeBoto3)
+    monkeypatch.setattr(storage, "ClientError", ClientError)
+    return clients
+
+
+def test_s3_uploads_once_and_returns_presigned_url(s3, face):
+    backend = S3Storage("bucket", endpoint_url="http://minio:9000", access_key="ak", secret_key="sk",
+                        url_expiry_seconds=600)
+    client = s3[0]
+    assert client.kwargs["endpoint_url"] == "http://minio:9000"
+
+    progress = []
+    stored = backend.put(face, lambda sent, total: progress.append((sent, total)))
+    key = "changeface/" + StorageBackend.content_key(face)
+    assert stored.key == key == backend.key_for(face)
+    assert stored.url == f"https://s3.example.com/bucket/{key}?expires=600"
+    assert stored.expires_at == pytest.approx(time.time() + 600, abs=5)
+    assert progress == [(2000, 4000), (4000, 4000)]
+
+    # 对象已存在时不再上传
+    backend.put(face)
+    assert client.uploads == [key]
+
+    backend.delete(key)
+    assert not backend.exists(key)
+
+
+def test_s3_public_base_url(s3, face):
+    backend = S3Storage("bucket", prefix="in/", public_base_url="https://cdn.example.com/files")
+    stored = backend.put(face)
+    assert stored.url == "https://cdn.example.com/files/in/" + StorageBackend.content_key(face)
+    assert stored.expires_at is None
+
+
+@pytest.mark.parametrize("error", [ClientError("403"), ConnectionError("endpoint unreachable")])
+def test_s3_exists_raises_errors_other_than_missing(s3, face, error):
+    backend = S3Storage("bucket")
+    s3[0].head_error = error
+
+    # 凭证或网络错误不能当作对象不存在而重新上传
+    with pytest.raises(type(error)):
+        backend.exists("changeface/key.jpg")
+    with pytest.raises(type(error)):
+        backend.put(face)
+    assert s3[0].uploads == []
+
+
+def test_s3_requires_bucket(s3):
+    with pytest.raises(ValueError):
+        S3Storage(None)
+
+
+# ---------- 临时托管 ----------
+
+class StatusHandler(http.server.BaseHTTPRequestHandler):
+    """/gone 返回 404，其余返回 200"""
+
+    def do_HEAD(self):
+        self.send_response(404 if self.path == "/gone" else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_temp_hosting(monkeypatch, face):
+    uploads = []
+
+    def upload_with_expiry(file_path, progress_callback=None, hedge_after=15):
+        uploads.append((file_path, hedge_after))
+        return ("https://tmpfiles.org/dl/1/face.jpg", time.time() + 3600) if len(uploads) == 1 \
+            else ("https://file.io/abc", None)
+
+    monkeypatch.setattr(akool_client, "upload_with_expiry", upload_with_expiry)
+    backend = TempHostingStorage(hedge_after=5)
+    assert not backend.can_delete
+
+    stored = backend.put(face)
+    assert stored.url == stored.key == "https://tmpfiles.org/dl/1/face.jpg"
+    assert stored.reusable and stored.expires_at > time.time()
+    # file.io 的链接只能下载一次
+    assert not backend.put(face).reusable
+    assert uploads == [(face, 5), (face, 5)]
+    backend.delete(stored.key)
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StatusHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        base = f"http://127.0.0.1:{httpd.server_address[1]}"
+        assert backend.exists(base + "/file.jpg")
+        assert not backend.exists(base + "/gone")
+    finally:
+        httpd.shutdown()
+    # 连接失败视为不可访问
+    assert not backend.exists("http://127.0.0.1:9/file.jpg")
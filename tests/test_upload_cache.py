@@ -0,0 +1,122 @@
+"""
+上传缓存测试
+用假的存储后端代替真实图床，不需要网络
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import upload_cache
+from utils.storage import StoredFile
+from utils.upload_cache import UploadCache, cached_upload, invalidate_upload
+
+
+class FakeStorage:
+    name = "fake"
+
+    def __init__(self):
+        self.uploads = []
+        self._lock = threading.Lock()
+
+    def put(self, file_path, progress_callback=None):
+        time.sleep(0.05)
+        with self._lock:
+            self.uploads.append(file_path)
+            count = len(self.uploads)
+        return StoredFile(f"https://host/{count}", file_path, time.time() + 3600)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    fake = FakeStorage()
+    monkeypatch.setattr("utils.storage.get_storage", lambda: fake)
+    monkeypatch.setattr(upload_cache, "_cache", UploadCache(str(tmp_path / "uploads.db")))
+    return fake
+
+
+@pytest.fixture
+def face(tmp_path):
+    path = tmp_path / "face.jpg"
+    path.write_bytes(b"face")
+    return str(path)
+
+
+def test_concurrent_uploads_of_same_content_share_one_upload(storage, face):
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        urls = list(executor.map(lambda _: cached_upload(face, min_validity=0), range(6)))
+
+    assert storage.uploads == [face]
+    assert set(urls) == {"https://host/1"}
+    # 上传结束后不保留每个内容的锁
+    assert upload_cache._upload_locks == {}
+
+
+def test_invalidated_upload_is_uploaded_again(storage, face):
+    assert cached_upload(face, min_validity=0) == "https://host/1"
+    assert cached_upload(face, min_validity=0) == "https://host/1"
+
+    invalidate_upload(face)
+    assert cached_upload(face, min_validity=0) == "https://host/2"
+    assert len(storage.uploads) == 2
+
+
+def test_rejected_face_url_is_not_reused(storage, face, tmp_path, monkeypatch):
+    from utils import landmark_cache
+    from utils.akool_client import AkoolAPIError, detect_face_landmarks
+    from utils.landmark_cache import LandmarkCache
+
+    class RejectingClient:
+        def detect_faces(self, url, kind):
+            raise AkoolAPIError(1003, "Failed to download image")
+
+    monkeypatch.setattr(landmark_cache, "_cache", LandmarkCache(str(tmp_path / "landmarks.db")))
+    url = cached_upload(face, min_validity=0)
+
+    with pytest.raises(Exception, match="Face detection failed"):
+        detect_face_landmarks(RejectingClient(), face, url)
+    assert cached_upload(face, min_validity=0) != url
+
+
+def test_finished_job_releases_inputs_no_other_job_uses(tmp_path, monkeypatch):
+    from utils.job_queue import Job, JobManager
+    from utils.job_store import JobStore
+    from utils.storage import LocalStorage
+
+    storage = LocalStorage(str(tmp_path / "storage"), "https://files.example.com/")
+    monkeypatch.setattr("utils.storage.get_storage", lambda: storage)
+    monkeypatch.setattr(upload_cache, "_cache", UploadCache(str(tmp_path / "uploads.db")))
+    manager = JobManager(max_workers=1, store=JobStore(str(tmp_path / "jobs.db")))
+
+    faces = []
+    for name in ("alice.jpg", "bob.jpg"):
+        (tmp_path / name).write_bytes(name.encode())
+        faces.append(str(tmp_path / name))
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"video")
+
+    # 两个任务共用视频；第二个任务还在排队
+    for face in faces:
+        manager._create(face, str(video), "fake", "alice")
+    first, second = manager.list_jobs()[::-1]
+    for path in faces + [str(video)]:
+        cached_upload(path, min_validity=0)
+    stored = lambda path: os.path.exists(os.path.join(storage.root_dir, storage.key_for(path)))
+
+    manager._release_inputs(first["job_id"], faces[0], str(video))
+    assert not stored(faces[0]) and stored(str(video))
+    # 删除后再次使用时重新上传
+    cached_upload(faces[0], min_validity=0)
+    assert stored(faces[0])
+
+    manager.store.update(second["job_id"], status=Job.STATUS_SUCCEEDED)
+    manager._release_inputs(first["job_id"], faces[0], str(video))
+    assert not stored(str(video))
+    manager.shutdown()
@@ -0,0 +1,93 @@
+"""
+上传前视频压缩测试
+压缩部分用 ffmpeg 生成的短视频（本机没有 ffmpeg 时跳过），不需要网络
+"""
+
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils import video_preprocess
+from utils.video_preprocess import needs_preprocess, preprocess_video
+from utils.video_probe import probe_video
+from utils.video_segments import ffmpeg_path
+
+needs_ffmpeg = pytest.mark.skipif(ffmpeg_path() is None, reason="需要 ffmpeg")
+
+
+@pytest.fixture
+def policy(tmp_path, monkeypatch):
+    """模型 "small" 的策略：短边不超过 120 像素"""
+    monkeypatch.setitem(video_preprocess.API_CONFIGS, "small", {"preprocess": {"max_short_side": 120}})
+    monkeypatch.setattr(video_preprocess, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(video_preprocess, "VIDEO_PREPROCESS_ENABLED", True)
+    os.makedirs(tmp_path / "uploads")
+    return tmp_path
+
+
+def make_video(path, size="320x240"):
+    subprocess.run([
+        ffmpeg_path(), "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc=duration=2:size={size}:rate=10",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", str(path)
+    ], check=True)
+    return str(path)
+
+
+def test_needs_preprocess():
+    policy = {"max_short_side": 1080, "max_bit_rate": 8_000_000}
+    assert needs_preprocess({"width": 3840, "height": 2160}, policy)
+    # 竖屏按短边判断
+    assert not needs_preprocess({"width": 1080, "height": 1920, "bit_rate": 6_000_000}, policy)
+    assert needs_preprocess({"width": 1080, "height": 1920, "bit_rate": 20_000_000}, policy)
+    # 元数据未知或没有策略时不压缩
+    assert not needs_preprocess({}, policy)
+    assert not needs_preprocess({"width": 3840, "height": 2160}, {})
+
+
+def test_videos_within_policy_are_returned_unchanged(policy):
+    info = {"width": 160, "height": 90, "duration": 2}
+    assert preprocess_video("clip.mp4", "small", video_info=info) == ("clip.mp4", info)
+    assert preprocess_video("clip.mp4", "unknown", video_info={"width": 3840, "height": 2160}) == \
+        ("clip.mp4", {"width": 3840, "height": 2160})
+
+
+@needs_ffmpeg
+def test_large_video_is_scaled_once_and_reused(policy, monkeypatch):
+    portrait = make_video(policy / "portrait.mp4", size="240x320")
+    encoded = []
+    encode = video_preprocess._encode_proxy
+
+    def counting_encode(*args, **kwargs):
+        encoded.append(args[0])
+        return encode(*args, **kwargs)
+
+    monkeypatch.setattr(video_preprocess, "_encode_proxy", counting_encode)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(preprocess_video(portrait, "small")))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+
+    # 同时提交的相同视频只压缩一次，共用同一个代理文件
+    assert encoded == [portrait]
+    assert len({path for path, _ in results}) == 1
+    proxy_path, proxy_info = results[0]
+    assert os.path.dirname(proxy_path) == str(policy / "uploads")
+    assert (proxy_info["width"], proxy_info["height"]) == (120, 160)
+    assert proxy_info["duration"] == pytest.approx(2, abs=0.2)
+    assert probe_video(proxy_path)["width"] == 120
+    assert [name for name in os.listdir(policy / "uploads") if name.endswith(".tmp")] == []
+
+    assert preprocess_video(portrait, "small")[0] == proxy_path
+    assert encoded == [portrait]
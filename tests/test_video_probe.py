@@ -0,0 +1,71 @@
+"""
+视频文件头解析测试
+用内存中构造的 MP4 box 代替真实视频，不需要 ffprobe
+"""
+
+import io
+import os
+import sys
+from struct import pack
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils.video_probe import parse_mp4_header
+
+
+def box(box_type: bytes, body: bytes = b"") -> bytes:
+    return pack(">I4s", 8 + len(body), box_type) + body
+
+
+def mvhd(timescale: int, duration: int, version: int = 0) -> bytes:
+    if version == 1:
+        return box(b"mvhd", pack(">B3xQQIQ", 1, 0, 0, timescale, duration) + bytes(80))
+    return box(b"mvhd", pack(">B3xIIII", 0, 0, 0, timescale, duration) + bytes(80))
+
+
+def video_trak(width: int, height: int) -> bytes:
+    tkhd = box(b"tkhd", bytes(76) + pack(">II", width << 16, height << 16))
+    hdlr = box(b"hdlr", bytes(8) + b"vide" + bytes(12))
+    return box(b"trak", tkhd + box(b"mdia", hdlr))
+
+
+def audio_trak() -> bytes:
+    tkhd = box(b"tkhd", bytes(84))
+    hdlr = box(b"hdlr", bytes(8) + b"soun" + bytes(12))
+    return box(b"trak", tkhd + box(b"mdia", hdlr))
+
+
+def test_reads_duration_size_and_bit_rate():
+    data = box(b"ftyp", b"isom") + box(b"mdat", bytes(1000)) + box(
+        b"moov", mvhd(1000, 12500) + audio_trak() + video_trak(1280, 720)
+    )
+    info = parse_mp4_header(io.BytesIO(data))
+    assert info == {"duration": 12.5, "width": 1280, "height": 720, "bit_rate": int(len(data) * 8 / 12.5)}
+
+
+def test_version_1_mvhd():
+    info = parse_mp4_header(io.BytesIO(box(b"moov", mvhd(600, 6000, version=1))))
+    assert info["duration"] == 10
+
+
+def test_malformed_headers_return_empty():
+    samples = [
+        b"",
+        b"not a video at all",
+        # 空的 mvhd
+        pack(">I4s", 16, b"moov") + pack(">I4s", 8, b"mvhd"),
+        # 截断的 mvhd 和 tkhd
+        box(b"moov", box(b"mvhd", b"\x00\x00")),
+        box(b"moov", box(b"trak", box(b"tkhd", b"\x00"))),
+        # 64 位大小但被截断
+        pack(">I4s", 1, b"moov") + b"\x00\x00",
+    ]
+    for data in samples:
+        assert parse_mp4_header(io.BytesIO(data)) == {}
+
+
+def test_real_video():
+    with open(os.path.join(PROJECT_ROOT, "tests", "input", "target.mp4"), "rb") as f:
+        info = parse_mp4_header(f)
+    assert info["duration"] > 0 and info["width"] > 0 and info["height"] > 0
@@ -0,0 +1,121 @@
+"""
+Akool 回调接收测试
+用本地假 Akool 回调代替真实服务，不需要 API Key 和网络
+"""
+
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import pytest
+import requests
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from utils.akool_client import AkoolClient
+from utils.akool_poller import AkoolPoller
+from utils.poll_policy import PollingPolicy
+from utils.webhook_server import WebhookServer, WEBHOOK_STATUS_COMPLETED, WEBHOOK_STATUS_FAILED
+
+
+class NeverFinishedClient(AkoolClient):
+    """listbyids 永远返回处理中，只有回调能让任务结束"""
+
+    def __init__(self):
+        self.polls = 0
+
+    def get_results(self, job_ids):
+        self.polls += 1
+        return {"code": 1000, "data": {"result": [{"_id": i, "faceswap_status": 1} for i in job_ids]}}
+
+
+@pytest.fixture
+def poller():
+    return AkoolPoller(NeverFinishedClient())
+
+
+@pytest.fixture
+def server(poller):
+    # 假 Akool 发送明文回调
+    server = WebhookServer("127.0.0.1", 0, on_event=poller.deliver, allow_unsigned=True).start()
+    yield server
+    server.stop()
+
+
+def fake_akool_callback(url, payload, delay=0.2):
+    """模拟 Akool 在任务完成后 POST 回调"""
+    timer = threading.Timer(delay, lambda: requests.post(url, json=payload, timeout=5))
+    timer.start()
+    return timer
+
+
+def test_callback_completes_waiting_job(server, poller):
+    fake_akool_callback(server.url, {"_id": "job-1", "status": WEBHOOK_STATUS_COMPLETED, "url": "https://r/1.mp4"})
+
+    # 兜底轮询间隔远大于回调延迟
+    policy = PollingPolicy.fixed(interval=30, timeout=10)
+    assert poller.wait("job-1", policy=policy) == "https://r/1.mp4"
+    assert server.events_received == 1
+
+
+def test_callback_failure_raises(server, poller):
+    fake_akool_callback(server.url, {"_id": "job-2", "status": WEBHOOK_STATUS_FAILED, "msg": "no face"})
+
+    with pytest.raises(Exception, match="no face"):
+        poller.wait("job-2", policy=PollingPolicy.fixed(interval=30, timeout=10))
+
+
+def test_invalid_body_rejected(server):
+    response = requests.post(server.url, json={"status": WEBHOOK_STATUS_COMPLETED}, timeout=5)
+    assert response.status_code == 400
+
+
+def test_forged_plain_callback_rejected(poller):
+    server = WebhookServer("127.0.0.1", 0, on_event=poller.deliver,
+                           client_id="0123456789abcdef", client_secret="0123456789abcdef01234567").start()
+    try:
+        response = requests.post(server.url, json={
+            "_id": "job-4", "status": WEBHOOK_STATUS_COMPLETED, "url": "http://evil/x.mp4"
+        }, timeout=5)
+        assert response.status_code == 400
+        assert server.events_received == 0
+    finally:
+        server.stop()
+
+    # 未配置凭据时同样拒绝
+    server = WebhookServer("127.0.0.1", 0, on_event=poller.deliver).start()
+    try:
+        response = requests.post(server.url, json={"_id": "job-4", "status": WEBHOOK_STATUS_COMPLETED}, timeout=5)
+        assert response.status_code == 400
+    finally:
+        server.stop()
+
+
+def test_encrypted_callback(poller):
+    cipher_mod = pytest.importorskip("cryptography.hazmat.primitives.ciphers")
+    client_id = "0123456789abcdef"                 # 16 字节 IV
+    client_secret = "0123456789abcdef01234567"     # 24 字节 AES-192 密钥
+
+    plain = json.dumps({"_id": "job-3", "status": WEBHOOK_STATUS_COMPLETED, "url": "https://r/3.mp4"}).encode()
+    pad = 16 - len(plain) % 16
+    encryptor = cipher_mod.Cipher(
+        cipher_mod.algorithms.AES(client_secret.encode()),
+        cipher_mod.modes.CBC(client_id.encode())
+    ).encryptor()
+    data_encrypt = base64.b64encode(encryptor.update(plain + bytes([pad]) * pad) + encryptor.finalize()).decode()
+    timestamp, nonce = "1700000000", "42"
+    signature = hashlib.sha1("".join(sorted([client_id, timestamp, nonce, data_encrypt])).encode()).hexdigest()
+
+    server = WebhookServer("127.0.0.1", 0, on_event=poller.deliver,
+                           client_id=client_id, client_secret=client_secret).start()
+    try:
+        fake_akool_callback(server.url, {
+            "signature": signature, "dataEncrypt": data_encrypt, "timestamp": timestamp, "nonce": nonce
+        })
+        assert poller.wait("job-3", policy=PollingPolicy.fixed(interval=30, timeout=10)) == "https://r/3.mp4"
+    finally:
+        server.stop()
@@ -0,0 +1,436 @@
+"""
+Asyncio Akool API client
+
+AkoolClient blocks a thread per in-flight request and sleeps between
+polls, so every supervised job pins a worker. AsyncAkoolClient exposes the
+same methods as coroutines on httpx, letting one event loop drive hundreds
+of jobs. Request bodies and response parsing are shared with AkoolClient.
+
+Requires httpx (pip install httpx).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+from urllib.parse import urljoin
+
+from utils.akool_client import AkoolAPIError, AkoolClient, _tmpfiles_direct_url
+from utils.hedged_upload import DEFAULT_HEDGE_SECONDS, get_service_health, rank_services
+from utils.multipart import MultipartFileStream, UploadCancelled
+from utils.rate_limit import KeyLimiter, get_key_limiter
+
+# httpx is optional - only needed for the async client
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class AsyncAkoolClient:
+    """
+    Async counterpart of AkoolClient
+
+    Usage:
+        async with AsyncAkoolClient(api_key) as client:
+            result = await client.swap_face_video(...)
+            url = await client.wait_for_result(result["data"]["_id"])
+    """
+
+    ENDPOINTS = AkoolClient.ENDPOINTS
+    STATUS_PENDING = AkoolClient.STATUS_PENDING
+    STATUS_SUCCESS = AkoolClient.STATUS_SUCCESS
+    STATUS_FAILED = AkoolClient.STATUS_FAILED
+
+    def __init__(
+        self,
+        api_key: str,
+        timeout: int = 30,
+        base_url: str = AkoolClient.BASE_URL,
+        face_detect_url: str = AkoolClient.FACE_DETECT_URL,
+        max_connections: int = 100,
+        limiter: KeyLimiter = None
+    ):
+        """
+        Initialize async client
+
+        Args:
+            api_key: Akool API Key
+            timeout: Request timeout in seconds
+            base_url: API base URL (overridable for testing)
+            face_detect_url: Face detection API base URL
+            max_connections: Connection pool size shared by all concurrent calls
+            limiter: Rate limiter and job governor (default: the process-wide
+                one of api_key, shared with the blocking AkoolClient)
+        """
+        if httpx is None:
+            raise ImportError("httpx is not installed. Run: pip install httpx")
+        if not api_key:
+            raise ValueError("Akool API Key is required")
+
+        self.api_key = api_key
+        self.limiter = limiter or get_key_limiter(api_key)
+        self.base_url = base_url
+        self.face_detect_url = face_detect_url
+        self.client = httpx.AsyncClient(
+            headers={"x-api-key": api_key, "Content-Type": "application/json"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _request(self, method: str, endpoint: str, base_url: str = None, retries: int = 3, **kwargs) -> dict:
+        """
+        Make API request with retry support (same semantics as AkoolClient._request)
+
+        Raises:
+            AkoolAPIError: If API returns error code
+            httpx.HTTPError: If request fails after all retries
+        """
+        url = urljoin(base_url or self.base_url, endpoint)
+
+        for attempt in range(retries):
+            try:
+                await self.limiter.async_acquire_request()
+                response = await self.client.request(method, url, **kwargs)
+                response.raise_for_status()
+                data = response.json()
+
+                if data.get("code") != 1000:
+                    raise AkoolAPIError(
+                        code=data.get("code", -1),
+                        message=data.get("msg", "Unknown error")
+                    )
+                return data
+
+            # NetworkError covers refused and reset connections, like requests' ConnectionError
+            except (httpx.TimeoutException, httpx.NetworkError):
+                if attempt < retries - 1:
+                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                    continue
+                raise
+
+        raise Exception("Request failed after all retries")
+
+    async def detect_faces(self, media_url: str, media_type: str = "image") -> dict:
+        """Detect faces in image or video to get landmarks (see AkoolClient.detect_faces)"""
+        payload = {"url": media_url}
+        if media_type == "video":
+            payload["num_frames"] = 1
+
+        await self.limiter.async_acquire_request()
+        response = await self.client.post(urljoin(self.face_detect_url, self.ENDPOINTS["face_detect"]), json=payload)
+        response.raise_for_status()
+        data = response.json()
+
+        # Face detect API uses error_code 0 for success (different from other APIs)
+        if data.get("error_code", 0) != 0:
+            raise AkoolAPIError(
+                code=data.get("error_code", -1),
+                message=data.get("error_msg", "Face detection failed")
+            )
+        return data
+
+    async def swap_face_video(
+        self,
+        source_face_url: str,
+        target_video_url: str,
+        source_landmarks: str = None,
+        target_face_url: Optional[str] = None,
+        target_landmarks: Optional[str] = None,
+        face_enhance: bool = True,
+        webhook_url: Optional[str] = None
+    ) -> dict:
+        """Submit a video face swap job (see AkoolClient.swap_face_video)"""
+        payload = AkoolClient.build_video_swap_payload(
+            source_face_url, target_video_url, source_landmarks, target_face_url,
+            target_landmarks, face_enhance, webhook_url
+        )
+        return await self._request("POST", self.ENDPOINTS["video_faceswap"], json=payload)
+
+    async def get_result(self, job_id: str) -> dict:
+        """Get faceswap result by job ID"""
+        return await self.get_results([job_id])
+
+    async def get_results(self, job_ids: list) -> dict:
+        """Get faceswap results for several jobs in one request"""
+        return await self._request("GET", self.ENDPOINTS["get_result"], params={"_ids": ",".join(job_ids)})
+
+    async def get_credit_info(self) -> dict:
+        """Get user credit balance information"""
+        return await self._request("GET", self.ENDPOINTS["get_credit"])
+
+    async def wait_for_result(
+        self,
+        job_id: str,
+        timeout: int = 600,
+        poll_interval: int = 5,
+        progress_callback=None,
+        policy=None
+    ) -> str:
+        """
+        Wait for video processing to complete without blocking a thread
+
+        Args:
+            job_id: Job ID from swap_face_video response
+            timeout: Maximum wait time in seconds
+            poll_interval: Polling interval in seconds
+            progress_callback: Optional callback function(status, message)
+            policy: Optional PollingPolicy; overrides poll_interval and timeout
+
+        Returns:
+            Result video URL
+
+        Raises:
+            TimeoutError: If processing exceeds timeout
+            AkoolAPIError: If processing fails
+        """
+        if policy is not None:
+            timeout = policy.timeout
+
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            result_list = AkoolClient.parse_result_items(await self.get_result(job_id))
+
+            if result_list:
+                status, video_url, error_msg = AkoolClient.parse_result_item(result_list[0])
+                if status == self.STATUS_SUCCESS:
+                    if progress_callback:
+                        progress_callback(self.STATUS_SUCCESS, "Processing complete!")
+                    return video_url
+                if status == self.STATUS_FAILED:
+                    raise AkoolAPIError(status, error_msg)
+                message = f"Processing video... (status: {status})"
+            else:
+                message = "Waiting for processing to start..."
+
+            if progress_callback:
+                progress_callback(self.STATUS_PENDING, message)
+
+            elapsed = time.time() - start_time
+            await asyncio.sleep(policy.next_interval(elapsed) if policy is not None else poll_interval)
+
+        raise TimeoutError(f"Video processing timed out after {timeout} seconds")
+
+
+async def _aiter_body(body: MultipartFileStream):
+    """Feed a MultipartFileStream to httpx (chunk reads from local disk are short)"""
+    while True:
+        chunk = body.read(body.chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _post_multipart(client, url: str, body: MultipartFileStream):
+    return await client.post(
+        url,
+        content=_aiter_body(body),
+        headers={"Content-Type": body.content_type, "Content-Length": str(len(body))}
+    )
+
+
+async def async_upload_to_tmpfiles(client, file_path: str, progress_callback=None, cancel_event=None) -> str:
+    """Upload to tmpfiles.org (files kept for 1 hour minimum)"""
+    with MultipartFileStream(file_path, progress_callback=progress_callback, cancel_event=cancel_event) as body:
+        response = await _post_multipart(client, "https://tmpfiles.org/api/v1/upload", body)
+
+    direct_url = _tmpfiles_direct_url(response.json()) if response.status_code == 200 else None
+    if direct_url:
+        return direct_url
+    raise Exception(f"tmpfiles.org upload failed: {response.text}")
+
+
+async def async_upload_to_fileio(client, file_path: str, progress_callback=None, cancel_event=None) -> str:
+    """Upload to file.io (backup option, files deleted after download)"""
+    with MultipartFileStream(file_path, fields={"expires": "1d"}, progress_callback=progress_callback,
+                             cancel_event=cancel_event) as body:
+        response = await _post_multipart(client, "https://file.io", body)
+
+    if response.status_code == 200 and response.json().get("success"):
+        return response.json().get("link")
+    raise Exception(f"file.io upload failed: {response.text}")
+
+
+# Same services and health records as the blocking HOSTING_SERVICES
+ASYNC_HOSTING_SERVICES = [
+    ("tmpfiles", async_upload_to_tmpfiles, 3600),
+    ("fileio", async_upload_to_fileio, None),
+]
+
+
+async def async_upload_with_expiry(
+    file_path: str,
+    progress_callback=None,
+    hedge_after: float = DEFAULT_HEDGE_SECONDS,
+    services: list = None,
+    client=None
+) -> tuple:
+    """
+    Upload a local file to temporary hosting (async version of upload_with_expiry)
+
+    Services are ranked by the shared health records; when the running
+    uploads stall for hedge_after seconds the next service starts as a
+    concurrent task, and the first success cancels the rest.
+
+    Args:
+        file_path: Local file path
+        progress_callback: Optional callback(bytes_sent, total_bytes)
+        hedge_after: Seconds without progress before hedging (0 = sequential)
+        services: [(name, async upload function, lifetime)], default ASYNC_HOSTING_SERVICES
+        client: Optional httpx.AsyncClient to reuse
+
+    Returns:
+        (url, expires_at) - expires_at is None for single-use URLs
+    """
+    if httpx is None:
+        raise ImportError("httpx is not installed. Run: pip install httpx")
+
+    ordered = rank_services(services or ASYNC_HOSTING_SERVICES)
+    own_client = client is None
+    client = client or httpx.AsyncClient(timeout=httpx.Timeout(120, connect=10))
+
+    tasks = {}
+    progress = {}
+    errors = []
+
+    def start(service):
+        name, upload_func, lifetime = service
+        cancel_event = threading.Event()
+        progress[name] = time.time()
+
+        def report(bytes_sent, total):
+            progress[name] = time.time()
+            if progress_callback:
+                progress_callback(bytes_sent, total)
+
+        task = asyncio.ensure_future(upload_func(client, file_path, report, cancel_event))
+        tasks[task] = (service, cancel_event, time.time())
+
+    try:
+        start(ordered[0])
+        next_index = 1
+        while tasks:
+            done, _ = await asyncio.wait(
+                list(tasks), timeout=min(hedge_after, 0.5) if hedge_after else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not done:
+                now = time.time()
+                stalled = all(now - progress[service[0]] >= hedge_after for service, _, _ in tasks.values())
+                if stalled and next_index < len(ordered):
+                    start(ordered[next_index])
+                    next_index += 1
+                continue
+
+            for task in done:
+                (name, _, lifetime), _, started_at = tasks.pop(task)
+                error = task.exception()
+                if error is None:
+                    get_service_health(name).record_success(os.path.getsize(file_path), time.time() - started_at)
+                    for other_task, (_, cancel_event, _) in tasks.items():
+                        cancel_event.set()
+                        other_task.cancel()
+                    return task.result(), (time.time() + lifetime if lifetime else None)
+
+                if not isinstance(error, UploadCancelled):
+                    get_service_health(name).record_failure()
+                errors.append(f"{name}: {error}")
+
+            if not tasks and next_index < len(ordered):
+                start(ordered[next_index])
+                next_index += 1
+
+        raise Exception(f"Failed to upload file to any hosting service: {'; '.join(errors)}")
+    finally:
+        if own_client:
+            await client.aclose()
+
+
+async def async_swap_face_akool(
+    face_image_path: str,
+    video_path: str,
+    api_key: str = None,
+    face_enhance: bool = True,
+    progress_callback=None,
+    polling_policy=None,
+    webhook_url: Optional[str] = None,
+    client: AsyncAkoolClient = None,
+    upload=async_upload_with_expiry
+) -> str:
+    """
+    Async version of swap_face_akool: upload both files concurrently,
+    detect landmarks, submit and wait - without holding a thread
+
+    Args:
+        face_image_path: Local path to face image
+        video_path: Local path to target video
+        api_key: Akool API Key (or set AKOOL_API_KEY env var)
+        face_enhance: Enable face enhancement
+        progress_callback: Optional callback(status, message)
+        polling_policy: Optional PollingPolicy for the result wait
+        webhook_url: Optional callback URL
+        client: Optional shared AsyncAkoolClient (recommended when running many jobs)
+        upload: Coroutine function(file_path) -> (url, expires_at)
+
+    Returns:
+        URL of the result video
+    """
+    from utils.akool_client import parse_face_landmarks
+
+    for path in (face_image_path, video_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File not found: {path}")
+
+    own_client = client is None
+    if own_client:
+        api_key = api_key or os.getenv("AKOOL_API_KEY")
+        if not api_key:
+            raise ValueError("Akool API Key is required. Set AKOOL_API_KEY env var or pass api_key parameter")
+        client = AsyncAkoolClient(api_key)
+
+    try:
+        if progress_callback:
+            progress_callback(0, "Uploading face image and video...")
+        (face_url, _), (video_url, _) = await asyncio.gather(upload(face_image_path), upload(video_path))
+
+        if progress_callback:
+            progress_callback(1, "Detecting face landmarks...")
+        try:
+            source_landmarks, _ = parse_face_landmarks(await client.detect_faces(face_url, "image"))
+        except AkoolAPIError as e:
+            raise Exception(f"Face detection failed: {e.message}")
+
+        def queued(position):
+            if progress_callback:
+                progress_callback(1, f"Waiting for a free processing slot ({position} in queue)...")
+
+        # Holds one of the key's concurrent-job slots (shared with the blocking client)
+        async with client.limiter.async_job_slot(on_queued=queued):
+            if progress_callback:
+                progress_callback(1, "Starting face swap processing...")
+            result = await client.swap_face_video(
+                source_face_url=face_url,
+                target_video_url=video_url,
+                source_landmarks=source_landmarks,
+                face_enhance=face_enhance,
+                webhook_url=webhook_url
+            )
+            job_id = result.get("data", {}).get("_id")
+            if not job_id:
+                raise AkoolAPIError(-1, "No job ID returned from API")
+
+            return await client.wait_for_result(job_id, progress_callback=progress_callback, policy=polling_policy)
+    finally:
+        if own_client:
+            await client.aclose()
@@ -6,10 +6,17 @@ Documentation: https://docs.akool.com/ai-tools-suite/faceswap
 import requests
 import time
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from urllib.parse import urljoin
 
+from utils.hedged_upload import DEFAULT_HEDGE_SECONDS, hedged_upload
+from utils.http_session import create_session, get_session
+from utils.multipart import MultipartFileStream, upload_progress_reporter
+from utils.rate_limit import get_key_limiter
+
 
 class AkoolAPIError(Exception):
     """Akool API error with code and message"""
@@ -44,10 +51,18 @@ class AkoolClient:
     STATUS_SUCCESS = 2      # Completed
     STATUS_FAILED = 3       # Failed
 
+    # API error codes meaning the key itself was refused (invalid or expired
+    # token, missing authorization, banned account) - retrying cannot succeed
+    AUTH_ERROR_CODES = (1101, 1102, 1200)
+
     def __init__(self, api_key: str, timeout: int = 30):
         """
         Initialize Akool client
 
+        The client is safe to share between threads (see get_akool_client):
+        its pooled session is configured once here and never mutated.
+        Requests go through the process-wide rate limiter of the key.
+
         Args:
             api_key: Akool API Key (get from https://akool.com -> API -> API Credentials)
             timeout: Request timeout in seconds (default 30)
@@ -57,8 +72,8 @@ class AkoolClient:
 
         self.api_key = api_key
         self.timeout = timeout
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.limiter = get_key_limiter(api_key)
+        self.session = create_session(headers={
             "x-api-key": api_key,
             "Content-Type": "application/json"
         })
@@ -87,6 +102,7 @@ class AkoolClient:
         last_exception = None
         for attempt in range(retries):
             try:
+                self.limiter.acquire_request()
                 response = self.session.request(method, url, **kwargs)
                 response.raise_for_status()
 
@@ -143,6 +159,7 @@ class AkoolClient:
         url = urljoin(self.FACE_DETECT_URL, self.ENDPOINTS["face_detect"])
         kwargs = {'timeout': self.timeout, 'json': payload}
 
+        self.limiter.acquire_request()
         response = self.session.request("POST", url, **kwargs)
         response.raise_for_status()
 
@@ -182,6 +199,33 @@ class AkoolClient:
         Returns:
             Response with job_id and _id for tracking
 
+        Raises:
+            ValueError: If source_landmarks is not provided
+        """
+        payload = self.build_video_swap_payload(
+            source_face_url, target_video_url, source_landmarks, target_face_url,
+            target_landmarks, face_enhance, webhook_url
+        )
+
+        return self._request(
+            "POST",
+            self.ENDPOINTS["video_faceswap"],
+            json=payload
+        )
+
+    @staticmethod
+    def build_video_swap_payload(
+        source_face_url: str,
+        target_video_url: str,
+        source_landmarks: str = None,
+        target_face_url: Optional[str] = None,
+        target_landmarks: Optional[str] = None,
+        face_enhance: bool = True,
+        webhook_url: Optional[str] = None
+    ) -> dict:
+        """
+        Build the request body for swap_face_video (shared with AsyncAkoolClient)
+
         Raises:
             ValueError: If source_landmarks is not provided
         """
@@ -213,11 +257,7 @@ class AkoolClient:
         if webhook_url:
             payload["webhookUrl"] = webhook_url
 
-        return self._request(
-            "POST",
-            self.ENDPOINTS["video_faceswap"],
-            json=payload
-        )
+        return payload
 
     def get_result(self, job_id: str) -> dict:
         """
@@ -229,12 +269,74 @@ class AkoolClient:
         Returns:
             Result with status and output URL
         """
+        return self.get_results([job_id])
+
+    def get_results(self, job_ids: list) -> dict:
+        """
+        Get faceswap results for several jobs in one request
+
+        Args:
+            job_ids: Job IDs from swap_face_video responses
+
+        Returns:
+            Result with one item per known job (see parse_result_items)
+        """
         return self._request(
             "GET",
             self.ENDPOINTS["get_result"],
-            params={"_ids": job_id}
+            params={"_ids": ",".join(job_ids)}
         )
 
+    @staticmethod
+    def parse_result_items(result: dict) -> list:
+        """
+        Extract result items from a listbyids response
+
+        Args:
+            result: Response from get_result/get_results
+
+        Returns:
+            List of result item dicts (may be empty if processing has not started)
+        """
+        # Parse result - format: {"code": 1000, "data": {"result": [...]}}
+        result_data = result.get("data", {})
+
+        # Handle nested result structure
+        if isinstance(result_data, dict):
+            result_list = result_data.get("result", [])
+        else:
+            result_list = result_data if isinstance(result_data, list) else []
+
+        if isinstance(result_list, dict):
+            result_list = [result_list]
+        return [item for item in result_list if isinstance(item, dict)]
+
+    @classmethod
+    def parse_result_item(cls, item: dict) -> tuple:
+        """
+        Interpret a single result item
+
+        Args:
+            item: Result item from parse_result_items
+
+        Returns:
+            (status, video_url, error_message) - video_url is set only on success,
+            error_message only on failure
+        """
+        status = item.get("faceswap_status", cls.STATUS_PENDING)
+
+        if status == cls.STATUS_SUCCESS:
+            video_url = item.get("url") or item.get("video")
+            if video_url:
+                return cls.STATUS_SUCCESS, video_url, None
+            # Marked done but URL not populated yet - keep waiting
+            return cls.STATUS_PENDING, None, None
+
+        if status == cls.STATUS_FAILED:
+            return cls.STATUS_FAILED, None, item.get("alg_msg") or item.get("error", "Processing failed")
+
+        return status, None, None
+
     def get_credit_info(self) -> dict:
         """
         Get user credit balance information
@@ -249,16 +351,23 @@ class AkoolClient:
         job_id: str,
         timeout: int = 600,
         poll_interval: int = 5,
-        progress_callback=None
+        progress_callback=None,
+        policy=None
     ) -> str:
         """
         Wait for video processing to complete
 
+        Polls this single job. When several jobs are in flight, use
+        utils.akool_poller.get_poller() instead so all of them share one
+        batched request per interval.
+
         Args:
             job_id: Job ID from swap_face_video response
             timeout: Maximum wait time in seconds (default 10 minutes)
             poll_interval: Polling interval in seconds
             progress_callback: Optional callback function(status, message)
+            policy: Optional utils.poll_policy.PollingPolicy; overrides
+                poll_interval and timeout with an adaptive schedule
 
         Returns:
             Result video URL
@@ -267,49 +376,67 @@ class AkoolClient:
             TimeoutError: If processing exceeds timeout
             AkoolAPIError: If processing fails
         """
-        start_time = time.time()
+        if policy is not None:
+            timeout = policy.timeout
 
-        while time.time() - start_time < timeout:
-            result = self.get_result(job_id)
+        def sleep(elapsed):
+            time.sleep(policy.next_interval(elapsed) if policy is not None else poll_interval)
 
-            # Parse result - format: {"code": 1000, "data": {"result": [...]}}
-            result_data = result.get("data", {})
+        start_time = time.time()
 
-            # Handle nested result structure
-            if isinstance(result_data, dict):
-                result_list = result_data.get("result", [])
-            else:
-                result_list = result_data if isinstance(result_data, list) else []
+        while time.time() - start_time < timeout:
+            result_list = self.parse_result_items(self.get_result(job_id))
 
             if not result_list:
                 if progress_callback:
                     progress_callback(self.STATUS_PENDING, "Waiting for processing to start...")
-                time.sleep(poll_interval)
+                sleep(time.time() - start_time)
                 continue
 
-            item = result_list[0] if isinstance(result_list, list) else result_list
-            status = item.get("faceswap_status", self.STATUS_PENDING)
+            status, video_url, error_msg = self.parse_result_item(result_list[0])
 
             if status == self.STATUS_SUCCESS:
-                video_url = item.get("url") or item.get("video")
-                if video_url:
-                    if progress_callback:
-                        progress_callback(self.STATUS_SUCCESS, "Processing complete!")
-                    return video_url
+                if progress_callback:
+                    progress_callback(self.STATUS_SUCCESS, "Processing complete!")
+                return video_url
 
             elif status == self.STATUS_FAILED:
-                error_msg = item.get("alg_msg") or item.get("error", "Processing failed")
                 raise AkoolAPIError(status, error_msg)
 
             # Still processing
             if progress_callback:
                 progress_callback(self.STATUS_PENDING, f"Processing video... (status: {status})")
 
-            time.sleep(poll_interval)
+            sleep(time.time() - start_time)
 
         raise TimeoutError(f"Video processing timed out after {timeout} seconds")
 
 
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_akool_client(api_key: str) -> AkoolClient:
+    """
+    Get the process-wide client for an API key
+
+    All jobs and the shared poller use the same client, so requests reuse
+    its pooled keep-alive connections instead of opening new ones.
+
+    Args:
+        api_key: Akool API Key
+
+    Returns:
+        Shared AkoolClient instance
+    """
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = AkoolClient(api_key)
+            _clients[api_key] = client
+        return client
+
+
 def upload_to_temp_hosting(file_path: str) -> str:
     """
     Upload local file to temporary hosting for API access
@@ -327,52 +454,74 @@ def upload_to_temp_hosting(file_path: str) -> str:
         In production, you should use your own cloud storage (S3, GCS, OSS, etc.)
         This uses tmpfiles.org which keeps files for 1 hour minimum.
     """
-    # Try multiple hosting services for reliability
-    hosting_services = [
-        _upload_to_tmpfiles,
-        _upload_to_fileio,
-    ]
-
-    last_error = None
-    for upload_func in hosting_services:
-        try:
-            return upload_func(file_path)
-        except Exception as e:
-            last_error = e
-            continue
+    return upload_with_expiry(file_path)[0]
+
+
+def upload_with_expiry(file_path: str, progress_callback=None, hedge_after: float = DEFAULT_HEDGE_SECONDS) -> tuple:
+    """
+    Upload local file to temporary hosting and report how long the URL lives
+
+    Services are raced rather than tried one by one: if the healthiest
+    service stalls for hedge_after seconds the next one starts in parallel
+    and the first to finish wins (see utils.hedged_upload).
+
+    Args:
+        file_path: Local file path
+        progress_callback: Optional callback(bytes_sent, total_bytes)
+        hedge_after: Seconds without progress before hedging (0 = sequential)
+
+    Returns:
+        (url, expires_at) - expires_at is a Unix timestamp, or None when the
+        URL is single-use (file.io deletes the file after the first download)
+    """
+    _, url, lifetime = hedged_upload(file_path, HOSTING_SERVICES, hedge_after, progress_callback)
+    uploaded_at = time.time()
+    return url, (uploaded_at + lifetime if lifetime else None)
+
 
-    raise Exception(f"Failed to upload file to any hosting service: {last_error}")
+# (connect, read) timeouts for hosting uploads. The connect timeout also
+# bounds each socket write, so a stalled upload fails instead of hanging.
+UPLOAD_TIMEOUT = (10, 120)
 
 
-def _upload_to_tmpfiles(file_path: str) -> str:
+def _upload_to_tmpfiles(file_path: str, progress_callback=None, cancel_event=None) -> str:
     """Upload to tmpfiles.org (files kept for 1 hour minimum)"""
-    with open(file_path, 'rb') as f:
-        response = requests.post(
+    with MultipartFileStream(file_path, progress_callback=progress_callback, cancel_event=cancel_event) as body:
+        response = get_session("uploads").post(
             'https://tmpfiles.org/api/v1/upload',
-            files={'file': f}
+            data=body,
+            headers={'Content-Type': body.content_type},
+            timeout=UPLOAD_TIMEOUT
         )
 
-    if response.status_code == 200:
-        data = response.json()
-        if data.get('status') == 'success':
-            # Convert view URL to direct download URL
-            # tmpfiles.org returns: https://tmpfiles.org/1234/file.mp4
-            # We need: https://tmpfiles.org/dl/1234/file.mp4
-            view_url = data.get('data', {}).get('url', '')
-            if view_url:
-                direct_url = view_url.replace('tmpfiles.org/', 'tmpfiles.org/dl/')
-                return direct_url
+    direct_url = _tmpfiles_direct_url(response.json()) if response.status_code == 200 else None
+    if direct_url:
+        return direct_url
 
     raise Exception(f"tmpfiles.org upload failed: {response.text}")
 
 
-def _upload_to_fileio(file_path: str) -> str:
+def _tmpfiles_direct_url(data: dict) -> Optional[str]:
+    """Direct download URL from a tmpfiles.org upload response (None on failure)"""
+    if data.get('status') == 'success':
+        # Convert view URL to direct download URL
+        # tmpfiles.org returns: https://tmpfiles.org/1234/file.mp4
+        # We need: https://tmpfiles.org/dl/1234/file.mp4
+        view_url = data.get('data', {}).get('url', '')
+        if view_url:
+            return view_url.replace('tmpfiles.org/', 'tmpfiles.org/dl/')
+    return None
+
+
+def _upload_to_fileio(file_path: str, progress_callback=None, cancel_event=None) -> str:
     """Upload to file.io (backup option, files deleted after download)"""
-    with open(file_path, 'rb') as f:
-        response = requests.post(
+    with MultipartFileStream(file_path, fields={'expires': '1d'}, progress_callback=progress_callback,
+                             cancel_event=cancel_event) as body:
+        response = get_session("uploads").post(
             'https://file.io',
-            files={'file': f},
-            data={'expires': '1d'}
+            data=body,
+            headers={'Content-Type': body.content_type},
+            timeout=UPLOAD_TIMEOUT
         )
 
     if response.status_code == 200:
@@ -383,12 +532,127 @@ def _upload_to_fileio(file_path: str) -> str:
     raise Exception(f"file.io upload failed: {response.text}")
 
 
+def parse_face_landmarks(detect_result: dict) -> tuple:
+    """
+    Extract the first face from a detect_faces response
+
+    Args:
+        detect_result: Response from AkoolClient.detect_faces
+
+    Returns:
+        (landmarks, region) - landmarks in the "x1,y1:x2,y2:..." format expected
+        by swap_face_video, region as returned by the API (may be None)
+    """
+    # Parse faces from response
+    # Format: {"error_code": 0, "faces_obj": {"0": {"landmarks": [[[x,y],...]], "region": [...]}}}
+    faces_obj = detect_result.get("faces_obj", {})
+    if not faces_obj:
+        raise ValueError("No face detected in the source image. Please use a clear face photo.")
+
+    # Get first frame's face data (key "0" for images)
+    first_frame_key = list(faces_obj.keys())[0]
+    first_frame = faces_obj[first_frame_key]
+
+    # Get landmarks array - format: [[[x1,y1], [x2,y2], ...]]
+    landmarks_list = first_frame.get("landmarks", [])
+    if not landmarks_list or not landmarks_list[0]:
+        raise ValueError("Failed to get face landmarks. Please use a different photo.")
+
+    # Convert landmarks to string format: "x1,y1:x2,y2:x3,y3:x4,y4:x5,y5"
+    landmarks = landmarks_list[0]  # Get first face's landmarks
+    source_landmarks = ":".join([f"{int(p[0])},{int(p[1])}" for p in landmarks])
+
+    regions = first_frame.get("region") or [None]
+    return source_landmarks, regions[0]
+
+
+def forget_uploads(*file_paths):
+    """
+    Drop the upload cache entries of files Akool rejected or failed to fetch,
+    so the next attempt uploads them again instead of reusing a dead URL
+    """
+    from utils.upload_cache import invalidate_upload
+
+    for file_path in file_paths:
+        invalidate_upload(file_path)
+
+
+def detect_face_landmarks(client: AkoolClient, face_image_path: str, face_url: str) -> str:
+    """
+    Get source landmarks for a face image, using the landmark cache when possible
+
+    Args:
+        client: Akool client for the detect endpoint
+        face_image_path: Local path of the image (its content hash is the cache key)
+        face_url: Public URL of the same image (only used on a cache miss)
+
+    Returns:
+        Landmarks string for swap_face_video
+    """
+    from utils.landmark_cache import get_landmark_cache
+    from utils.file_handler import file_sha256
+
+    cache = get_landmark_cache()
+    image_hash = file_sha256(face_image_path)
+
+    cached = cache.get(image_hash)
+    if cached:
+        return cached["landmarks"]
+
+    try:
+        detect_result = client.detect_faces(face_url, "image")
+    except AkoolAPIError as e:
+        # The URL may be gone from the host: upload afresh on the next attempt
+        forget_uploads(face_image_path)
+        raise Exception(f"Face detection failed: {e.message}")
+
+    landmarks, region = parse_face_landmarks(detect_result)
+    cache.put(image_hash, landmarks, region)
+    return landmarks
+
+
+def prefetch_face_landmarks(face_image_path: str, api_key: str = None) -> str:
+    """
+    Upload a face image and detect its landmarks ahead of a swap
+
+    Both results are cached, so a later swap_face_akool with the same image
+    skips the upload and the detect call.
+
+    Args:
+        face_image_path: Local path to face image
+        api_key: Akool API Key (or set AKOOL_API_KEY env var)
+
+    Returns:
+        Landmarks string
+    """
+    from utils.upload_cache import cached_upload
+
+    api_key = api_key or os.getenv("AKOOL_API_KEY")
+    if not api_key:
+        raise ValueError("Akool API Key is required. Set AKOOL_API_KEY env var or pass api_key parameter")
+
+    return detect_face_landmarks(get_akool_client(api_key), face_image_path, cached_upload(face_image_path))
+
+
+# Hosting services raced by upload_with_expiry: (name, upload function, URL lifetime in seconds)
+# A lifetime of None means the URL cannot be reused. The list order is only
+# the initial preference; hedged_upload reorders by recent health.
+HOSTING_SERVICES = [
+    ("tmpfiles", _upload_to_tmpfiles, 3600),    # tmpfiles.org keeps files for 1 hour minimum
+    ("fileio", _upload_to_fileio, None),        # file.io deletes after the first download
+]
+
+
 def swap_face_akool(
     face_image_path: str,
     video_path: str,
     api_key: str = None,
     face_enhance: bool = True,
-    progress_callback=None
+    progress_callback=None,
+    stage_callback=None,
+    polling_policy=None,
+    webhook_url: Optional[str] = None,
+    wait: bool = True
 ) -> str:
     """
     High-level function to swap face in video using Akool API
@@ -399,9 +663,19 @@ def swap_face_akool(
         api_key: Akool API Key (or set AKOOL_API_KEY env var)
         face_enhance: Enable face enhancement for better quality
         progress_callback: Optional callback for progress updates
+        stage_callback: Optional callback(stage, data) invoked after each stage
+            ("detected", "uploaded", "submitted") with the values needed to
+            resume the job later (landmarks, uploaded URLs, Akool job ID) and
+            per-stage timings in seconds under "timings"
+        polling_policy: Optional PollingPolicy for the result wait
+            (default: fixed 5 s interval, 10 minute timeout)
+        webhook_url: Optional callback URL; Akool POSTs the result there
+            (see utils.webhook_server) and polling only acts as a fallback
+        wait: Wait for the result (False: return the Akool job ID right
+            after submission; the concurrent-job slot is released then)
 
     Returns:
-        URL of the result video
+        URL of the result video (the Akool job ID when wait is False)
 
     Example:
         result_url = swap_face_akool(
@@ -421,72 +695,107 @@ def swap_face_akool(
     if not api_key:
         raise ValueError("Akool API Key is required. Set AKOOL_API_KEY env var or pass api_key parameter")
 
-    # Initialize client
-    client = AkoolClient(api_key)
+    # Shared per-key client: connections stay open across jobs
+    client = get_akool_client(api_key)
 
-    # Step 1: Upload files to get public URLs
-    if progress_callback:
-        progress_callback(0, "Uploading face image...")
-    face_url = upload_to_temp_hosting(face_image_path)
+    # Step 1+2: Upload files to get public URLs (reused while a previous upload of
+    # the same content is still hosted) and detect face landmarks (REQUIRED by API).
+    # Face upload and detection only need the image, so they run while the much
+    # larger video is still uploading.
+    from utils.upload_cache import cached_upload
 
-    if progress_callback:
-        progress_callback(1, "Uploading video...")
-    video_url = upload_to_temp_hosting(video_path)
+    timings = {}
+    stage_start = time.time()
+
+    def timed(name, func, *args):
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            timings[name] = round(time.time() - start, 2)
 
-    # Step 2: Detect face landmarks (REQUIRED by API)
     if progress_callback:
-        progress_callback(1, "Detecting face landmarks...")
+        progress_callback(0, "Uploading face image and video...")
 
+    video_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="akool-video-upload")
     try:
-        detect_result = client.detect_faces(face_url, "image")
-
-        # Parse faces from response
-        # Format: {"error_code": 0, "faces_obj": {"0": {"landmarks": [[[x,y],...]], "region": [...]}}}
-        faces_obj = detect_result.get("faces_obj", {})
-        if not faces_obj:
-            raise Exception("No face detected in the source image. Please use a clear face photo.")
+        video_future = video_pool.submit(
+            timed, "video_upload", cached_upload, video_path,
+            upload_progress_reporter(progress_callback, "Uploading video")
+        )
 
-        # Get first frame's face data (key "0" for images)
-        first_frame_key = list(faces_obj.keys())[0]
-        first_frame = faces_obj[first_frame_key]
+        face_url = timed("face_upload", cached_upload, face_image_path)
 
-        # Get landmarks array - format: [[[x1,y1], [x2,y2], ...]]
-        landmarks_list = first_frame.get("landmarks", [])
-        if not landmarks_list or not landmarks_list[0]:
-            raise Exception("Failed to get face landmarks. Please use a different photo.")
+        if progress_callback:
+            progress_callback(1, "Detecting face landmarks...")
+        source_landmarks = timed("face_detect", detect_face_landmarks, client, face_image_path, face_url)
 
-        # Convert landmarks to string format: "x1,y1:x2,y2:x3,y3:x4,y4:x5,y5"
-        landmarks = landmarks_list[0]  # Get first face's landmarks
-        source_landmarks = ":".join([f"{int(p[0])},{int(p[1])}" for p in landmarks])
+        if stage_callback:
+            stage_callback("detected", {"landmarks": source_landmarks})
 
-    except AkoolAPIError as e:
-        raise Exception(f"Face detection failed: {e.message}")
+        video_url = video_future.result()
+    finally:
+        # Don't block on a long video upload when the face side already failed
+        video_pool.shutdown(wait=False)
 
-    # Step 3: Submit video face swap job
-    if progress_callback:
-        progress_callback(1, "Starting face swap processing...")
+    timings["prepare_total"] = round(time.time() - stage_start, 2)
 
-    result = client.swap_face_video(
-        source_face_url=face_url,
-        target_video_url=video_url,
-        source_landmarks=source_landmarks,
-        face_enhance=face_enhance
-    )
+    if stage_callback:
+        stage_callback("uploaded", {"face_url": face_url, "video_url": video_url, "timings": timings})
 
-    job_id = result.get("data", {}).get("_id")
-    if not job_id:
-        raise AkoolAPIError(-1, "No job ID returned from API")
+    # Step 3+4: Submit and wait while holding one of the key's concurrent-job
+    # slots; when all are taken the job queues here instead of being rejected
+    def queued(position):
+        if progress_callback:
+            progress_callback(1, f"Waiting for a free processing slot ({position} in queue)...")
 
-    # Step 4: Wait for processing to complete
-    def internal_callback(status, message):
+    with client.limiter.job_slot(on_queued=queued):
+        # Step 3: Submit video face swap job
+        submit_start = time.time()
         if progress_callback:
-            progress_callback(status, message)
-
-    result_url = client.wait_for_result(
-        job_id=job_id,
-        timeout=600,  # 10 minutes
-        poll_interval=5,
-        progress_callback=internal_callback
-    )
+            progress_callback(1, "Starting face swap processing...")
+
+        try:
+            result = client.swap_face_video(
+                source_face_url=face_url,
+                target_video_url=video_url,
+                source_landmarks=source_landmarks,
+                face_enhance=face_enhance,
+                webhook_url=webhook_url
+            )
+        except AkoolAPIError:
+            forget_uploads(face_image_path, video_path)
+            raise
+
+        job_id = result.get("data", {}).get("_id")
+        if not job_id:
+            raise AkoolAPIError(-1, "No job ID returned from API")
+
+        timings["submit"] = round(time.time() - submit_start, 2)
+
+        if stage_callback:
+            stage_callback("submitted", {"akool_id": job_id, "timings": timings})
+
+        if not wait:
+            return job_id
+
+        # Step 4: Wait for processing to complete
+        def internal_callback(status, message):
+            if progress_callback:
+                progress_callback(status, message)
+
+        # Shared per-key poller: all in-flight jobs are checked in one request per tick
+        from utils.akool_poller import get_poller
+
+        try:
+            result_url = get_poller(client.api_key).wait(
+                job_id=job_id,
+                progress_callback=internal_callback,
+                policy=polling_policy
+            )
+        except AkoolAPIError:
+            # A failed job may mean Akool could not download the inputs
+            forget_uploads(face_image_path, video_path)
+            raise
 
     return result_url
@@ -0,0 +1,208 @@
+"""
+Pool of Akool API keys
+
+One account caps throughput by its credit balance and concurrency limit.
+With several keys configured (AKOOL_API_KEYS) every job leases the key
+with the most headroom:
+
+- fewest jobs in flight relative to the key's concurrent-job limit
+- then the largest cached credit balance (get_credit_info, refreshed
+  every AKOOL_CREDIT_REFRESH_SECONDS)
+
+Each lease subtracts the job's estimated credits from the cached balance,
+so the balance is only re-fetched when it is older than the refresh
+interval or Akool rejects a job for lack of credit. Keys whose balance
+cannot cover a job, or falls below AKOOL_MIN_CREDIT, are drained: they
+finish their in-flight jobs but get no new ones until a refresh shows a
+topped-up balance. Jobs record the key's fingerprint
+(never the key itself) so a resumed job keeps polling the account that
+owns it.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from config import AKOOL_API_KEYS, AKOOL_CREDIT_REFRESH_SECONDS, AKOOL_MIN_CREDIT
+from utils.akool_client import AkoolAPIError, get_akool_client
+from utils.rate_limit import get_key_limiter
+
+# Akool bills 10 credits per 10 seconds of video
+CREDITS_PER_SECOND = 1.0
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Stable, non-secret identifier of an API key (safe to store and log)"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def is_credit_error(error: Exception) -> bool:
+    """Whether Akool rejected a request because the account is out of credit"""
+    if not isinstance(error, AkoolAPIError):
+        return False
+    message = str(error.message).lower()
+    return "credit" in message or "balance" in message
+
+
+def credits_for(video_info: dict) -> float:
+    """Estimated credits a job needs (0 when the duration is unknown)"""
+    duration = (video_info or {}).get("duration") or 0
+    return math.ceil(duration) * CREDITS_PER_SECOND
+
+
+class KeyPool:
+    """Routes jobs across several Akool API keys"""
+
+    def __init__(
+        self,
+        api_keys: list,
+        refresh_seconds: float = AKOOL_CREDIT_REFRESH_SECONDS,
+        min_credit: float = AKOOL_MIN_CREDIT
+    ):
+        """
+        Args:
+            api_keys: Akool API keys (duplicates are ignored)
+            refresh_seconds: How long a fetched credit balance is trusted
+            min_credit: Keys below this balance get no new jobs
+        """
+        self.keys = {key_fingerprint(key): key for key in api_keys}
+        self.refresh_seconds = refresh_seconds
+        self.min_credit = min_credit
+        # fingerprint -> [credit or None, fetched_at]; credit is reduced
+        # locally by every lease so parallel routing sees the spend
+        self._credits = {fingerprint: [None, 0.0] for fingerprint in self.keys}
+        self._in_flight = {fingerprint: 0 for fingerprint in self.keys}
+        self._lock = threading.Lock()
+        # Held while fetching balances so concurrent leases share one fetch per key
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_key(self, fingerprint: str) -> str:
+        """
+        Look up a key by fingerprint (for resuming jobs)
+
+        Raises:
+            KeyError: If the key is no longer configured
+        """
+        try:
+            return self.keys[fingerprint]
+        except KeyError:
+            raise KeyError(f"Akool API key {fingerprint} is no longer configured") from None
+
+    @contextmanager
+    def lease(self, video_info: dict = None, fingerprint: str = None):
+        """
+        Pick a key for one job and count the job against it until the block exits
+
+        Args:
+            video_info: Video metadata, used to estimate the credits needed
+            fingerprint: Use this key instead of choosing (resumed jobs);
+                skips the credit check since the job is already paid for
+
+        Yields:
+            str: The API key
+
+        Raises:
+            AkoolAPIError: If every key is drained
+        """
+        needed = credits_for(video_info) if fingerprint is None else 0
+        if fingerprint is None:
+            self._refresh_stale()
+            fingerprint = self._choose(needed)
+        else:
+            self.get_key(fingerprint)
+            with self._lock:
+                self._in_flight[fingerprint] += 1
+
+        try:
+            yield self.keys[fingerprint]
+        except AkoolAPIError as e:
+            if is_credit_error(e):
+                # The local estimate was too optimistic: fetch the real balance before the next job
+                with self._lock:
+                    self._credits[fingerprint][1] = 0.0
+            raise
+        finally:
+            with self._lock:
+                self._in_flight[fingerprint] -= 1
+
+    def _choose(self, needed: float) -> str:
+        with self._lock:
+            candidates = []
+            for fingerprint in self.keys:
+                credit = self._credits[fingerprint][0]
+                # Unknown balance (e.g. credit endpoint failing) is not a reason to drain
+                if credit is not None and (credit < self.min_credit or credit < needed):
+                    continue
+                limit = get_key_limiter(self.keys[fingerprint]).jobs.max_jobs
+                in_flight = self._in_flight[fingerprint]
+                free = limit - in_flight if limit else -in_flight
+                candidates.append((free, credit if credit is not None else 0, fingerprint))
+
+            if not candidates:
+                raise AkoolAPIError(-1, "All Akool API keys are out of credit")
+
+            fingerprint = max(candidates)[2]
+            self._in_flight[fingerprint] += 1
+            if self._credits[fingerprint][0] is not None:
+                self._credits[fingerprint][0] -= needed
+            return fingerprint
+
+    def _refresh_stale(self):
+        """
+        Re-fetch balances older than refresh_seconds
+
+        Single-flight: callers arriving during a refresh wait for it and then
+        find the balances fresh, so each stale key is fetched once. Routing
+        (which only needs self._lock) is not blocked by the requests.
+        """
+        with self._refresh_lock:
+            now = time.time()
+            with self._lock:
+                stale = [fp for fp, (_, fetched_at) in self._credits.items()
+                         if now - fetched_at > self.refresh_seconds]
+
+            for fingerprint in stale:
+                try:
+                    data = get_akool_client(self.keys[fingerprint]).get_credit_info()
+                    credit = float(data.get("data", {}).get("credit"))
+                except Exception as e:
+                    print(f"Failed to fetch credit of Akool key {fingerprint}: {e}")
+                    credit = None
+                with self._lock:
+                    self._credits[fingerprint] = [credit, now]
+
+    def status(self) -> list:
+        """
+        Per-key state for display
+
+        Returns:
+            list: [{"fingerprint", "credit", "in_flight", "drained"}, ...]
+        """
+        with self._lock:
+            return [
+                {
+                    "fingerprint": fingerprint,
+                    "credit": credit,
+                    "in_flight": self._in_flight[fingerprint],
+                    "drained": credit is not None and credit < self.min_credit,
+                }
+                for fingerprint, (credit, _) in self._credits.items()
+            ]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool() -> KeyPool:
+    """Get the process-wide pool of the configured keys"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = KeyPool(AKOOL_API_KEYS)
+        return _pool
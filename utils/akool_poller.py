@@ -0,0 +1,337 @@
+"""
+Shared batched result poller for Akool face swap jobs
+
+Instead of one wait_for_result loop (and one HTTP request) per job, every
+outstanding job ID for an API key is checked with a single listbyids request
+per tick and the results are fanned out to the waiting threads.
+"""
+
+import re
+import threading
+import time
+from typing import Optional
+
+import requests
+
+from utils.akool_client import AkoolClient, AkoolAPIError, get_akool_client
+from utils.poll_policy import PollingPolicy
+
+
+class _Waiter:
+    """A thread blocked in AkoolPoller.wait() for one job"""
+
+    def __init__(self, job_id: str, policy: PollingPolicy, elapsed: float = 0, progress_callback=None):
+        self.job_id = job_id
+        self.policy = policy
+        self.progress_callback = progress_callback
+        self.event = threading.Event()
+        self.video_url = None
+        self.error = None
+        # Jobs resumed after a restart were submitted earlier than now
+        self.submitted_at = time.time() - elapsed
+        self.next_poll = time.time() + policy.next_interval(elapsed)
+
+    def schedule_next(self, now: float):
+        self.next_poll = now + self.policy.next_interval(now - self.submitted_at)
+
+    def finish(self, video_url: str = None, error: Exception = None):
+        self.video_url = video_url
+        self.error = error
+        self.event.set()
+
+    def notify(self, status: int, message: str):
+        if self.progress_callback:
+            try:
+                self.progress_callback(status, message)
+            except Exception:
+                # A broken callback must not stop the poller for everyone else
+                pass
+
+
+class AkoolPoller:
+    """
+    Batched poller for one Akool API key
+
+    Each waiter has its own PollingPolicy. A background thread sleeps until
+    the earliest waiter is due, then requests the status of all pending job
+    IDs at once (in chunks of MAX_IDS_PER_REQUEST) - jobs that are not due
+    yet ride along for free - and wakes the waiters whose jobs finished.
+    """
+
+    # Keep the query string well below common URL length limits
+    MAX_IDS_PER_REQUEST = 50
+
+    # After a failed listbyids request, wait before the next one (doubling per
+    # consecutive failure) so a rate-limited or struggling API is not hammered
+    RETRY_BACKOFF_SECONDS = 2
+    MAX_RETRY_BACKOFF_SECONDS = 60
+
+    def __init__(self, client: AkoolClient, poll_interval: float = 5):
+        """
+        Initialize poller
+
+        Args:
+            client: Akool client used for listbyids requests
+            poll_interval: Fixed interval for waiters registered without a policy
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self._waiters = {}  # job_id -> list of _Waiter
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+        self._failures = 0
+        self._retry_at = 0.0
+        self.requests_sent = 0
+
+    def wait(
+        self,
+        job_id: str,
+        timeout: float = None,
+        progress_callback=None,
+        policy: PollingPolicy = None,
+        elapsed: float = 0
+    ) -> str:
+        """
+        Block until the job finishes
+
+        Args:
+            job_id: Job ID from swap_face_video response
+            timeout: Maximum wait time in seconds (default policy.timeout)
+            progress_callback: Optional callback function(status, message),
+                called from the poller thread
+            policy: Polling schedule for this job (default: fixed poll_interval)
+            elapsed: Seconds since the job was submitted (when resuming)
+
+        Returns:
+            Result video URL
+
+        Raises:
+            TimeoutError: If processing exceeds timeout
+            AkoolAPIError: If processing fails
+        """
+        policy = policy or PollingPolicy.fixed(self.poll_interval, timeout=timeout or 600)
+        # A resumed job past its deadline still gets a couple of polls before giving up
+        timeout = max((timeout or policy.timeout) - elapsed, policy.max_interval * 2)
+
+        waiter = _Waiter(job_id, policy, elapsed, progress_callback)
+        self._add(waiter)
+
+        try:
+            if not waiter.event.wait(timeout):
+                raise TimeoutError(f"Video processing timed out after {timeout} seconds")
+        finally:
+            self._remove(waiter)
+
+        if waiter.error:
+            raise waiter.error
+        return waiter.video_url
+
+    def deliver(self, job_id: str, status: int, video_url: str = None, error_msg: str = None) -> bool:
+        """
+        Push a job result received out of band (e.g. from the webhook receiver)
+
+        Args:
+            job_id: Akool job ID (_id)
+            status: STATUS_SUCCESS / STATUS_FAILED (other values only report progress)
+            video_url: Result video URL on success
+            error_msg: Error message on failure
+
+        Returns:
+            True if a waiter for this job was woken
+        """
+        with self._lock:
+            has_waiters = bool(self._waiters.get(job_id))
+
+        if has_waiters:
+            self._dispatch(job_id, status, video_url, error_msg, f"Processing video... (status: {status})")
+        return has_waiters
+
+    def pending_ids(self) -> list:
+        """Job IDs currently being waited on"""
+        with self._lock:
+            return list(self._waiters)
+
+    def _add(self, waiter: _Waiter):
+        early = _pop_early_result(waiter.job_id)
+        if early:
+            _, status, video_url, error_msg = early
+            if status == AkoolClient.STATUS_SUCCESS:
+                waiter.finish(video_url=video_url)
+            else:
+                waiter.finish(error=AkoolAPIError(status, error_msg))
+            return
+
+        with self._lock:
+            self._waiters.setdefault(waiter.job_id, []).append(waiter)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="akool-poller", daemon=True)
+                self._thread.start()
+            self._changed.notify()
+
+    def _remove(self, waiter: _Waiter):
+        with self._lock:
+            waiters = self._waiters.get(waiter.job_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop(waiter.job_id, None)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._thread = None
+                    return
+
+                now = time.time()
+                next_poll = min(w.next_poll for waiters in self._waiters.values() for w in waiters)
+                # While backing off, due waiters wait for the retry as well
+                next_poll = max(next_poll, self._retry_at)
+                if next_poll > now:
+                    # Woken early when a new waiter registers with a sooner deadline
+                    self._changed.wait(next_poll - now)
+                    continue
+                job_ids = list(self._waiters)
+
+            for start in range(0, len(job_ids), self.MAX_IDS_PER_REQUEST):
+                if self._retry_at > time.time():
+                    # An earlier chunk failed - the rest are retried after the backoff
+                    break
+                self._poll_batch(job_ids[start:start + self.MAX_IDS_PER_REQUEST])
+
+            with self._lock:
+                now = time.time()
+                for waiters in self._waiters.values():
+                    for waiter in waiters:
+                        if waiter.next_poll <= now:
+                            waiter.schedule_next(now)
+
+    def _poll_batch(self, job_ids: list):
+        try:
+            self.requests_sent += 1
+            items = self.client.parse_result_items(self.client.get_results(job_ids))
+        except Exception as e:
+            if _is_auth_error(e):
+                # The key itself was refused (invalid or revoked) - polling again cannot
+                # succeed, so fail the waiters now instead of at their timeout
+                self._fail_waiters(job_ids, e)
+                return
+
+            words = set(re.findall(r"\w+", str(e.message))) if isinstance(e, AkoolAPIError) else set()
+            bad_ids = [job_id for job_id in job_ids if job_id in words]
+            if bad_ids:
+                # The error names specific jobs: fail only those and poll the rest
+                self._fail_waiters(bad_ids, e)
+                rest = [job_id for job_id in job_ids if job_id not in bad_ids]
+                if rest:
+                    self._poll_batch(rest)
+                return
+
+            # Anything else (network, rate limit, server error, other API codes) may
+            # clear up - the jobs are already paid for, so keep them pending and retry
+            self._failures += 1
+            backoff = min(self.RETRY_BACKOFF_SECONDS * 2 ** (self._failures - 1), self.MAX_RETRY_BACKOFF_SECONDS)
+            self._retry_at = time.time() + backoff
+            print(f"Akool result poll failed ({e}), retrying in {backoff:.0f}s")
+            return
+
+        self._failures = 0
+        self._retry_at = 0.0
+        by_id = {item.get("_id"): item for item in items}
+        for job_id in job_ids:
+            item = by_id.get(job_id)
+            if item is None:
+                self._dispatch(job_id, AkoolClient.STATUS_PENDING, None, None,
+                               "Waiting for processing to start...")
+                continue
+
+            status, video_url, error_msg = self.client.parse_result_item(item)
+            self._dispatch(job_id, status, video_url, error_msg, f"Processing video... (status: {status})")
+
+    def _fail_waiters(self, job_ids: list, error: Exception):
+        with self._lock:
+            waiters = [w for job_id in job_ids for w in self._waiters.get(job_id, [])]
+        for waiter in waiters:
+            waiter.finish(error=error)
+
+    def _dispatch(self, job_id: str, status: int, video_url: Optional[str], error_msg: Optional[str],
+                  pending_message: str):
+        with self._lock:
+            waiters = list(self._waiters.get(job_id, []))
+
+        for waiter in waiters:
+            if status == AkoolClient.STATUS_SUCCESS:
+                waiter.notify(status, "Processing complete!")
+                waiter.finish(video_url=video_url)
+            elif status == AkoolClient.STATUS_FAILED:
+                waiter.finish(error=AkoolAPIError(status, error_msg))
+            else:
+                waiter.notify(status, pending_message)
+
+
+def _is_auth_error(error: Exception) -> bool:
+    """Whether a listbyids failure means the key was refused (Akool auth code or HTTP 401/403)"""
+    if isinstance(error, AkoolAPIError):
+        return error.code in AkoolClient.AUTH_ERROR_CODES
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.HTTPError) and response is not None and response.status_code in (401, 403)
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+# Webhook results that arrived before anyone called wait() for the job
+# job_id -> (received_at, status, video_url, error_msg)
+_early_results = {}
+_early_results_lock = threading.Lock()
+EARLY_RESULT_TTL = 3600
+
+
+def _pop_early_result(job_id: str) -> Optional[tuple]:
+    with _early_results_lock:
+        return _early_results.pop(job_id, None)
+
+
+def get_poller(api_key: str) -> AkoolPoller:
+    """
+    Get the process-wide poller for an API key
+
+    Args:
+        api_key: Akool API Key
+
+    Returns:
+        Shared AkoolPoller instance
+    """
+    with _pollers_lock:
+        poller = _pollers.get(api_key)
+        if poller is None:
+            poller = AkoolPoller(get_akool_client(api_key))
+            _pollers[api_key] = poller
+        return poller
+
+
+def deliver_result(job_id: str, status: int, video_url: str = None, error_msg: str = None):
+    """
+    Deliver an out-of-band job result to whichever poller is tracking the job
+
+    Args:
+        job_id: Akool job ID (_id)
+        status: AkoolClient.STATUS_* value
+        video_url: Result video URL on success
+        error_msg: Error message on failure
+    """
+    with _pollers_lock:
+        pollers = list(_pollers.values())
+
+    for poller in pollers:
+        if poller.deliver(job_id, status, video_url, error_msg):
+            return
+
+    if status in (AkoolClient.STATUS_SUCCESS, AkoolClient.STATUS_FAILED):
+        # The callback can beat swap_face_akool to wait(); keep it for the first waiter
+        now = time.time()
+        with _early_results_lock:
+            _early_results[job_id] = (now, status, video_url, error_msg)
+            for expired in [k for k, v in _early_results.items() if v[0] < now - EARLY_RESULT_TTL]:
+                del _early_results[expired]
@@ -0,0 +1,611 @@
+"""
+换脸后端注册表
+每个换脸 API 实现为一个 FaceSwapBackend，对外提供相同的接口
+（提交、查询、取消、预估成本、能力和并发上限），swap_face 和页面按名称取用，
+不再针对具体模型写分支。新增后端只需实现 submit/poll 并调用 register_backend()
+"""
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+
+import requests
+
+from config import (
+    API_CONFIGS, FACE_SWAP_MODEL, RESULT_DIR, AKOOL_API_KEY, AKOOL_MAX_CONCURRENT_JOBS,
+    REPLICATE_API_TOKEN, VMODEL_API_KEY,
+    FAKE_BACKEND_ENABLED, FAKE_BACKEND_SECONDS_PER_SECOND, FAKE_BACKEND_FAILURE_RATE
+)
+from utils.rate_limit import JobGovernor
+
+# Replicate is optional - only needed if using okaris_roop model
+try:
+    import replicate
+except ImportError:
+    replicate = None
+
+
+class FaceSwapBackend:
+    """
+    换脸后端基类
+
+    子类至少实现 submit() 和 poll()；swap() 默认在并发名额内提交并轮询到完成
+    """
+
+    # 任务状态（poll 的返回值）
+    STATUS_PENDING = "pending"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+
+    # 子类覆盖：是否支持取消、服务重启后继续等待、长视频分段、提前检测人脸关键点
+    CAPABILITIES = {
+        "cancel": False,
+        "resumable": True,
+        "segmenting": False,
+        "prefetch_landmarks": False,
+    }
+
+    # 查询失败（网络错误、限流、服务端错误）后等待再查，连续失败时每次加倍
+    RETRY_BACKOFF_SECONDS = 2
+    MAX_RETRY_BACKOFF_SECONDS = 60
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: 后端名称（API_CONFIGS 中的键，也是任务记录的 model 字段）
+        """
+        self.name = name
+        self.config = API_CONFIGS.get(name, {})
+        self._jobs = None
+        self._jobs_lock = threading.Lock()
+
+    @property
+    def jobs(self) -> JobGovernor:
+        """并发名额（首次使用时按 max_concurrent_jobs 创建，注册后端时不读取 Key 池等配置）"""
+        with self._jobs_lock:
+            if self._jobs is None:
+                self._jobs = JobGovernor(self.max_concurrent_jobs)
+            return self._jobs
+
+    @property
+    def display_name(self) -> str:
+        return self.config.get("name", self.name)
+
+    @property
+    def max_concurrent_jobs(self) -> int:
+        """同时运行的任务数上限（0 = 不限制）"""
+        return self.config.get("max_concurrent_jobs", 0)
+
+    def is_available(self) -> bool:
+        """是否已配置（API Key 等）"""
+        raise NotImplementedError
+
+    def capabilities(self) -> dict:
+        """后端能力（页面和路由据此决定功能）"""
+        return dict(
+            self.CAPABILITIES,
+            max_resolution=self.config.get("max_resolution"),
+            face_enhance=self.config.get("face_enhance", False),
+            max_concurrent_jobs=self.max_concurrent_jobs
+        )
+
+    def estimate_cost(self, video_duration_seconds: float) -> float:
+        """
+        估算成本
+
+        Args:
+            video_duration_seconds: 视频时长（秒）
+
+        Returns:
+            float: 预估成本（美元）
+        """
+        if "cost_per_second" in self.config:
+            return video_duration_seconds * self.config["cost_per_second"]
+        return self.config.get("cost", 0)
+
+    def queued_jobs(self) -> int:
+        """在本地排队等待并发名额的任务数"""
+        return self.jobs.queued
+
+    def running_jobs(self) -> int:
+        """占用并发名额的任务数"""
+        return self.jobs.running
+
+    def status_notes(self) -> list:
+        """页面上显示的附加状态说明"""
+        return []
+
+    def submit(self, face_image_path: str, video_path: str, video_info: dict = None) -> str:
+        """
+        提交任务，不等待结果
+
+        Returns:
+            str: 后端的任务 ID（用于 poll/cancel/恢复）
+        """
+        raise NotImplementedError
+
+    def poll(self, handle: str) -> tuple:
+        """
+        查询一次任务状态
+
+        Returns:
+            (状态, 结果 URL 或 None, 错误信息或 None)
+        """
+        raise NotImplementedError
+
+    def cancel(self, handle: str) -> bool:
+        """
+        取消任务
+
+        Returns:
+            bool: 后端是否支持并已接受取消
+        """
+        return False
+
+    def polling_policy(self, video_info: dict):
+        """按视频时长和该后端的历史耗时生成轮询策略"""
+        from utils.poll_policy import PollingPolicy
+        from utils.job_store import get_job_store
+
+        return PollingPolicy.for_video(
+            duration=video_info.get("duration"),
+            width=video_info.get("width"),
+            height=video_info.get("height"),
+            history=get_job_store().processing_history(self.name)
+        )
+
+    def wait(self, handle: str, progress_callback=None, video_info: dict = None, elapsed: float = 0) -> str:
+        """
+        轮询直到任务结束，超时后尝试取消
+
+        查询时的网络错误、429 和 5xx 不代表任务失败（任务已提交并计费），
+        退避后继续查询，直到超时
+
+        Args:
+            handle: submit 返回的任务 ID
+            progress_callback: 可选的进度回调函数
+            video_info: 视频元数据（用于估算处理时间）
+            elapsed: 任务提交至今的秒数（恢复时）
+
+        Returns:
+            str: 结果 URL
+        """
+        policy = self.polling_policy(video_info or {})
+        started_at = time.time() - elapsed
+        failures = 0
+
+        while True:
+            try:
+                status, result_url, error = self.poll(handle)
+            except Exception as e:
+                if not _is_transient_poll_error(e):
+                    raise
+                failures += 1
+                print(f"{self.display_name} poll for {handle} failed ({e}), retrying")
+            else:
+                failures = 0
+                if status == self.STATUS_SUCCEEDED:
+                    return result_url
+                if status == self.STATUS_FAILED:
+                    raise Exception(f"{self.display_name} 处理失败: {error}")
+
+            waited = time.time() - started_at
+            if waited > policy.timeout:
+                self.cancel(handle)
+                raise TimeoutError(f"Video processing timed out after {policy.timeout:.0f} seconds")
+            if progress_callback:
+                progress_callback(1, f"处理中... ({int(waited)}秒)")
+
+            interval = policy.next_interval(waited)
+            if failures:
+                backoff = self.RETRY_BACKOFF_SECONDS * 2 ** (failures - 1)
+                interval = max(interval, min(backoff, self.MAX_RETRY_BACKOFF_SECONDS))
+            time.sleep(interval)
+
+    def swap(self, face_image_path: str, video_path: str, progress_callback=None, stage_callback=None,
+             video_info: dict = None) -> str:
+        """
+        完整处理一个任务：等待并发名额、提交、轮询到完成
+
+        Args:
+            face_image_path: 要替换的脸部照片路径
+            video_path: 源视频路径
+            progress_callback: 可选的进度回调函数
+            stage_callback: 可选的阶段回调函数(stage, data)，提交后以 remote_id 记录任务 ID
+            video_info: 视频元数据
+
+        Returns:
+            str: 结果 URL（或本地文件路径）
+        """
+        def queued(position):
+            if progress_callback:
+                progress_callback(1, f"等待空闲的处理名额（第 {position} 位）...")
+
+        with self.jobs.slot(on_queued=queued):
+            if progress_callback:
+                progress_callback(1, f"正在提交到 {self.display_name}...")
+            handle = self.submit(face_image_path, video_path, video_info)
+            if stage_callback:
+                stage_callback("submitted", {"remote_id": handle})
+            return self.wait(handle, progress_callback, video_info)
+
+    def resume(self, job: dict, progress_callback=None, stage_callback=None) -> str:
+        """
+        继续等待服务重启前已提交的任务
+
+        Args:
+            job: 任务记录（JobStore）
+            progress_callback: 可选的进度回调函数
+            stage_callback: 可选的阶段回调函数(stage, data)，恢复过程中有新的提交时记录
+
+        Returns:
+            str: 结果 URL
+        """
+        with self.jobs.slot(force=True):
+            return self.wait(job["remote_id"], progress_callback, _job_video_info(job), _job_elapsed(job))
+
+
+class AkoolBackend(FaceSwapBackend):
+    """Akool：多 Key 池、按 Key 限流、长视频分段和回调都在 face_swap.swap_face_akool 中处理"""
+
+    CAPABILITIES = dict(FaceSwapBackend.CAPABILITIES, segmenting=True, prefetch_landmarks=True)
+
+    @property
+    def max_concurrent_jobs(self) -> int:
+        from utils.akool_keys import get_key_pool
+        return AKOOL_MAX_CONCURRENT_JOBS * len(get_key_pool())
+
+    def is_available(self) -> bool:
+        return bool(AKOOL_API_KEY)
+
+    def estimate_cost(self, video_duration_seconds: float) -> float:
+        # Akool: 10 credits per 10 seconds, roughly $0.10 per 10 seconds
+        return (video_duration_seconds / 10) * self.config["cost_per_10s"]
+
+    def queued_jobs(self) -> int:
+        from utils.akool_keys import get_key_pool
+        from utils.rate_limit import get_key_limiter
+        return sum(get_key_limiter(key).metrics()["queued_jobs"] for key in get_key_pool().keys.values())
+
+    def running_jobs(self) -> int:
+        from utils.akool_keys import get_key_pool
+        from utils.rate_limit import get_key_limiter
+        return sum(get_key_limiter(key).metrics()["running_jobs"] for key in get_key_pool().keys.values())
+
+    def status_notes(self) -> list:
+        from utils.akool_keys import get_key_pool
+
+        key_pool = get_key_pool()
+        if len(key_pool) <= 1:
+            return []
+        notes = [f"已配置 {len(key_pool)} 个 Akool API Key"]
+        drained = sum(1 for key in key_pool.status() if key["drained"])
+        if drained:
+            notes.append(f"⚠️ {drained} 个 Key 余额不足，已停止分配新任务")
+        return notes
+
+    def submit(self, face_image_path: str, video_path: str, video_info: dict = None) -> str:
+        """
+        提交任务，不等待结果
+
+        Returns:
+            str: 任务句柄 "<Key 指纹>:<Akool 任务 ID>"（多 Key 时必须用提交任务的 Key 查询）
+        """
+        from utils.akool_client import swap_face_akool as akool_swap
+        from utils.akool_keys import get_key_pool, key_fingerprint
+
+        with get_key_pool().lease(video_info) as api_key:
+            akool_id = akool_swap(face_image_path, video_path, api_key=api_key, wait=False)
+            return f"{key_fingerprint(api_key)}:{akool_id}"
+
+    @staticmethod
+    def _split_handle(handle: str) -> tuple:
+        """拆分任务句柄，返回 (Key 指纹, Akool 任务 ID)"""
+        fingerprint, _, akool_id = handle.partition(":")
+        if not akool_id:
+            raise ValueError(f"无效的 Akool 任务句柄: {handle}")
+        return fingerprint, akool_id
+
+    def poll(self, handle: str) -> tuple:
+        from utils.akool_client import AkoolClient, get_akool_client
+        from utils.akool_keys import get_key_pool
+
+        fingerprint, akool_id = self._split_handle(handle)
+        api_key = get_key_pool().get_key(fingerprint)
+        items = AkoolClient.parse_result_items(get_akool_client(api_key).get_result(akool_id))
+        if not items:
+            return self.STATUS_PENDING, None, None
+
+        status, result_url, error = AkoolClient.parse_result_item(items[0])
+        if status == AkoolClient.STATUS_SUCCESS:
+            return self.STATUS_SUCCEEDED, result_url, None
+        if status == AkoolClient.STATUS_FAILED:
+            return self.STATUS_FAILED, None, error
+        return self.STATUS_PENDING, None, None
+
+    def wait(self, handle: str, progress_callback=None, video_info: dict = None, elapsed: float = 0) -> str:
+        from utils.akool_keys import get_key_pool
+        from utils.akool_poller import get_poller
+        from utils.rate_limit import get_key_limiter
+
+        # 已提交的任务在结束前仍占用该 Key 的并发名额和在途计数
+        fingerprint, akool_id = self._split_handle(handle)
+        key_pool = get_key_pool()
+        with key_pool.lease(fingerprint=fingerprint) as api_key, get_key_limiter(api_key).job_slot(force=True):
+            # 与其他任务共用该 Key 的批量查询（listbyids），查询失败时由轮询器退避重试
+            return get_poller(api_key).wait(
+                job_id=akool_id,
+                progress_callback=progress_callback,
+                policy=self.polling_policy(video_info or {}),
+                elapsed=elapsed
+            )
+
+    def swap(self, face_image_path: str, video_path: str, progress_callback=None, stage_callback=None,
+             video_info: dict = None) -> str:
+        from utils import face_swap
+        return face_swap.swap_face_akool(face_image_path, video_path, progress_callback, stage_callback, video_info)
+
+    def resume(self, job: dict, progress_callback=None, stage_callback=None) -> str:
+        from utils import face_swap
+
+        if job["akool_segments"]:
+            # 分段任务：已提交的片段继续等待，其余片段重新提交
+            return face_swap.resume_swap_akool_segmented(
+                job["face_path"],
+                json.loads(job["akool_segments"]),
+                progress_callback=progress_callback,
+                stage_callback=stage_callback,
+                video_info=_job_video_info(job),
+                elapsed=_job_elapsed(job)
+            )
+        return face_swap.resume_swap_akool(
+            job["akool_id"],
+            progress_callback=progress_callback,
+            video_info=_job_video_info(job),
+            elapsed=_job_elapsed(job),
+            akool_key=job["akool_key"]
+        )
+
+
+class ReplicateBackend(FaceSwapBackend):
+    """Replicate 上的 roop 模型（predictions API，支持取消）"""
+
+    CAPABILITIES = dict(FaceSwapBackend.CAPABILITIES, cancel=True)
+
+    def is_available(self) -> bool:
+        return bool(REPLICATE_API_TOKEN)
+
+    def _check(self):
+        if replicate is None:
+            raise ImportError("replicate 模块未安装。请运行: pip install replicate")
+        if not REPLICATE_API_TOKEN:
+            raise ValueError("请在 .env 文件中设置 REPLICATE_API_TOKEN")
+
+    def submit(self, face_image_path: str, video_path: str, video_info: dict = None) -> str:
+        self._check()
+        version = self.config["model"].split(":", 1)[1]
+
+        with open(face_image_path, 'rb') as face_file:
+            with open(video_path, 'rb') as video_file:
+                prediction = replicate.predictions.create(
+                    version=version,
+                    input={
+                        "source": face_file,      # okaris/roop 使用 "source"
+                        "target": video_file,      # okaris/roop 使用 "target"
+                        "keep_fps": True,          # 保持原始帧率
+                        "keep_frames": True,       # 保持帧一致性
+                        "enhance_face": False      # 不增强面部（更快）
+                    }
+                )
+        return prediction.id
+
+    def poll(self, handle: str) -> tuple:
+        self._check()
+        prediction = replicate.predictions.get(handle)
+
+        if prediction.status == "succeeded":
+            output = prediction.output
+            # 输出可能是列表
+            if isinstance(output, (list, tuple)):
+                if not output:
+                    return self.STATUS_FAILED, None, "API 没有返回结果"
+                output = output[0]
+            return self.STATUS_SUCCEEDED, str(output), None
+        if prediction.status in ("failed", "canceled"):
+            return self.STATUS_FAILED, None, prediction.error or prediction.status
+        return self.STATUS_PENDING, None, None
+
+    def cancel(self, handle: str) -> bool:
+        self._check()
+        try:
+            replicate.predictions.cancel(handle)
+            return True
+        except Exception as e:
+            print(f"Failed to cancel Replicate prediction {handle}: {e}")
+            return False
+
+
+class VModelBackend(FaceSwapBackend):
+    """
+    VModel：输入需要公网 URL（通过配置的存储后端上传），
+    任务状态在提交地址后加任务 ID 查询
+    """
+
+    def is_available(self) -> bool:
+        return bool(VMODEL_API_KEY)
+
+    def submit(self, face_image_path: str, video_path: str, video_info: dict = None) -> str:
+        from utils.face_swap import swap_face_vmodel
+        from utils.upload_cache import cached_upload, invalidate_upload
+
+        if not VMODEL_API_KEY:
+            raise ValueError("请在 .env 文件中设置 VMODEL_API_KEY")
+
+        try:
+            result = swap_face_vmodel(cached_upload(face_image_path), cached_upload(video_path), VMODEL_API_KEY)
+        except Exception:
+            # VModel 拒绝或无法下载缓存的 URL 时，下次重新上传
+            invalidate_upload(face_image_path)
+            invalidate_upload(video_path)
+            raise
+        data = result.get("result", result)
+        handle = data.get("task_id") or data.get("id")
+        if not handle:
+            raise Exception(f"VModel 没有返回任务 ID: {result}")
+        return handle
+
+    def poll(self, handle: str) -> tuple:
+        from utils.http_session import get_session
+
+        response = get_session().get(
+            f"{self.config['api_url']}/{handle}",
+            headers={"Authorization": f"Bearer {VMODEL_API_KEY}"},
+            timeout=30
+        )
+        response.raise_for_status()
+        result = response.json()
+        data = result.get("result", result)
+
+        status = data.get("status")
+        if status == "succeeded":
+            output = data.get("output") or data.get("result_url")
+            if isinstance(output, list):
+                output = output[0] if output else None
+            if output:
+                return self.STATUS_SUCCEEDED, output, None
+            return self.STATUS_FAILED, None, "API 没有返回结果"
+        if status in ("failed", "canceled"):
+            return self.STATUS_FAILED, None, data.get("error") or status
+        return self.STATUS_PENDING, None, None
+
+
+class FakeBackend(FaceSwapBackend):
+    """
+    本地模拟后端（压测用）：不调用 API，按视频时长模拟处理时间，
+    结果为原视频在 RESULT_DIR 中的副本。任务只保存在内存中，服务重启后不能恢复
+    """
+
+    CAPABILITIES = dict(FaceSwapBackend.CAPABILITIES, cancel=True, resumable=False)
+
+    def __init__(self, name: str = "fake", seconds_per_second: float = FAKE_BACKEND_SECONDS_PER_SECOND,
+                 failure_rate: float = FAKE_BACKEND_FAILURE_RATE, enabled: bool = FAKE_BACKEND_ENABLED):
+        """
+        Args:
+            name: 后端名称
+            seconds_per_second: 每秒视频的模拟处理秒数
+            failure_rate: 随机失败的比例
+            enabled: 是否可用
+        """
+        super().__init__(name)
+        self.seconds_per_second = seconds_per_second
+        self.failure_rate = failure_rate
+        self.enabled = enabled
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return self.enabled
+
+    def submit(self, face_image_path: str, video_path: str, video_info: dict = None) -> str:
+        handle = uuid.uuid4().hex
+        duration = (video_info or {}).get("duration") or 10
+        with self._lock:
+            self._tasks[handle] = {
+                "video_path": video_path,
+                "ready_at": time.time() + duration * self.seconds_per_second,
+                "fail": random.random() < self.failure_rate,
+                "canceled": False,
+            }
+        return handle
+
+    def poll(self, handle: str) -> tuple:
+        with self._lock:
+            task = self._tasks.get(handle)
+        if task is None:
+            return self.STATUS_FAILED, None, "任务不存在（服务已重启）"
+        if task["canceled"]:
+            return self.STATUS_FAILED, None, "canceled"
+        if time.time() < task["ready_at"]:
+            return self.STATUS_PENDING, None, None
+        if task["fail"]:
+            return self.STATUS_FAILED, None, "模拟失败"
+
+        os.makedirs(RESULT_DIR, exist_ok=True)
+        result_path = os.path.join(RESULT_DIR, f"fake_{handle}{os.path.splitext(task['video_path'])[1]}")
+        if not os.path.exists(result_path):
+            shutil.copyfile(task["video_path"], result_path)
+        return self.STATUS_SUCCEEDED, result_path, None
+
+    def cancel(self, handle: str) -> bool:
+        with self._lock:
+            task = self._tasks.get(handle)
+            if task is None:
+                return False
+            task["canceled"] = True
+            return True
+
+    def polling_policy(self, video_info: dict):
+        from utils.poll_policy import PollingPolicy
+        duration = video_info.get("duration") or 10
+        return PollingPolicy.fixed(interval=0.5, timeout=duration * self.seconds_per_second * 10 + 60)
+
+
+def _is_transient_poll_error(error: Exception) -> bool:
+    """查询任务状态的错误是否可能自行恢复（网络错误、429 和 5xx）"""
+    # requests 的 HTTPError 带 response；replicate 的 ReplicateError 带 status
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, requests.RequestException)
+
+
+def _job_video_info(job: dict) -> dict:
+    return {"duration": job["video_duration"], "width": job["video_width"], "height": job["video_height"]}
+
+
+def _job_elapsed(job: dict) -> float:
+    return time.time() - job["submitted_at"] if job["submitted_at"] else 0
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(backend: FaceSwapBackend):
+    """注册（或替换）后端"""
+    with _backends_lock:
+        _backends[backend.name] = backend
+
+
+def get_backend(name: str = None) -> FaceSwapBackend:
+    """
+    按名称获取后端
+
+    Args:
+        name: 后端名称 (默认使用配置的FACE_SWAP_MODEL)
+
+    Raises:
+        ValueError: 未注册的后端
+    """
+    name = name or FACE_SWAP_MODEL
+    with _backends_lock:
+        backend = _backends.get(name)
+    if backend is None:
+        raise ValueError(f"不支持的模型: {name}")
+    return backend
+
+
+def list_backends() -> list:
+    """所有已注册的后端（按注册顺序）"""
+    with _backends_lock:
+        return list(_backends.values())
+
+
+register_backend(AkoolBackend("akool"))
+register_backend(ReplicateBackend("okaris_roop"))
+register_backend(VModelBackend("vmodel"))
+register_backend(FakeBackend())
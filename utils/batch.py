@@ -0,0 +1,291 @@
+"""
+批量换脸工具函数
+解析批量任务清单（CSV，或包含照片的 zip），汇总批次进度，把批次结果和报告打包成 zip。
+不依赖 Streamlit，页面和命令行共用
+"""
+import csv
+import hashlib
+import io
+import os
+import re
+import uuid
+import zipfile
+
+from config import UPLOAD_DIR
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+VIDEO_EXTENSIONS = (".mp4", ".mov")
+# zip 中的清单文件名
+MANIFEST_NAME = "manifest.csv"
+# 报告的列
+REPORT_FIELDS = [
+    "label", "face_path", "video_path", "status", "model", "result_path", "result_url", "error", "job_id"
+]
+
+
+def parse_manifest(manifest_path: str, video_path: str = None) -> list:
+    """
+    解析 CSV 清单
+
+    表头包含 face（照片）、video（视频，可省略，省略时使用 video_path）和可选的 label（任务名称，
+    例如销售姓名，默认为照片文件名）；相对路径相对于清单所在目录
+
+    Args:
+        manifest_path: 清单文件路径
+        video_path: 所有任务共用的视频（清单中没有 video 列或该列为空时使用）
+
+    Returns:
+        list: [{"face_path", "video_path", "label"}, ...]
+
+    Raises:
+        ValueError: 清单格式错误或文件不存在（列出前几个出错的行）
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path: str):
+        return os.path.normpath(os.path.join(base_dir, path)) if path else None
+
+    items = []
+    errors = []
+    with open(manifest_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        columns = [name.strip().lower() for name in reader.fieldnames or []]
+        if "face" not in columns:
+            raise ValueError("清单缺少 face 列（表头应为 face,video,label）")
+
+        for line, row in enumerate(reader, start=2):
+            row = {(key or "").strip().lower(): (value or "").strip() for key, value in row.items()}
+            if not any(row.values()):
+                continue
+
+            face_path = resolve(row.get("face"))
+            item_video = resolve(row.get("video")) or video_path
+            if not face_path or not os.path.isfile(face_path):
+                errors.append(f"第 {line} 行找不到照片 {row.get('face') or '(空)'}")
+            if not item_video or not os.path.isfile(item_video):
+                errors.append(f"第 {line} 行找不到视频 {row.get('video') or '(空)'}")
+            items.append({
+                "face_path": face_path,
+                "video_path": item_video,
+                "label": row.get("label") or os.path.splitext(os.path.basename(face_path or ""))[0],
+            })
+
+    if errors:
+        more = f" 等 {len(errors)} 处错误" if len(errors) > 5 else ""
+        raise ValueError("；".join(errors[:5]) + more)
+    if not items:
+        raise ValueError("清单中没有任务")
+    return items
+
+
+def load_batch_archive(zip_path: str, video_path: str = None, output_dir: str = None) -> list:
+    """
+    解压批量任务压缩包并生成任务列表
+
+    压缩包中有 manifest.csv 时按清单处理；否则每张照片生成一个任务，视频使用 video_path，
+    未提供时压缩包中必须恰好有一个视频
+
+    Args:
+        zip_path: zip 文件路径
+        video_path: 所有任务共用的视频
+        output_dir: 解压目录（默认在 UPLOAD_DIR 下新建）
+
+    Returns:
+        list: [{"face_path", "video_path", "label"}, ...]
+
+    Raises:
+        ValueError: 压缩包无效、包含不安全的路径或缺少视频
+    """
+    output_dir = output_dir or os.path.join(UPLOAD_DIR, f"batch_{uuid.uuid4().hex}")
+    root = os.path.abspath(output_dir)
+
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            names = [name for name in archive.namelist() if not name.endswith("/")]
+            for name in names:
+                # 拒绝解压到目录之外的条目（../ 或绝对路径）
+                target = os.path.abspath(os.path.join(root, name))
+                if not target.startswith(root + os.sep):
+                    raise ValueError(f"压缩包包含不安全的路径: {name}")
+            archive.extractall(root)
+    except zipfile.BadZipFile:
+        raise ValueError("不是有效的 zip 文件")
+
+    # 忽略 macOS 打包时附带的元数据
+    names = sorted(name for name in names if "__MACOSX" not in name and not os.path.basename(name).startswith("."))
+    manifests = sorted((name for name in names if os.path.basename(name).lower() == MANIFEST_NAME),
+                       key=lambda name: name.count("/"))
+    if manifests:
+        return parse_manifest(os.path.join(root, manifests[0]), video_path)
+
+    faces = [name for name in names if name.lower().endswith(IMAGE_EXTENSIONS)]
+    videos = [name for name in names if name.lower().endswith(VIDEO_EXTENSIONS)]
+    if not faces:
+        raise ValueError("压缩包中没有照片（JPG/PNG）")
+    if video_path is None:
+        if len(videos) != 1:
+            raise ValueError("压缩包中没有 manifest.csv 时，需要单独上传视频或在压缩包中只放一个视频")
+        video_path = os.path.join(root, videos[0])
+
+    return [
+        {
+            "face_path": os.path.join(root, name),
+            "video_path": video_path,
+            "label": os.path.splitext(os.path.basename(name))[0],
+        }
+        for name in faces
+    ]
+
+
+def batch_summary(jobs: list) -> dict:
+    """
+    汇总批次进度
+
+    Args:
+        jobs: 批次中的任务记录
+
+    Returns:
+        dict: {"total", "succeeded", "failed", "pending", "progress"(0-100), "finished"}
+    """
+    succeeded = sum(1 for job in jobs if job["status"] == "succeeded")
+    failed = sum(1 for job in jobs if job["status"] == "failed")
+    # 结束的任务按 100% 计
+    progress = sum(100 if job["status"] in ("succeeded", "failed") else job.get("progress") or 0 for job in jobs)
+    return {
+        "total": len(jobs),
+        "succeeded": succeeded,
+        "failed": failed,
+        "pending": len(jobs) - succeeded - failed,
+        "progress": round(progress / len(jobs)) if jobs else 0,
+        "finished": succeeded + failed == len(jobs),
+    }
+
+
+def write_report(jobs: list, file):
+    """
+    把任务结果写成 CSV 报告
+
+    Args:
+        jobs: 任务记录
+        file: 文本文件对象
+    """
+    writer = csv.DictWriter(file, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for job in jobs:
+        writer.writerow({field: job.get(field) or "" for field in REPORT_FIELDS})
+
+
+def result_file(job: dict) -> str:
+    """
+    成功任务的本地结果文件（没有保存到本地时从结果 URL 下载）
+
+    Args:
+        job: 任务记录
+
+    Returns:
+        str: 本地文件路径
+    """
+    from utils.downloader import mirror_result
+
+    if job.get("result_path") and os.path.isfile(job["result_path"]):
+        return job["result_path"]
+    return mirror_result(job["result_url"])
+
+
+def result_name(label: str, ext: str, used_names: set) -> str:
+    """
+    按任务名称生成不重复的结果文件名
+
+    Args:
+        label: 任务名称
+        ext: 扩展名（含点）
+        used_names: 已使用的文件名（会加入新生成的文件名）
+
+    Returns:
+        str: 文件名
+    """
+    base = re.sub(r'[\\/:*?"<>|\s]+', "_", label or "").strip("._") or "result"
+    name = f"{base}{ext}"
+    suffix = 2
+    while name in used_names:
+        name = f"{base}_{suffix}{ext}"
+        suffix += 1
+    used_names.add(name)
+    return name
+
+
+def batch_zip_path(batch_id: str, jobs: list, directory: str) -> str:
+    """
+    批次结果 zip 的缓存路径
+
+    按批次和成功任务的集合命名：成功的任务变化（例如失败的任务重试成功）后重新打包
+
+    Args:
+        batch_id: 批次 ID
+        jobs: 批次中的任务记录
+        directory: 保存目录
+
+    Returns:
+        str: zip 文件路径
+    """
+    succeeded = sorted(job["job_id"] for job in jobs if job["status"] == "succeeded")
+    digest = hashlib.sha256(",".join(succeeded).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"batch_{batch_id}_{digest}.zip")
+
+
+def export_errors(zip_path: str) -> int:
+    """
+    读取已打包的 report.csv，返回结果下载失败（未打包进 zip）的成功任务数
+
+    Args:
+        zip_path: export_batch_zip 生成的 zip 文件路径
+
+    Returns:
+        int: 缺少结果的任务数
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        report = archive.read("report.csv").decode("utf-8-sig")
+    return sum(1 for row in csv.DictReader(io.StringIO(report)) if row["status"] == "succeeded" and row["error"])
+
+
+def export_batch_zip(jobs: list, output_path: str) -> str:
+    """
+    把批次中成功任务的结果视频和 report.csv 打包成 zip
+
+    结果优先使用已保存到本地的文件，否则从结果 URL 下载；下载失败的任务在报告中记录原因
+
+    Args:
+        jobs: 批次中的任务记录
+        output_path: zip 文件路径
+
+    Returns:
+        str: zip 文件路径
+    """
+    jobs = [dict(job) for job in jobs]
+    used_names = set()
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        # 视频已经压缩过，按原样存储
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+            for job in jobs:
+                if job["status"] != "succeeded":
+                    continue
+                try:
+                    result_path = result_file(job)
+                except Exception as e:
+                    job["error"] = f"下载结果失败: {e}"
+                    continue
+
+                name = result_name(job.get("label"), os.path.splitext(result_path)[1] or ".mp4", used_names)
+                archive.write(result_path, name)
+                job["result_path"] = name
+
+            report = io.StringIO()
+            write_report(jobs, report)
+            # 带 BOM，Excel 打开时中文不乱码
+            archive.writestr("report.csv", "\ufeff" + report.getvalue())
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
@@ -0,0 +1,175 @@
+"""
+批量换脸页面
+一个营销视频换成多位销售的脸：上传多张照片（或 zip 清单）和共用的视频，一次提交，
+在同一个页面查看整个批次的进度并打包下载结果
+"""
+import os
+
+import streamlit as st
+
+from config import JOB_POLL_SECONDS, RESULT_DIR, BATCH_MAX_ITEMS, BATCH_MAX_CONCURRENT_JOBS
+from utils.batch import batch_summary, batch_zip_path, export_batch_zip, export_errors, load_batch_archive
+from utils.face_swap import estimate_cost
+from utils.file_handler import save_uploaded_file, deferred_file_reader
+from utils.video_probe import probe_video_file
+
+STATUS_TEXT = {
+    "queued": "排队中",
+    "running": "处理中",
+    "submitted": "处理中",
+    "succeeded": "✅ 完成",
+    "failed": "❌ 失败",
+}
+
+
+def show_batch_page(job_manager, owner: str):
+    """
+    显示批量换脸页面
+
+    Args:
+        job_manager: 任务管理器
+        owner: 当前登录用户
+    """
+    # 页面刷新后从 URL 找回批次
+    if "batch_id" not in st.session_state:
+        st.session_state.batch_id = st.query_params.get("batch")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("📤 步骤1: 上传文件")
+        face_images = st.file_uploader(
+            "上传头像照片（可多选，每张照片生成一个视频）",
+            type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
+            key="batch_face_uploader"
+        )
+        manifest_zip = st.file_uploader(
+            "或上传压缩包（照片，或 manifest.csv 清单：face,video,label）",
+            type=["zip"],
+            key="batch_zip_uploader"
+        )
+        video_file = st.file_uploader(
+            "上传营销视频（所有照片共用，只上传一次）",
+            type=["mp4", "mov"],
+            key="batch_video_uploader"
+        )
+
+        count = len(face_images or [])
+        if count:
+            st.success(f"✅ 已选择 {count} 张照片")
+        if video_file:
+            # 只解析文件头，同一文件不重复解析
+            if st.session_state.get("batch_video_file_id") != video_file.file_id:
+                st.session_state.batch_video_file_id = video_file.file_id
+                st.session_state.batch_video_info = probe_video_file(video_file)
+            video_info = st.session_state.batch_video_info
+            if video_info.get("duration") and count:
+                cost = estimate_cost(video_info["duration"]) * count
+                st.info(f"📊 视频时长 {video_info['duration']:.1f} 秒 | {count} 个任务预估成本 ${cost:.2f}")
+
+        st.caption(f"每个批次最多 {BATCH_MAX_ITEMS} 个任务，同时处理 {BATCH_MAX_CONCURRENT_JOBS} 个")
+
+        if st.button("🚀 提交批量任务", type="primary", use_container_width=True):
+            if not face_images and not manifest_zip:
+                st.error("❌ 请上传照片或压缩包！")
+            elif face_images and not video_file:
+                st.error("❌ 请上传营销视频！")
+            else:
+                try:
+                    with st.spinner("📁 正在保存文件..."):
+                        # 共用的视频只保存一次
+                        video_path = save_uploaded_file(video_file, "video") if video_file else None
+                        items = [
+                            {
+                                "face_path": save_uploaded_file(face, "image"),
+                                "video_path": video_path,
+                                "label": os.path.splitext(face.name)[0],
+                            }
+                            for face in face_images or []
+                        ]
+                        if manifest_zip:
+                            items += load_batch_archive(save_uploaded_file(manifest_zip, "zip"), video_path)
+
+                    batch_id = job_manager.submit_batch(items, owner=owner)
+                    st.session_state.batch_id = batch_id
+                    st.query_params["batch"] = batch_id
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ 提交失败: {str(e)}")
+
+    with col2:
+        st.subheader("🎬 步骤2: 批次进度")
+
+        batches = job_manager.list_batches(owner=owner)
+        if batches:
+            options = [batch["batch_id"] for batch in batches]
+            labels = {batch["batch_id"]: f"{batch['batch_id'][:8]}（{batch['finished']}/{batch['jobs']} 已结束）"
+                      for batch in batches}
+            selected = st.selectbox(
+                "选择批次",
+                options,
+                index=options.index(st.session_state.batch_id) if st.session_state.batch_id in options else 0,
+                format_func=labels.get
+            )
+            if selected != st.session_state.batch_id:
+                st.session_state.batch_id = selected
+                st.query_params["batch"] = selected
+
+        show_batch_status(job_manager, owner)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_batch_status(job_manager, owner: str):
+    """批次进度（局部定时刷新）"""
+    batch_id = st.session_state.get("batch_id")
+    if not batch_id:
+        st.info("提交批量任务后在这里查看进度")
+        return
+
+    jobs = job_manager.get_batch(batch_id)
+    if not jobs or jobs[0]["owner"] != owner:
+        st.warning("⚠️ 批次不存在或已过期")
+        return
+
+    summary = batch_summary(jobs)
+    st.progress(summary["progress"])
+    col_done, col_failed, col_pending = st.columns(3)
+    col_done.metric("完成", summary["succeeded"])
+    col_failed.metric("失败", summary["failed"])
+    col_pending.metric("处理中/排队", summary["pending"])
+
+    st.dataframe(
+        [
+            {
+                "名称": job["label"] or job["job_id"][:8],
+                "状态": STATUS_TEXT.get(job["status"], job["status"]),
+                "进度": job["message"] if job["status"] != "failed" else job["error"],
+            }
+            for job in jobs
+        ],
+        use_container_width=True,
+        hide_index=True
+    )
+
+    if summary["succeeded"] and summary["finished"]:
+        # 成功的任务变化后路径随之变化，重新打包
+        zip_path = batch_zip_path(batch_id, jobs, RESULT_DIR)
+        if not os.path.isfile(zip_path):
+            with st.spinner("📦 正在打包结果..."):
+                export_batch_zip(jobs, zip_path)
+        missing = export_errors(zip_path)
+        if missing:
+            st.warning(f"⚠️ {missing} 个结果下载失败，未包含在压缩包中（原因见 report.csv）")
+            if st.button("🔄 重新打包", key=f"rebuild_{batch_id}"):
+                os.remove(zip_path)
+                st.rerun(scope="fragment")
+        st.download_button(
+            "⬇️ 下载全部结果（zip）",
+            data=deferred_file_reader(zip_path),
+            file_name=f"batch_{batch_id[:8]}.zip",
+            mime="application/zip",
+            use_container_width=True
+        )
+    elif summary["succeeded"]:
+        st.caption("全部任务结束后可以打包下载结果")
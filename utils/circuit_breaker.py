@@ -0,0 +1,138 @@
+"""
+换脸后端熔断器
+每个后端按最近 CIRCUIT_WINDOW 次调用统计失败率和慢调用率，超过阈值时熔断（open），
+熔断期间的任务直接切换到备用后端，不再等待重试和超时；
+CIRCUIT_OPEN_SECONDS 后进入半开（half_open），只放行一个探测任务，成功则恢复，失败则继续熔断
+"""
+import threading
+import time
+from collections import deque
+
+from config import (
+    CIRCUIT_WINDOW, CIRCUIT_MIN_CALLS, CIRCUIT_FAILURE_RATE, CIRCUIT_SLOW_RATE, CIRCUIT_OPEN_SECONDS
+)
+
+
+class CircuitOpenError(Exception):
+    """后端已熔断，且没有可用的备用后端"""
+
+
+class CircuitBreaker:
+    """单个后端的熔断器"""
+
+    STATE_CLOSED = "closed"
+    STATE_OPEN = "open"
+    STATE_HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window: int = CIRCUIT_WINDOW,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        slow_rate: float = CIRCUIT_SLOW_RATE,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS
+    ):
+        """
+        Args:
+            name: 后端名称
+            window: 统计最近多少次调用
+            min_calls: 窗口内至少多少次调用才判断是否熔断
+            failure_rate: 失败率达到该值时熔断
+            slow_rate: 慢调用率达到该值时熔断（慢调用指耗时远超预估，见 swap_face）
+            open_seconds: 熔断多久后放行探测任务
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.state = self.STATE_CLOSED
+        self.opened_at = 0.0
+        # (是否成功, 是否慢调用)
+        self._calls = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        是否可以把任务交给该后端（半开状态下只放行一个探测任务）
+
+        Returns:
+            bool: 可以调用时返回 True，调用结束后必须调用 record()
+        """
+        with self._lock:
+            if self.state == self.STATE_OPEN:
+                if time.time() - self.opened_at < self.open_seconds:
+                    return False
+                self.state = self.STATE_HALF_OPEN
+                self._probing = False
+
+            if self.state == self.STATE_HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, success: bool, slow: bool = False):
+        """
+        记录一次调用结果
+
+        Args:
+            success: 是否成功
+            slow: 是否为慢调用
+        """
+        with self._lock:
+            if self.state == self.STATE_HALF_OPEN:
+                self._probing = False
+                if success and not slow:
+                    print(f"Circuit of {self.name} closed after a successful probe")
+                    self.state = self.STATE_CLOSED
+                    self._calls.clear()
+                else:
+                    self._open()
+                return
+
+            self._calls.append((success, slow))
+            if self.state == self.STATE_CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for ok, _ in self._calls if not ok) / len(self._calls)
+                slow_calls = sum(1 for _, is_slow in self._calls if is_slow) / len(self._calls)
+                if failures >= self.failure_rate or slow_calls >= self.slow_rate:
+                    self._open()
+
+    def release(self):
+        """放弃已放行的调用（例如输入文件有误，不代表后端状态）"""
+        with self._lock:
+            if self.state == self.STATE_HALF_OPEN:
+                self._probing = False
+
+    def _open(self):
+        print(f"Circuit of {self.name} opened for {self.open_seconds:.0f}s")
+        self.state = self.STATE_OPEN
+        self.opened_at = time.time()
+
+    def snapshot(self) -> dict:
+        """当前状态（用于页面显示）"""
+        with self._lock:
+            calls = len(self._calls)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "failure_rate": sum(1 for ok, _ in self._calls if not ok) / calls if calls else 0.0,
+                "retry_in": max(0.0, self.opened_at + self.open_seconds - time.time())
+                if self.state == self.STATE_OPEN else 0.0,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取进程内共享的后端熔断器"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name)
+            _breakers[name] = breaker
+        return breaker
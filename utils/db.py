@@ -0,0 +1,31 @@
+"""
+SQLite 连接工具
+任务表和各类缓存共用同一个数据库文件（config.DB_PATH）
+"""
+import os
+import sqlite3
+
+from config import DB_PATH
+
+
+def connect(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    打开数据库连接（可跨线程使用，调用方需自行加锁）
+
+    Args:
+        db_path: SQLite 文件路径
+
+    Returns:
+        sqlite3.Connection: 行以 sqlite3.Row 返回
+    """
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    with conn:
+        # WAL 模式下读写互不阻塞，多个表/进程可共用同一个文件
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
@@ -0,0 +1,221 @@
+"""
+结果文件下载
+把换脸结果从 API 返回的 URL 下载到 RESULT_DIR，供应商链接失效后用户仍可下载。
+服务器支持 HTTP Range 时按块下载：大文件多线程并行，中断后从已完成的块继续；
+下载完成后校验大小（以及服务器提供的 MD5），并记录 SHA-256 供之后复用时校验
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from config import RESULT_DIR, DOWNLOAD_WORKERS
+from utils.file_handler import file_sha256
+from utils.http_session import get_session
+
+# 每个 Range 请求下载的字节数（也是断点续传的粒度）
+CHUNK_SIZE = 8 * 1024 * 1024
+# 超过该大小才并行下载
+PARALLEL_MIN_SIZE = 32 * 1024 * 1024
+TIMEOUT = (10, 60)
+
+
+class DownloadError(Exception):
+    """下载失败或校验不通过"""
+
+
+def mirror_result(url: str, output_dir: str = RESULT_DIR, workers: int = DOWNLOAD_WORKERS) -> str:
+    """
+    把结果文件下载到本地（同一 URL 已下载且校验通过时直接返回）
+
+    Args:
+        url: 结果 URL
+        output_dir: 保存目录
+        workers: 并行下载线程数
+
+    Returns:
+        str: 本地文件路径
+    """
+    ext = os.path.splitext(urlparse(str(url)).path)[1].lower() or ".mp4"
+    name = hashlib.sha256(str(url).encode("utf-8")).hexdigest()[:16] + ext
+    output_path = os.path.join(output_dir, name)
+
+    if os.path.exists(output_path) and verify_file(output_path):
+        return output_path
+    return download_file(str(url), output_path, workers=workers)
+
+
+def verify_file(path: str) -> bool:
+    """
+    按下载时记录的 SHA-256 校验本地文件
+
+    Returns:
+        bool: 文件完整（没有校验记录时返回 False）
+    """
+    try:
+        with open(path + ".sha256", "r", encoding="utf-8") as f:
+            expected = f.read().strip()
+    except OSError:
+        return False
+    return file_sha256(path) == expected
+
+
+def download_file(url: str, output_path: str, workers: int = DOWNLOAD_WORKERS, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    下载文件，支持断点续传和并行分块下载
+
+    下载过程中数据写入 output_path + ".part"，已完成的块记录在 ".part.json"，
+    中断后再次调用会跳过已完成的块
+
+    Args:
+        url: 文件 URL
+        output_path: 保存路径
+        workers: 并行下载线程数（文件小于 PARALLEL_MIN_SIZE 时只用一个）
+        chunk_size: 每块字节数
+
+    Returns:
+        str: 保存路径
+    """
+    part_path = output_path + ".part"
+    size, supports_range, checksum = _probe(url)
+
+    if supports_range and size:
+        if size < PARALLEL_MIN_SIZE:
+            workers = 1
+        _download_ranges(url, part_path, size, checksum, workers, chunk_size)
+    else:
+        _download_stream(url, part_path)
+
+    actual_size = os.path.getsize(part_path)
+    if size and actual_size != size:
+        raise DownloadError(f"下载不完整: {actual_size}/{size} 字节")
+
+    if checksum:
+        md5 = hashlib.md5()
+        with open(part_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                md5.update(block)
+        if md5.hexdigest() != checksum:
+            os.remove(part_path)
+            _remove(part_path + ".json")
+            raise DownloadError("下载文件校验失败（MD5 不一致）")
+
+    os.replace(part_path, output_path)
+    _remove(part_path + ".json")
+    with open(output_path + ".sha256", "w", encoding="utf-8") as f:
+        f.write(file_sha256(output_path))
+    return output_path
+
+
+def _probe(url: str) -> tuple:
+    """
+    用 Range: bytes=0-0 请求获取文件大小和是否支持断点续传
+    （预签名 URL 通常只允许 GET，不能用 HEAD）
+
+    Returns:
+        (size 或 None, 是否支持 Range, 服务器提供的 MD5 十六进制 或 None)
+    """
+    with get_session("downloads").get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        headers = response.headers
+
+        if response.status_code == 206:
+            match = re.search(r"/(\d+)$", headers.get("Content-Range", ""))
+            size = int(match.group(1)) if match else None
+            supports_range = size is not None
+        else:
+            size = int(headers["Content-Length"]) if headers.get("Content-Length") else None
+            supports_range = False
+
+    return size, supports_range, _server_md5(headers)
+
+
+def _server_md5(headers) -> str:
+    """服务器提供的 MD5：Content-MD5，或 S3 单次上传对象的 ETag"""
+    if headers.get("Content-MD5"):
+        try:
+            return base64.b64decode(headers["Content-MD5"]).hex()
+        except ValueError:
+            return None
+
+    etag = headers.get("ETag", "").strip('"')
+    is_s3 = any(name.lower().startswith("x-amz-") for name in headers)
+    if is_s3 and re.fullmatch(r"[0-9a-f]{32}", etag):
+        return etag
+    return None
+
+
+def _download_ranges(url: str, part_path: str, size: int, checksum: str, workers: int, chunk_size: int):
+    """按块下载到 part_path，跳过上次已完成的块"""
+    state_path = part_path + ".json"
+    state = {"url": url, "size": size, "checksum": checksum, "chunk_size": chunk_size, "done": []}
+
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if all(saved.get(key) == state[key] for key in ("url", "size", "checksum", "chunk_size")) \
+                and os.path.getsize(part_path) == size:
+            state["done"] = saved["done"]
+    except (OSError, ValueError):
+        pass
+
+    if not state["done"]:
+        # 预分配文件，各块按偏移量写入
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+
+    done = set(state["done"])
+    chunks = [
+        (index, start, min(start + chunk_size, size) - 1)
+        for index, start in enumerate(range(0, size, chunk_size))
+        if index not in done
+    ]
+    lock = threading.Lock()
+
+    def fetch(chunk):
+        index, start, end = chunk
+        headers = {"Range": f"bytes={start}-{end}"}
+        with get_session("downloads").get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            if response.status_code != 206:
+                raise DownloadError(f"服务器未按 Range 返回数据: HTTP {response.status_code}")
+            written = 0
+            with open(part_path, "r+b") as f:
+                f.seek(start)
+                for block in response.iter_content(256 * 1024):
+                    f.write(block)
+                    written += len(block)
+        if written != end - start + 1:
+            raise DownloadError(f"分块 {index} 不完整: {written}/{end - start + 1} 字节")
+
+        with lock:
+            state["done"].append(index)
+            tmp_state = state_path + ".tmp"
+            with open(tmp_state, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_state, state_path)
+
+    if workers <= 1:
+        for chunk in chunks:
+            fetch(chunk)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as pool:
+            # list() 让任一分块的异常抛出
+            list(pool.map(fetch, chunks))
+
+
+def _download_stream(url: str, part_path: str):
+    """服务器不支持 Range 时整体下载"""
+    with get_session("downloads").get(url, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        with open(part_path, "wb") as f:
+            for block in response.iter_content(1024 * 1024):
+                f.write(block)
+
+
+def _remove(path: str):
+    if os.path.exists(path):
+        os.remove(path)
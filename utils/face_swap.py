@@ -1,14 +1,51 @@
-import requests
-from config import REPLICATE_API_TOKEN, AKOOL_API_KEY, API_CONFIGS, FACE_SWAP_MODEL
+import math
+import os
+import shutil
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+
+from config import (
+    AKOOL_API_KEY, API_CONFIGS, FACE_SWAP_MODEL, RESULT_DIR,
+    WEBHOOK_FALLBACK_POLL_SECONDS, SEGMENT_MIN_DURATION, SEGMENT_SECONDS, SEGMENT_WORKERS,
+    FAILOVER_MODELS, CIRCUIT_SLOW_FACTOR
+)
+from utils.http_session import get_session
+
+
+def build_polling_policy(model: str, video_info: dict):
+    """
+    根据视频元数据和历史任务耗时生成轮询策略
+    开启回调时只做低频兜底轮询
+
+    Args:
+        model: 模型名称
+        video_info: probe_video 的返回值（可为空字典）
 
-# Replicate is optional - only needed if using okaris_roop model
-try:
-    import replicate
-except ImportError:
-    replicate = None
+    Returns:
+        PollingPolicy: 轮询策略
+    """
+    from utils.poll_policy import PollingPolicy
+    from utils.job_store import get_job_store
+    from utils.webhook_server import get_webhook_url
+
+    options = {}
+    if get_webhook_url():
+        options = {"min_interval": WEBHOOK_FALLBACK_POLL_SECONDS, "max_interval": WEBHOOK_FALLBACK_POLL_SECONDS}
+
+    return PollingPolicy.for_video(
+        duration=video_info.get("duration"),
+        width=video_info.get("width"),
+        height=video_info.get("height"),
+        history=get_job_store().processing_history(model),
+        **options
+    )
 
 
-def swap_face_akool(face_image_path: str, video_path: str, progress_callback=None) -> str:
+def swap_face_akool(face_image_path: str, video_path: str, progress_callback=None, stage_callback=None,
+                    video_info: dict = None) -> str:
     """
     使用 Akool API 进行视频换脸 (效果最好)
 
@@ -16,64 +53,270 @@ def swap_face_akool(face_image_path: str, video_path: str, progress_callback=Non
         face_image_path: 要替换的脸部照片路径
         video_path: 源视频路径
         progress_callback: 可选的进度回调函数
+        stage_callback: 可选的阶段回调函数(stage, data)，用于持久化中间结果
+        video_info: 视频元数据（用于估算处理时间），默认自动读取
 
     Returns:
-        result_video_url: 处理后的视频 URL
+        result_video_url: 处理后的视频 URL（长视频分段处理时为本地文件路径）
     """
     from utils.akool_client import swap_face_akool as akool_swap
+    from utils.akool_keys import get_key_pool, key_fingerprint
+    from utils.webhook_server import get_webhook_url
 
     if not AKOOL_API_KEY:
         raise ValueError("请在 .env 文件中设置 AKOOL_API_KEY")
 
-    return akool_swap(
-        face_image_path=face_image_path,
-        video_path=video_path,
-        api_key=AKOOL_API_KEY,
-        face_enhance=True,
-        progress_callback=progress_callback
-    )
+    if video_info is None:
+        from utils.video_probe import probe_video
+        video_info = probe_video(video_path)
 
+    if should_segment(video_info):
+        return swap_face_akool_segmented(face_image_path, video_path, progress_callback, video_info, stage_callback)
 
-def swap_face_replicate_roop(face_image_path: str, video_path: str) -> str:
+    # 从 Key 池中选择余量最多的 Key；记录其指纹，服务重启后用同一个 Key 继续轮询
+    with get_key_pool().lease(video_info) as api_key:
+        if stage_callback:
+            stage_callback("assigned", {"akool_key": key_fingerprint(api_key)})
+
+        return akool_swap(
+            face_image_path=face_image_path,
+            video_path=video_path,
+            api_key=api_key,
+            face_enhance=True,
+            progress_callback=progress_callback,
+            stage_callback=stage_callback,
+            polling_policy=build_polling_policy("akool", video_info),
+            webhook_url=get_webhook_url()
+        )
+
+
+def should_segment(video_info: dict) -> bool:
     """
-    使用 Replicate okaris/roop API 进行换脸
+    是否对视频分段处理（时长超过 SEGMENT_MIN_DURATION 且本机有 ffmpeg）
+
+    Args:
+        video_info: probe_video 的返回值
+
+    Returns:
+        bool: 是否分段
+    """
+    from utils.video_segments import ffmpeg_path
+
+    duration = video_info.get("duration") or 0
+    return bool(SEGMENT_MIN_DURATION) and duration > SEGMENT_MIN_DURATION and ffmpeg_path() is not None
+
+
+class SegmentCancelledError(RuntimeError):
+    """其他片段已失败，本片段不再提交或下载"""
+
+
+def swap_face_akool_segmented(face_image_path: str, video_path: str, progress_callback=None,
+                              video_info: dict = None, stage_callback=None, segments: dict = None,
+                              elapsed: float = 0) -> str:
+    """
+    长视频分段换脸：按关键帧切段，各段作为独立的 Akool 任务并行处理，
+    下载结果后无损拼接并混入原音轨。总耗时接近单个片段的处理时间
+
+    照片只上传和检测一次（上传缓存和关键点缓存在各片段间共享）。每个片段提交后通过
+    stage_callback("segment_submitted", {"akool_segments": ...}) 记录各片段的任务 ID，
+    服务重启后传入 segments 继续等待已提交的片段，只提交其余片段
 
     Args:
         face_image_path: 要替换的脸部照片路径
         video_path: 源视频路径
+        progress_callback: 可选的进度回调函数
+        video_info: 视频元数据（用于估算各片段的处理时间）
+        stage_callback: 可选的阶段回调函数(stage, data)
+        segments: 上次记录的 akool_segments（恢复时）
+        elapsed: 任务开始至今的秒数（恢复时，用于没有记录提交时间的片段）
+
+    Returns:
+        result_video_path: 拼接后的本地视频路径（位于 RESULT_DIR）
+    """
+    from utils.akool_client import swap_face_akool as akool_swap
+    from utils.akool_keys import get_key_pool, key_fingerprint
+    from utils.downloader import download_file
+    from utils.video_segments import split_video, concat_segments
+    from utils.webhook_server import get_webhook_url
+
+    video_info = video_info or {}
+    segment_seconds = (segments or {}).get("segment_seconds") or SEGMENT_SECONDS
+    work_dir = os.path.join(RESULT_DIR, f"segments_{uuid.uuid4().hex}")
+
+    try:
+        if progress_callback:
+            progress_callback(0, "正在切分视频...")
+        # 切分只做流复制，相同视频和片段时长切出的片段相同，恢复时按序号对应
+        segment_paths = split_video(video_path, segment_seconds, work_dir)
+        total = len(segment_paths)
+        record = segments or {"video_path": video_path, "segment_seconds": segment_seconds, "total": total, "ids": {}}
+        if record["total"] != total:
+            raise RuntimeError(f"视频重新切分后片段数不一致（{total}，原为 {record['total']}），无法继续等待已提交的片段")
+
+        finished = [0]
+        lock = threading.Lock()
+        failed = threading.Event()
+
+        segment_info = dict(video_info, duration=min(segment_seconds, video_info.get("duration") or segment_seconds))
+        policy = build_polling_policy("akool", segment_info)
+        webhook_url = get_webhook_url()
+
+        def process(index: int, segment_path: str) -> str:
+            try:
+                return process_segment(index, segment_path)
+            except Exception:
+                # 在工作线程中立即标记，空出的线程不会再提交排队的片段
+                failed.set()
+                raise
+
+        def process_segment(index: int, segment_path: str) -> str:
+            def report(status, message):
+                if progress_callback:
+                    progress_callback(status, f"[片段 {index + 1}/{total}] {message}")
+
+            submitted = record["ids"].get(str(index))
+            if submitted:
+                fingerprint, _, akool_id = submitted["handle"].partition(":")
+                submitted_at = submitted.get("submitted_at")
+                result_url = resume_swap_akool(
+                    akool_id,
+                    progress_callback=report,
+                    video_info=segment_info,
+                    elapsed=time.time() - submitted_at if submitted_at else elapsed,
+                    akool_key=fingerprint
+                )
+            else:
+                # 其他片段已失败时不再提交新的付费任务
+                if failed.is_set():
+                    raise SegmentCancelledError("其他片段处理失败，已取消")
+
+                # 各片段独立选择 Key，可分散到多个账号
+                with get_key_pool().lease(segment_info) as api_key:
+                    def segment_stage(stage, data):
+                        if stage != "submitted":
+                            return
+                        with lock:
+                            record["ids"][str(index)] = {
+                                "handle": f"{key_fingerprint(api_key)}:{data['akool_id']}",
+                                "submitted_at": time.time(),
+                            }
+                            if stage_callback:
+                                stage_callback("segment_submitted", {"akool_segments": record})
+
+                    result_url = akool_swap(
+                        face_image_path=face_image_path,
+                        video_path=segment_path,
+                        api_key=api_key,
+                        face_enhance=True,
+                        progress_callback=report,
+                        stage_callback=segment_stage,
+                        polling_policy=policy,
+                        webhook_url=webhook_url
+                    )
+            if failed.is_set():
+                raise SegmentCancelledError("其他片段处理失败，已取消")
+            result_path = download_file(str(result_url), os.path.join(work_dir, f"result_{index:03d}.mp4"))
+
+            with lock:
+                finished[0] += 1
+                if progress_callback:
+                    progress_callback(1, f"已完成 {finished[0]}/{total} 个片段")
+            return result_path
+
+        pool = ThreadPoolExecutor(max_workers=max(1, min(SEGMENT_WORKERS, total)), thread_name_prefix="segment")
+        try:
+            futures = [pool.submit(process, i, path) for i, path in enumerate(segment_paths)]
+            # 任一片段失败立即结束：未开始的片段取消，进行中的片段不再下载结果
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            # 抛出真正失败的片段的错误，而不是因此取消的片段
+            errors = sorted((future.exception() for future in done if future.exception()),
+                            key=lambda error: isinstance(error, SegmentCancelledError))
+            if errors:
+                raise errors[0]
+            result_paths = [future.result() for future in futures]
+        finally:
+            # 等进行中的片段结束后再删除工作目录，避免它们写入已删除的目录
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        if progress_callback:
+            progress_callback(1, "正在拼接视频...")
+        output_path = os.path.join(RESULT_DIR, f"{uuid.uuid4().hex}.mp4")
+        return concat_segments(result_paths, video_path, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def resume_swap_akool_segmented(face_image_path: str, segments: dict, progress_callback=None,
+                                stage_callback=None, video_info: dict = None, elapsed: float = 0) -> str:
+    """
+    继续处理服务重启前未完成的分段任务：已提交的片段继续等待结果，其余片段重新提交
+
+    Args:
+        face_image_path: 要替换的脸部照片路径
+        segments: 任务记录中的 akool_segments
+        progress_callback: 可选的进度回调函数
+        stage_callback: 可选的阶段回调函数(stage, data)，记录新提交的片段
+        video_info: 视频元数据
+        elapsed: 任务开始至今的秒数
+
+    Returns:
+        result_video_path: 拼接后的本地视频路径
+    """
+    if not os.path.exists(segments["video_path"]):
+        raise FileNotFoundError(f"分段任务的视频已被清理: {segments['video_path']}")
+    return swap_face_akool_segmented(
+        face_image_path, segments["video_path"], progress_callback, video_info, stage_callback,
+        segments=segments, elapsed=elapsed
+    )
+
+
+def resume_swap_akool(akool_id: str, progress_callback=None, video_info: dict = None, elapsed: float = 0,
+                      akool_key: str = None) -> str:
+    """
+    继续等待已提交的 Akool 任务（服务重启后恢复用，不会重新提交）
+
+    Args:
+        akool_id: 提交任务时返回的 Akool 任务 ID (_id)
+        progress_callback: 可选的进度回调函数
+        video_info: 视频元数据（用于估算处理时间）
+        elapsed: 任务提交至今的秒数
+        akool_key: 提交任务所用 Key 的指纹（默认 AKOOL_API_KEY，兼容旧任务）
 
     Returns:
         result_video_url: 处理后的视频 URL
     """
-    if replicate is None:
-        raise ImportError("replicate 模块未安装。请运行: pip install replicate")
-    if not REPLICATE_API_TOKEN:
-        raise ValueError("请在 .env 文件中设置 REPLICATE_API_TOKEN")
-
-    # 打开文件并调用 API
-    with open(face_image_path, 'rb') as face_file:
-        with open(video_path, 'rb') as video_file:
-            output = replicate.run(
-                API_CONFIGS["okaris_roop"]["model"],
-                input={
-                    "source": face_file,      # okaris/roop 使用 "source"
-                    "target": video_file,      # okaris/roop 使用 "target"
-                    "keep_fps": True,          # 保持原始帧率
-                    "keep_frames": True,       # 保持帧一致性
-                    "enhance_face": False      # 不增强面部（更快）
-                }
+    from utils.akool_keys import get_key_pool, key_fingerprint
+    from utils.akool_poller import get_poller
+    from utils.rate_limit import get_key_limiter
+
+    if not AKOOL_API_KEY:
+        raise ValueError("请在 .env 文件中设置 AKOOL_API_KEY")
+
+    # 任务只能在提交它的账号下查询；计入该 Key 的在途任务数
+    with get_key_pool().lease(fingerprint=akool_key or key_fingerprint(AKOOL_API_KEY)) as api_key:
+        # 任务已在 Akool 处理中，强制占用并发名额（不排队），新任务会相应等待
+        with get_key_limiter(api_key).job_slot(force=True):
+            return get_poller(api_key).wait(
+                job_id=akool_id,
+                progress_callback=progress_callback,
+                policy=build_polling_policy("akool", video_info or {}),
+                elapsed=elapsed
             )
 
-    # 处理 generator 返回结果
-    if hasattr(output, '__iter__') and not isinstance(output, (str, bytes)):
-        result_list = list(output)
-        if len(result_list) > 0:
-            return result_list[0]
-        else:
-            raise Exception("API 没有返回结果")
 
-    # 如果直接是字符串，直接返回
-    return output
+def swap_face_replicate_roop(face_image_path: str, video_path: str) -> str:
+    """
+    使用 Replicate okaris/roop API 进行换脸
+
+    Args:
+        face_image_path: 要替换的脸部照片路径
+        video_path: 源视频路径
+
+    Returns:
+        result_video_url: 处理后的视频 URL
+    """
+    from utils.backends import get_backend
+    return get_backend("okaris_roop").swap(face_image_path, video_path)
 
 
 def swap_face_vmodel(face_image_url: str, video_url: str, api_key: str) -> dict:
@@ -98,7 +341,7 @@ def swap_face_vmodel(face_image_url: str, video_url: str, api_key: str) -> dict:
         "source_video": video_url
     }
 
-    response = requests.post(url, json=payload, headers=headers)
+    response = get_session().post(url, json=payload, headers=headers)
 
     if response.status_code == 200:
         result = response.json()
@@ -118,42 +361,173 @@ def estimate_cost(video_duration_seconds: int, model: str = None) -> float:
     Returns:
         cost_usd: 预估成本（美元）
     """
+    from utils.backends import get_backend
+
+    try:
+        return get_backend(model).estimate_cost(video_duration_seconds)
+    except ValueError:
+        # 没有注册后端的模型按配置中的单价估算
+        return API_CONFIGS.get(model, {}).get("cost", 0)
+
+
+# 没有历史记录时，上传和检测人脸等准备工作的预估耗时（秒）
+DEFAULT_PREPARE_SECONDS = 30.0
+
+
+def estimate_processing_time(video_info: dict, model: str = None) -> float:
+    """
+    预估任务从开始处理到完成的耗时：准备时间（上传等）取最近任务的中位数，
+    API 处理时间按视频时长和分辨率套用历史任务拟合的速率（见 PollingPolicy.estimate_seconds）
+
+    Args:
+        video_info: 视频元数据（probe_video 的返回值）
+        model: 模型名称 (默认使用配置的FACE_SWAP_MODEL)
+
+    Returns:
+        float: 预估秒数
+    """
+    from utils.backends import get_backend
+    from utils.poll_policy import PollingPolicy
+    from utils.job_store import get_job_store
+
     model = model or FACE_SWAP_MODEL
+    store = get_job_store()
+
+    duration = video_info.get("duration")
+    rounds = 1
+    if get_backend(model).capabilities()["segmenting"] and should_segment(video_info):
+        # 分段处理：各片段并行，耗时约为单个片段 x 轮数
+        segments = math.ceil(duration / SEGMENT_SECONDS)
+        rounds = math.ceil(segments / max(SEGMENT_WORKERS, 1))
+        duration = SEGMENT_SECONDS
+
+    processing = PollingPolicy.estimate_seconds(
+        duration, video_info.get("width"), video_info.get("height"), store.processing_history(model)
+    )
+    preparation = store.preparation_history(model)
+    prepare = statistics.median(preparation) if len(preparation) >= PollingPolicy.MIN_HISTORY else DEFAULT_PREPARE_SECONDS
+
+    return prepare + processing * rounds
 
-    if model == "akool":
-        # Akool: 10 credits per 10 seconds, roughly $0.10 per 10 seconds
-        return (video_duration_seconds / 10) * API_CONFIGS["akool"]["cost_per_10s"]
-    elif model == "okaris_roop":
-        return API_CONFIGS["okaris_roop"]["cost"]
-    elif model == "replicate_roop":
-        return API_CONFIGS["replicate_roop"]["cost"]
-    elif model == "vmodel":
-        return video_duration_seconds * API_CONFIGS["vmodel"]["cost_per_second"]
-    else:
-        return 0
 
+def check_cost_limit(video_info: dict, model: str = None, owner: str = None) -> float:
+    """
+    检查任务的预估成本是否超过用户的成本上限（USER_COST_CEILINGS，默认 MAX_JOB_COST_USD）
+
+    Args:
+        video_info: 视频元数据（probe_video 的返回值）
+        model: 模型名称 (默认使用配置的FACE_SWAP_MODEL)
+        owner: 提交任务的用户名
 
-def swap_face(face_image_path: str, video_path: str, model: str = None, progress_callback=None) -> str:
+    Returns:
+        float: 预估成本（美元）；时长未知时按 0 秒计算
+    """
+    from utils.router import cost_ceiling
+
+    cost = estimate_cost(video_info.get("duration") or 0, model)
+    limit = cost_ceiling(owner)
+    if limit and cost > limit:
+        raise ValueError(f"预估成本 ${cost:.2f} 超过单个任务上限 ${limit:.2f}，请裁剪视频后再提交")
+    return cost
+
+
+# 输入或配置错误：换用其他模型也不会成功，不计入熔断统计，也不切换
+INPUT_ERRORS = (ValueError, FileNotFoundError, ImportError)
+
+
+def swap_face(face_image_path: str, video_path: str, model: str = None, progress_callback=None,
+              stage_callback=None, video_info: dict = None, owner: str = None) -> str:
     """
     通用换脸函数，根据配置自动选择 API
 
+    先尝试指定的模型，再按 FAILOVER_MODELS 顺序尝试已配置的备用模型。
+    熔断中的模型直接跳过，预估成本超过用户上限的备用模型也不使用（与提交时的 check_cost_limit 相同）；
+    改用备用模型时通过 stage_callback("failover", {"model": ...}) 通知。
+    只有在远程任务提交之前失败才切换：任务已提交（已计费）后失败时直接抛出，
+    任务 ID 保留在任务记录中，不会在备用模型上重复付费
+
     Args:
         face_image_path: 要替换的脸部照片路径
         video_path: 源视频路径
         model: 使用的模型 (默认使用配置的FACE_SWAP_MODEL)
         progress_callback: 可选的进度回调函数
+        stage_callback: 可选的阶段回调函数(stage, data)，提交后记录任务 ID，用于服务重启后恢复
+        video_info: 视频元数据（probe_video 的返回值），默认按需读取
+        owner: 提交任务的用户名，用于检查备用模型的成本上限
 
     Returns:
         result_video_url: 处理后的视频 URL
+
+    Raises:
+        CircuitOpenError: 所有可用模型都处于熔断状态
     """
+    from utils.backends import get_backend
+    from utils.circuit_breaker import CircuitOpenError, get_breaker
+
     model = model or FACE_SWAP_MODEL
+    # 未注册的模型抛出 ValueError
+    get_backend(model)
+
+    available = get_available_models()
+    candidates = [model]
+    for name in FAILOVER_MODELS:
+        if name == model or name not in available:
+            continue
+        try:
+            check_cost_limit(video_info or {}, name, owner)
+        except ValueError as e:
+            print(f"Skipping failover to {name}: {e}")
+            continue
+        candidates.append(name)
+
+    last_error = None
+    for name in candidates:
+        breaker = get_breaker(name)
+        if not breaker.allow():
+            print(f"Skipping {name}: circuit open")
+            continue
+
+        if name != model:
+            if progress_callback:
+                progress_callback(1, f"{get_backend(model).display_name} 暂时不可用，改用 {get_backend(name).display_name}...")
+            if stage_callback:
+                # 放弃之前提交的任务，服务重启后不再恢复它
+                stage_callback("failover", {
+                    "model": name, "akool_id": None, "akool_key": None, "remote_id": None, "akool_segments": None
+                })
+
+        # 首次提交远程任务的时间：之前在本地等待并发名额和上传的时间不计入"慢"的判断
+        submitted = []
+
+        def record_stage(stage, data):
+            if data.get("akool_id") or data.get("remote_id") or data.get("akool_segments"):
+                submitted.append(time.time())
+            if stage_callback:
+                stage_callback(stage, data)
+
+        try:
+            result = get_backend(name).swap(face_image_path, video_path, progress_callback, record_stage, video_info)
+        except INPUT_ERRORS:
+            breaker.release()
+            raise
+        except Exception as e:
+            breaker.record(success=False)
+            print(f"Face swap with {name} failed: {e}")
+            if submitted:
+                raise
+            last_error = e
+            continue
+
+        # 没有报告远程任务 ID 的后端无法区分本地等待和处理时间，不判断慢
+        elapsed = time.time() - submitted[0] if submitted else 0
+        slow = bool(video_info and video_info.get("duration")) and \
+            elapsed > CIRCUIT_SLOW_FACTOR * estimate_processing_time(video_info, name)
+        breaker.record(success=True, slow=slow)
+        return result
 
-    if model == "akool":
-        return swap_face_akool(face_image_path, video_path, progress_callback)
-    elif model == "okaris_roop":
-        return swap_face_replicate_roop(face_image_path, video_path)
-    else:
-        raise ValueError(f"不支持的模型: {model}")
+    if last_error:
+        raise last_error
+    raise CircuitOpenError(f"{get_backend(model).display_name} 暂时不可用（连续失败后熔断），请稍后再试")
 
 
 def get_available_models() -> list:
@@ -163,14 +537,9 @@ def get_available_models() -> list:
     Returns:
         list: 可用模型名称列表
     """
-    available = []
-
-    if AKOOL_API_KEY:
-        available.append("akool")
-    if REPLICATE_API_TOKEN:
-        available.append("okaris_roop")
+    from utils.backends import list_backends
 
-    return available
+    return [backend.name for backend in list_backends() if backend.is_available()]
 
 
 def get_model_info(model: str = None) -> dict:
@@ -1,5 +1,8 @@
 import os
 import uuid
+import hashlib
+import threading
+from collections import OrderedDict
 from pathlib import Path
 import time
 from config import UPLOAD_DIR, RESULT_DIR
@@ -30,6 +33,43 @@ def save_uploaded_file(uploaded_file, file_type="image") -> str:
     return file_path
 
 
+# (路径, 大小, 修改时间) -> 哈希，避免同一文件在一个任务的多个阶段重复计算
+_hash_memo = OrderedDict()
+_hash_memo_lock = threading.Lock()
+_HASH_MEMO_SIZE = 256
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    分块计算文件的 SHA-256（不会把整个文件读入内存）
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with _hash_memo_lock:
+        if memo_key in _hash_memo:
+            _hash_memo.move_to_end(memo_key)
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    with _hash_memo_lock:
+        _hash_memo[memo_key] = content_hash
+        while len(_hash_memo) > _HASH_MEMO_SIZE:
+            _hash_memo.popitem(last=False)
+    return content_hash
+
+
 def cleanup_old_files(directory: str, max_age_hours: int = 24):
     """
     清理超过指定时间的旧文件
@@ -51,3 +91,22 @@ def cleanup_old_files(directory: str, max_age_hours: int = 24):
                     print(f"Deleted old file: {filename}")
                 except Exception as e:
                     print(f"Error deleting {filename}: {e}")
+
+
+def deferred_file_reader(file_path: str):
+    """
+    生成延迟读取文件的回调，用于 st.download_button(data=...)（需要 Streamlit 1.52+）
+
+    Streamlit 只在用户点击下载时调用回调，页面每次刷新不会读取文件。
+    点击后 Streamlit 总会把返回值整体转成 bytes，所以直接在 with 块中读出内容，文件随即关闭
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        callable: 返回文件内容（bytes）的无参函数
+    """
+    def read_file() -> bytes:
+        with open(file_path, "rb") as f:
+            return f.read()
+    return read_file
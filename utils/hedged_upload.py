@@ -0,0 +1,227 @@
+"""
+Hedged uploads across several hosting services
+
+Trying hosting services one after another stacks their timeouts: a
+hanging primary delays the fallback by minutes. hedged_upload starts the
+healthiest service first and, if it stops making progress for a latency
+budget, starts the next one in parallel. The first successful upload wins
+and the others are cancelled through their MultipartFileStream.
+
+Each service keeps an exponentially weighted success rate and throughput,
+so a service that keeps failing or crawling is moved behind the others.
+"""
+
+import queue
+import threading
+import time
+
+from utils.multipart import UploadCancelled
+
+# Start the next service when the running ones made no progress for this long
+DEFAULT_HEDGE_SECONDS = 15
+# Once the whole file is sent, the host may take a while to store it before it
+# answers; only hedge against an upload waiting for its response after this long
+DEFAULT_RESPONSE_SECONDS = 120
+
+
+class ServiceHealth:
+    """Recent success rate and throughput of one hosting service"""
+
+    ALPHA = 0.3
+
+    def __init__(self, name: str):
+        self.name = name
+        self.success_rate = 1.0
+        self.throughput = None      # bytes per second, None until the first success
+        self.successes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, size: int, seconds: float):
+        """
+        Record a finished upload
+
+        Args:
+            size: Bytes uploaded
+            seconds: Wall-clock duration of the upload
+        """
+        rate = size / max(seconds, 0.001)
+        with self._lock:
+            self.successes += 1
+            self.success_rate += self.ALPHA * (1.0 - self.success_rate)
+            if self.throughput is None:
+                self.throughput = rate
+            else:
+                self.throughput += self.ALPHA * (rate - self.throughput)
+
+    def record_failure(self):
+        """Record a failed upload (cancelled uploads are not failures)"""
+        with self._lock:
+            self.failures += 1
+            self.success_rate -= self.ALPHA * self.success_rate
+
+    def rank_key(self) -> tuple:
+        """
+        Sort key, best first: success rate in steps of 0.1 so that noise does
+        not reshuffle services, then throughput (untried services last)
+        """
+        return -round(self.success_rate, 1), -(self.throughput or 0)
+
+    def snapshot(self) -> dict:
+        return {
+            "success_rate": round(self.success_rate, 3),
+            "throughput": self.throughput,
+            "successes": self.successes,
+            "failures": self.failures,
+        }
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_service_health(name: str) -> ServiceHealth:
+    """Get the process-wide health record of a hosting service"""
+    with _health_lock:
+        if name not in _health:
+            _health[name] = ServiceHealth(name)
+        return _health[name]
+
+
+def health_snapshot() -> dict:
+    """Health of every service used so far, e.g. for a status page"""
+    with _health_lock:
+        return {name: health.snapshot() for name, health in _health.items()}
+
+
+def rank_services(services: list) -> list:
+    """
+    Order services by health; ties keep the configured order
+
+    Args:
+        services: [(name, upload_func, lifetime), ...]
+
+    Returns:
+        The same entries, healthiest first
+    """
+    return sorted(services, key=lambda service: get_service_health(service[0]).rank_key())
+
+
+class _Attempt:
+    """One upload running in its own thread"""
+
+    def __init__(self, service: tuple, file_path: str, on_progress, results: queue.Queue):
+        self.name, self.upload_func, self.lifetime = service
+        self.file_path = file_path
+        self.cancel_event = threading.Event()
+        self.started_at = time.time()
+        self.last_progress = self.started_at
+        self.bytes_sent = 0
+        self.total = 0
+        self.done = False
+        self._on_progress = on_progress
+        self._results = results
+
+        threading.Thread(target=self._run, name=f"upload-{self.name}", daemon=True).start()
+
+    def fraction(self) -> float:
+        return self.bytes_sent / self.total if self.total else 0.0
+
+    def stalled(self, budget: float, now: float, response_budget: float = DEFAULT_RESPONSE_SECONDS) -> bool:
+        """
+        Whether the upload made no progress for budget seconds (or, with the
+        whole file already sent, got no response for response_budget seconds)
+        """
+        if self.done:
+            return False
+        if self.total and self.bytes_sent >= self.total:
+            budget = max(budget, response_budget)
+        return now - self.last_progress >= budget
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _progress(self, bytes_sent: int, total: int):
+        self.bytes_sent = bytes_sent
+        self.total = total
+        self.last_progress = time.time()
+        self._on_progress(self)
+
+    def _run(self):
+        try:
+            url = self.upload_func(self.file_path, self._progress, self.cancel_event)
+            self._results.put((self, url, None))
+        except Exception as e:
+            self._results.put((self, None, e))
+
+
+def hedged_upload(file_path: str, services: list, hedge_after: float = DEFAULT_HEDGE_SECONDS,
+                  progress_callback=None, response_timeout: float = DEFAULT_RESPONSE_SECONDS) -> tuple:
+    """
+    Upload a file to the first hosting service that succeeds
+
+    Args:
+        file_path: Local file path
+        services: [(name, upload_func, lifetime), ...]; upload_func is called
+            as upload_func(file_path, progress_callback, cancel_event) and
+            returns the public URL
+        hedge_after: Seconds without progress before the next service is
+            started in parallel (0 = only on failure, i.e. sequential fallback)
+        progress_callback: Optional callback(bytes_sent, total_bytes), fed by
+            whichever upload is furthest along
+        response_timeout: Seconds an upload that already sent the whole file
+            may wait for the host's response before it counts as stalled
+
+    Returns:
+        (name, url, lifetime) of the winning service
+    """
+    ordered = rank_services(services)
+    if not ordered:
+        raise ValueError("No hosting services configured")
+
+    results = queue.Queue()
+    attempts = []
+    errors = []
+    progress_lock = threading.Lock()
+
+    def on_progress(attempt: _Attempt):
+        if progress_callback is None:
+            return
+        with progress_lock:
+            # Only the leading upload reports, so the bar does not jump back
+            if all(attempt.fraction() >= other.fraction() for other in attempts if not other.done):
+                progress_callback(attempt.bytes_sent, attempt.total)
+
+    def launch():
+        attempts.append(_Attempt(ordered[len(attempts)], file_path, on_progress, results))
+
+    launch()
+    while True:
+        try:
+            attempt, url, error = results.get(timeout=min(hedge_after, 0.5) if hedge_after else None)
+        except queue.Empty:
+            now = time.time()
+            running = [a for a in attempts if not a.done]
+            if len(attempts) < len(ordered) and all(a.stalled(hedge_after, now, response_timeout) for a in running):
+                print(f"[Upload] {', '.join(a.name for a in running)} stalled, starting {ordered[len(attempts)][0]}")
+                launch()
+            continue
+
+        attempt.done = True
+        health = get_service_health(attempt.name)
+
+        if error is None:
+            health.record_success(attempt.total or attempt.bytes_sent, time.time() - attempt.started_at)
+            for other in attempts:
+                if other is not attempt:
+                    other.cancel()
+            return attempt.name, url, attempt.lifetime
+
+        if not isinstance(error, UploadCancelled):
+            health.record_failure()
+        errors.append(f"{attempt.name}: {error}")
+
+        if all(a.done for a in attempts):
+            if len(attempts) == len(ordered):
+                raise Exception(f"Failed to upload file to any hosting service: {'; '.join(errors)}")
+            launch()
@@ -0,0 +1,68 @@
+"""
+共享 HTTP 连接池
+requests.Session 按主机维护 urllib3 连接池，多个任务、多个线程共用同一个 Session
+可以复用已建立的 TCP/TLS 连接（keep-alive），不用每次请求都重新握手。
+
+Session 按名称创建一次后在进程内共享。并发使用时只能通过请求参数
+（headers=、timeout= 等）传入各自的设置，不要修改共享 Session 的 headers/cookies
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_POOL_MAXSIZE
+
+# 每个 Session 缓存连接池的主机数
+POOL_CONNECTIONS = 16
+
+
+def create_session(headers: dict = None, pool_maxsize: int = HTTP_POOL_MAXSIZE) -> requests.Session:
+    """
+    创建带连接池的 Session
+
+    Args:
+        headers: 所有请求共用的请求头（创建后不再修改）
+        pool_maxsize: 每个主机保持的连接数
+
+    Returns:
+        requests.Session: 新的 Session
+    """
+    session = requests.Session()
+    # 连接池满时不阻塞，多出的连接用完即关闭
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(name: str = "default") -> requests.Session:
+    """
+    获取进程内共享的 Session
+
+    Args:
+        name: 用途名称（如 "uploads"、"downloads"），不同用途使用独立的连接池
+
+    Returns:
+        requests.Session: 共享的 Session
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = create_session()
+            _sessions[name] = session
+        return session
+
+
+def close_sessions():
+    """关闭所有共享 Session（进程退出或测试清理时调用）"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
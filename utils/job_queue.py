@@ -0,0 +1,655 @@
+"""
+后台任务队列
+换脸任务提交后在工作线程池中运行，页面只需通过任务 ID 轮询状态，
+不再在 Streamlit 脚本线程中阻塞等待上传和 API 轮询
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config import (
+    JOB_WORKERS, FACE_SWAP_MODEL, RESULT_MIRROR_ENABLED, ROUTING_ENABLED, BATCH_MAX_CONCURRENT_JOBS, BATCH_MAX_ITEMS,
+    PREFETCH_WORKERS, RESULT_URL_CACHE_TTL_HOURS
+)
+from utils.job_store import JobStore, get_job_store
+from utils.file_handler import file_sha256
+from utils.result_cache import get_result_cache, result_key
+from utils.upload_cache import release_upload
+from utils.router import AUTO_MODEL, get_router
+from utils.video_preprocess import preprocess_video
+from utils.video_probe import probe_video
+
+
+class Job:
+    """换脸任务状态"""
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_SUBMITTED = "submitted"    # 已提交到换脸 API，等待结果
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+
+    FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+    # 各阶段完成后记录的时间戳列
+    STAGE_TIMESTAMPS = {
+        "uploaded": "uploaded_at",
+        "submitted": "submitted_at",
+    }
+
+    @classmethod
+    def is_finished(cls, job: dict) -> bool:
+        return job["status"] in cls.FINISHED_STATUSES
+
+
+class JobManager:
+    """
+    换脸任务管理器
+
+    submit() 立即返回任务 ID，任务在线程池中执行 swap_face；
+    get() 返回任务记录，可在任意线程调用。
+    任务的每次状态变化都写入 JobStore，服务重启后由 recover() 继续处理
+    """
+
+    # 上传输入文件时的进度区间（%）：开始处理时为下限，提交到换脸 API 后为上限
+    UPLOAD_PROGRESS = (10, 40)
+
+    # 远程任务成功后保存结果出错（如数据库被锁）时的尝试次数和首次重试等待秒数（之后每次加倍）
+    FINISH_ATTEMPTS = 3
+    FINISH_RETRY_SECONDS = 1
+
+    def __init__(self, max_workers: int = JOB_WORKERS, store: JobStore = None, runner: str = None):
+        """
+        初始化任务管理器
+
+        Args:
+            max_workers: 工作线程数（即同时处理的任务数）
+            store: 任务存储（默认使用配置的 DB_PATH）
+            runner: 进程标识，写入本管理器创建的任务（网页为 None，命令行为 "cli:<报告路径>"）。
+                网页和命令行共用任务库，recover() 只恢复 runner 相同的任务
+        """
+        self.max_workers = max_workers
+        self.store = store or get_job_store()
+        self.runner = runner
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="faceswap-job")
+        # 关键点预取使用独立的小线程池，一个批次的几十张照片不会占满换脸任务的工作线程
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=PREFETCH_WORKERS, thread_name_prefix="landmark-prefetch"
+        )
+        self._active = set()
+        # 单飞：结果缓存键 -> 正在处理的任务 ID，以及等待它的相同任务
+        self._inflight = {}
+        self._followers = {}
+        self._lock = threading.Lock()
+        # 批次补充调度时持有，避免同时结束的任务各自调度导致超出批次并发数
+        self._batch_lock = threading.Lock()
+
+    def submit(self, face_image_path: str, video_path: str, model: str = None, owner: str = None) -> str:
+        """
+        提交换脸任务
+
+        Args:
+            face_image_path: 脸部照片路径
+            video_path: 源视频路径
+            model: 使用的模型 (默认使用配置的FACE_SWAP_MODEL；开启自动路由时在开始处理时选择)
+            owner: 提交任务的用户名
+
+        Returns:
+            job_id: 任务 ID
+        """
+        # 预估成本超过上限时直接拒绝，不占用队列
+        model = self._admit(probe_video(video_path), model, owner)
+        job_id = self._create(face_image_path, video_path, model, owner)
+        self._schedule(job_id, self._run)
+        return job_id
+
+    def submit_batch(self, items: list, model: str = None, owner: str = None) -> str:
+        """
+        提交批量任务（例如同一个视频换成几十位销售的脸）
+
+        每个视频只探测和检查成本一次；同一视频的压缩和上传按内容单飞，整个批次只执行一次；
+        照片的人脸检测提前在后台并行完成（仅 Akool）。批次内同时处理的任务数不超过
+        BATCH_MAX_CONCURRENT_JOBS，其余任务在批次内排队，不会占满所有工作线程
+
+        Args:
+            items: [{"face_path", "video_path", "label"(可选)}, ...]
+            model: 使用的模型（默认与 submit 相同）
+            owner: 提交任务的用户名
+
+        Returns:
+            batch_id: 批次 ID
+
+        Raises:
+            ValueError: 任务数为 0 或超过 BATCH_MAX_ITEMS、模型不存在，或某个视频的预估成本超过上限
+        """
+        from utils.backends import get_backend
+
+        if not items:
+            raise ValueError("批量任务中没有任务")
+        if len(items) > BATCH_MAX_ITEMS:
+            raise ValueError(f"一个批次最多 {BATCH_MAX_ITEMS} 个任务，当前 {len(items)} 个")
+
+        # 全部检查通过后再创建任务，模型不存在或任一视频超出成本上限时整批拒绝
+        # （自动路由的任务在开始时才选择模型，按主模型判断是否预取）
+        backend = get_backend(model if model not in (None, AUTO_MODEL) else FACE_SWAP_MODEL)
+        models = {}
+        for video_path in dict.fromkeys(item["video_path"] for item in items):
+            models[video_path] = self._admit(probe_video(video_path), model, owner)
+
+        batch_id = uuid.uuid4().hex
+        for item in items:
+            self._create(
+                item["face_path"], item["video_path"], models[item["video_path"]], owner,
+                batch_id=batch_id, label=item.get("label"), message="批量任务排队中..."
+            )
+
+        if backend.capabilities()["prefetch_landmarks"] and backend.is_available():
+            for face_path in dict.fromkeys(item["face_path"] for item in items):
+                self.prefetch_landmarks(face_path)
+
+        self._fill_batch(batch_id)
+        return batch_id
+
+    def get_batch(self, batch_id: str) -> list:
+        """
+        获取批次中的任务
+
+        Args:
+            batch_id: 批次 ID
+
+        Returns:
+            list: 任务记录列表（按提交顺序），批次不存在时为空列表
+        """
+        return self.store.list_batch(batch_id)
+
+    def list_batches(self, owner: str = None, limit: int = 20) -> list:
+        """
+        列出批次（按提交时间倒序）
+
+        Args:
+            owner: 只返回该用户的批次（默认返回全部）
+            limit: 最多返回条数
+
+        Returns:
+            list: [{"batch_id", "jobs", "finished", "created_at"}, ...]
+        """
+        return self.store.list_batches(owner=owner, limit=limit)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        获取任务状态
+
+        Args:
+            job_id: 任务 ID
+
+        Returns:
+            dict: 任务记录，任务不存在时返回 None
+        """
+        return self.store.get(job_id)
+
+    def list_jobs(self, owner: str = None, limit: int = 100) -> list:
+        """
+        列出任务（按提交时间倒序）
+
+        Args:
+            owner: 只返回该用户的任务（默认返回全部）
+            limit: 最多返回条数
+
+        Returns:
+            list: 任务记录列表
+        """
+        return self.store.list_jobs(owner=owner, limit=limit)
+
+    def active_count(self) -> int:
+        """返回排队中和运行中的任务数"""
+        with self._lock:
+            return len(self._active)
+
+    def recover(self, job_ids: list = None) -> int:
+        """
+        恢复上次进程退出时未完成的任务
+
+        已拿到后端任务 ID 且后端支持恢复的任务只继续轮询结果，不会重新提交；
+        尚未提交的任务在输入文件仍存在时重新排队，否则标记为失败。
+        其他进程创建的任务（runner 不同，例如网页重启时命令行仍在运行）不处理，
+        否则两个进程会各自提交同一个付费任务
+
+        Args:
+            job_ids: 只恢复这些任务（例如命令行只恢复自己清单中的任务），默认恢复全部
+
+        Returns:
+            int: 重新调度的任务数
+        """
+        from utils.backends import get_backend
+
+        recovered = 0
+        batches = set()
+        for job in self.store.list_unfinished(Job.FINISHED_STATUSES):
+            if job["runner"] != self.runner:
+                continue
+            if job_ids is not None and job["job_id"] not in job_ids:
+                continue
+            try:
+                resumable = get_backend(job["model"]).capabilities()["resumable"]
+            except ValueError:
+                resumable = False
+            if resumable and (job["akool_id"] or job["remote_id"] or job["akool_segments"]):
+                # 先登记为处理中，重新排队的相同任务会等待它的结果
+                if job["result_key"]:
+                    self._claim(job["result_key"], job["job_id"])
+                self._schedule(job["job_id"], self._resume)
+                recovered += 1
+            elif os.path.exists(job["face_path"] or "") and os.path.exists(job["video_path"] or ""):
+                self.store.update(job["job_id"], status=Job.STATUS_QUEUED, message="服务重启，重新排队...")
+                # 批量任务按批次并发数重新调度
+                if job["batch_id"]:
+                    batches.add(job["batch_id"])
+                else:
+                    self._schedule(job["job_id"], self._run)
+                recovered += 1
+            else:
+                self.store.update(
+                    job["job_id"],
+                    status=Job.STATUS_FAILED,
+                    message="处理失败",
+                    error="服务重启时任务尚未提交，且输入文件已被清理",
+                    finished_at=time.time()
+                )
+
+        for batch_id in batches:
+            self._fill_batch(batch_id)
+        return recovered
+
+    def prefetch_landmarks(self, face_image_path: str):
+        """
+        在后台提前上传照片并检测人脸关键点（仅 Akool）
+
+        结果写入上传缓存和关键点缓存，之后提交的任务可跳过这两步；失败时静默忽略，
+        提交任务时会重新执行。在独立的预取线程池中运行，并从 Key 池中租用 Key，
+        检测请求计入该 Key 的限流
+
+        Args:
+            face_image_path: 脸部照片路径
+        """
+        from utils.akool_client import prefetch_face_landmarks
+        from utils.akool_keys import get_key_pool
+
+        def prefetch():
+            try:
+                with get_key_pool().lease() as api_key:
+                    prefetch_face_landmarks(face_image_path, api_key=api_key)
+            except Exception as e:
+                print(f"Landmark prefetch failed for {face_image_path}: {e}")
+
+        self._prefetch_executor.submit(prefetch)
+
+    def shutdown(self, wait: bool = True):
+        """停止线程池"""
+        self._prefetch_executor.shutdown(wait=wait)
+        self._executor.shutdown(wait=wait)
+
+    def _admit(self, video_info: dict, model: str, owner: str) -> str:
+        """
+        检查成本上限
+
+        Returns:
+            str: 任务记录的模型（开启自动路由且未指定模型时为 AUTO_MODEL）
+        """
+        from utils.face_swap import check_cost_limit
+
+        if model is None and ROUTING_ENABLED:
+            get_router().choose(video_info, owner)
+            return AUTO_MODEL
+        check_cost_limit(video_info, model, owner)
+        return model or FACE_SWAP_MODEL
+
+    def _create(self, face_image_path: str, video_path: str, model: str, owner: str,
+                message: str = "排队中...", **fields) -> str:
+        """新增排队中的任务记录，返回任务 ID"""
+        job_id = uuid.uuid4().hex
+        self.store.insert({
+            "job_id": job_id,
+            "owner": owner,
+            "runner": self.runner,
+            "model": model,
+            "status": Job.STATUS_QUEUED,
+            "progress": 0,
+            "message": message,
+            "face_path": face_image_path,
+            "video_path": video_path,
+            "created_at": time.time(),
+            **fields
+        })
+        return job_id
+
+    def _fill_batch(self, batch_id: str):
+        """按批次并发数调度批次中排队的任务"""
+        with self._batch_lock:
+            jobs = self.store.list_batch(batch_id)
+            with self._lock:
+                running = sum(1 for job in jobs if job["job_id"] in self._active)
+                queued = [
+                    job["job_id"] for job in jobs
+                    if job["status"] == Job.STATUS_QUEUED and job["job_id"] not in self._active
+                ]
+            for job_id in queued[:max(0, BATCH_MAX_CONCURRENT_JOBS - running)]:
+                self._schedule(job_id, self._run)
+
+    def _schedule(self, job_id: str, target):
+        with self._lock:
+            if job_id in self._active:
+                return
+            self._active.add(job_id)
+        self._executor.submit(self._execute, job_id, target)
+
+    def _execute(self, job_id: str, target):
+        job = self.store.get(job_id)
+        try:
+            target(job)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+            # 批量任务结束后调度同批次的下一个任务
+            if job["batch_id"]:
+                self._fill_batch(job["batch_id"])
+
+    def _progress_callback(self, job_id: str):
+        """
+        进度回调：消息只更新显示的文字，进度在提交到换脸 API 时推进（见 _stage_callback）。
+        上传输入时 upload_progress_reporter 通过 upload_progress 传入已上传字节数，
+        进度按比例落在 UPLOAD_PROGRESS 区间内
+        """
+        low, high = self.UPLOAD_PROGRESS
+
+        def progress_callback(status, message):
+            self.store.update(job_id, message=message)
+
+        def upload_progress(bytes_sent, total, message):
+            progress = low + (high - low) * bytes_sent // total if total else high
+            self.store.update(job_id, progress=progress, message=message)
+
+        progress_callback.upload_progress = upload_progress
+        return progress_callback
+
+    def _stage_callback(self, job_id: str):
+        def stage_callback(stage, data):
+            # 嵌套字段（如各阶段耗时）以 JSON 保存
+            fields = {
+                key: json.dumps(value) if isinstance(value, dict) else value
+                for key, value in data.items()
+            }
+            timestamp_column = Job.STAGE_TIMESTAMPS.get(stage)
+            if timestamp_column:
+                fields[timestamp_column] = time.time()
+            if stage == "submitted":
+                fields["status"] = Job.STATUS_SUBMITTED
+            if stage in ("submitted", "segment_submitted"):
+                fields["progress"] = self.UPLOAD_PROGRESS[1]
+            self.store.update(job_id, **fields)
+        return stage_callback
+
+    def _run(self, job: dict):
+        """在工作线程中执行换脸"""
+        from utils.face_swap import swap_face
+
+        job_id = job["job_id"]
+        self.store.update(
+            job_id,
+            status=Job.STATUS_RUNNING,
+            progress=self.UPLOAD_PROGRESS[0],
+            message="开始处理...",
+            started_at=time.time()
+        )
+
+        try:
+            if job["model"] == AUTO_MODEL:
+                # 按当前各模型的耗时和排队情况选择，之后的缓存键和预处理都按选中的模型
+                job["model"] = get_router().choose(probe_video(job["video_path"]), job["owner"])
+                self.store.update(job_id, model=job["model"])
+
+            face_hash = file_sha256(job["face_path"])
+            video_hash = file_sha256(job["video_path"])
+            key = result_key(face_hash, video_hash, job["model"])
+            self.store.update(job_id, face_hash=face_hash, video_hash=video_hash, result_key=key)
+
+            # 相同输入已有结果时直接返回，不再提交付费任务
+            cached = get_result_cache().get(key)
+            if cached:
+                self._succeed(job_id, cached, message="处理完成！（相同照片和视频的结果已存在）", cache=False)
+                return
+
+            # 相同输入正在处理时等待它的结果，不占用工作线程
+            leader_id = self._claim(key, job_id)
+            if leader_id != job_id:
+                self.store.update(job_id, message="相同的照片和视频正在处理，等待结果...")
+                return
+
+            # 查询缓存和登记之间，之前的相同任务可能刚好完成
+            cached = get_result_cache().get(key)
+            if cached:
+                self._succeed(job_id, cached, message="处理完成！（相同照片和视频的结果已存在）", cache=False)
+                return
+
+            # 超出模型预处理策略的视频先压缩，之后上传和处理都使用代理文件
+            video_path, video_info = preprocess_video(
+                job["video_path"], job["model"], progress_callback=self._progress_callback(job_id)
+            )
+            self.store.update(
+                job_id,
+                video_duration=video_info.get("duration"),
+                video_width=video_info.get("width"),
+                video_height=video_info.get("height")
+            )
+            try:
+                result_url = swap_face(
+                    job["face_path"],
+                    video_path,
+                    model=job["model"],
+                    progress_callback=self._progress_callback(job_id),
+                    stage_callback=self._stage_callback(job_id),
+                    video_info=video_info,
+                    owner=job["owner"]
+                )
+            finally:
+                self._release_inputs(job_id, job["face_path"], video_path)
+        except Exception as e:
+            self._fail(job_id, e)
+            return
+
+        # 远程任务已成功（已计费），之后保存结果出错不能把任务标记为失败
+        self._complete(job_id, result_url)
+
+    def _resume(self, job: dict):
+        """继续等待已提交的任务结果"""
+        from utils.backends import get_backend
+
+        job_id = job["job_id"]
+        self.store.update(job_id, message="服务重启，继续等待处理结果...")
+
+        try:
+            result_url = get_backend(job["model"]).resume(
+                job, progress_callback=self._progress_callback(job_id), stage_callback=self._stage_callback(job_id)
+            )
+        except Exception as e:
+            self._fail(job_id, e)
+            return
+
+        self._complete(job_id, result_url)
+
+    def _complete(self, job_id: str, result_url):
+        """
+        保存远程已成功的任务结果，出错时重试
+
+        多次重试仍失败时任务保持未结束状态（不调用 _fail 覆盖远程的成功结果），
+        日志中保留结果 URL；任务记录中有远程任务 ID，服务重启后 recover() 继续查询结果，不会重新提交
+        """
+        for attempt in range(self.FINISH_ATTEMPTS):
+            try:
+                self._succeed(job_id, result_url)
+                return
+            except Exception as e:
+                error = e
+                print(f"Failed to save result of job {job_id} (attempt {attempt + 1}): {e}")
+                if attempt + 1 < self.FINISH_ATTEMPTS:
+                    time.sleep(self.FINISH_RETRY_SECONDS * 2 ** attempt)
+
+        print(f"Job {job_id} succeeded remotely but its result could not be saved: {result_url}")
+        try:
+            self.store.update(job_id, message="处理完成，但保存结果时出错，服务重启后重试", error=str(error))
+        except Exception as e:
+            print(f"Failed to record save error of job {job_id}: {e}")
+
+    def _release_inputs(self, job_id: str, face_path: str, video_path: str):
+        """
+        任务结束后从存储后端删除它上传的输入文件（其他未结束的任务仍在使用时保留）
+
+        video_path 可能是压缩后的代理文件；同一原视频的任务使用相同的代理文件，
+        所以按原视频的路径和哈希判断是否仍在使用。服务重启后恢复的任务不再删除，
+        由存储的保留期限清理
+        """
+        job = self.store.get(job_id)
+
+        def in_use(path_column: str, hash_column: str):
+            def check() -> bool:
+                return any(
+                    other["job_id"] != job_id and (
+                        other[path_column] == job[path_column]
+                        or (job[hash_column] and other[hash_column] == job[hash_column])
+                    )
+                    for other in self.store.list_unfinished(Job.FINISHED_STATUSES)
+                )
+            return check
+
+        for path, path_column, hash_column in ((face_path, "face_path", "face_hash"),
+                                               (video_path, "video_path", "video_hash")):
+            try:
+                release_upload(path, in_use(path_column, hash_column))
+            except Exception as e:
+                print(f"Failed to delete stored input {path} of job {job_id}: {e}")
+
+    def _claim(self, key: str, job_id: str) -> str:
+        """
+        登记正在处理的结果缓存键
+
+        Returns:
+            str: 负责处理该键的任务 ID；不是 job_id 时 job_id 已加入等待列表
+        """
+        with self._lock:
+            leader_id = self._inflight.setdefault(key, job_id)
+            if leader_id != job_id:
+                self._followers.setdefault(key, []).append(job_id)
+            return leader_id
+
+    def _release(self, job_id: str) -> list:
+        """任务结束时注销，返回等待它的任务 ID"""
+        job = self.store.get(job_id)
+        key = job["result_key"] if job else None
+        with self._lock:
+            if not key or self._inflight.get(key) != job_id:
+                return []
+            del self._inflight[key]
+            return self._followers.pop(key, [])
+
+    def _succeed(self, job_id: str, result_url, message: str = "处理完成！", cache: bool = True,
+                 result_path: str = None):
+        """
+        标记任务成功，并把结果交给等待中的相同任务
+
+        Args:
+            job_id: 任务 ID
+            result_url: 结果 URL 或本地文件路径
+            message: 显示给用户的消息
+            cache: 是否写入结果缓存（复用的结果不再写入，避免延长其有效期）
+            result_path: 已下载到本地的结果文件（默认为新结果下载一份）
+        """
+        result_url = str(result_url)
+        if result_path is None:
+            if os.path.isfile(result_url):
+                result_path = result_url
+            elif cache and RESULT_MIRROR_ENABLED:
+                result_path = self._mirror(job_id, result_url)
+
+        self.store.update(
+            job_id,
+            status=Job.STATUS_SUCCEEDED,
+            progress=100,
+            message=message,
+            result_url=result_url,
+            result_path=result_path,
+            finished_at=time.time()
+        )
+
+        job = self.store.get(job_id)
+        # 切换到备用模型时结果与缓存键的模型不一致，不写入缓存
+        if cache and job and job["result_key"] and \
+                job["result_key"] == result_key(job["face_hash"], job["video_hash"], job["model"]):
+            try:
+                if result_path:
+                    # 本地文件在供应商链接过期后仍可复用
+                    get_result_cache().put(job["result_key"], result_path, job_id)
+                else:
+                    # 只有供应商链接：按链接的有效期缓存，避免复用已失效的链接
+                    get_result_cache().put(job["result_key"], result_url, job_id, ttl_hours=RESULT_URL_CACHE_TTL_HOURS)
+            except Exception as e:
+                # 缓存只用于复用结果，写入失败不影响任务本身
+                print(f"Failed to cache result of job {job_id}: {e}")
+
+        # 等待的任务已从登记中移除：各自保存结果，一个出错不影响其他任务，也不让本任务重试
+        for follower_id in self._release(job_id):
+            try:
+                self._succeed(
+                    follower_id, result_url, message="处理完成！（与同时提交的相同任务共用结果）",
+                    cache=False, result_path=result_path
+                )
+            except Exception as e:
+                print(f"Failed to save shared result for job {follower_id}: {e}")
+
+    def _mirror(self, job_id: str, result_url: str) -> Optional[str]:
+        """把结果下载到 RESULT_DIR，失败时只记录日志（用户仍可通过 URL 下载）"""
+        from utils.downloader import mirror_result
+
+        self.store.update(job_id, progress=95, message="正在保存结果...")
+        try:
+            return mirror_result(result_url)
+        except Exception as e:
+            print(f"Failed to mirror result of job {job_id}: {e}")
+            return None
+
+    def _fail(self, job_id: str, error: Exception):
+        self.store.update(
+            job_id,
+            status=Job.STATUS_FAILED,
+            message="处理失败",
+            error=str(error),
+            finished_at=time.time()
+        )
+
+        for follower_id in self._release(job_id):
+            self._fail(follower_id, error)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """
+    获取进程内共享的任务管理器
+
+    Streamlit 每次重新运行脚本都会执行 app.py，但模块只导入一次，
+    因此所有会话共享同一个线程池和任务表。首次创建时启动回调接收服务（如已开启）
+    并恢复未完成的任务
+    """
+    from utils.webhook_server import get_webhook_server
+
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            get_webhook_server()
+            _manager = JobManager()
+            _manager.recover()
+        return _manager
@@ -0,0 +1,300 @@
+"""
+任务持久化存储（SQLite）
+每个处理阶段（上传、人脸检测、提交、完成）都会写入数据库，
+服务重启后可以根据 Akool 任务 ID 继续轮询结果，而不是重新提交付费任务
+"""
+import threading
+from typing import Optional
+
+from config import DB_PATH
+from utils.db import connect
+
+
+class JobStore:
+    """换脸任务表"""
+
+    # 列名 -> SQLite 类型；新增列会在打开数据库时自动补齐
+    COLUMNS = {
+        "job_id": "TEXT PRIMARY KEY",
+        "owner": "TEXT",
+        # 创建任务的进程：网页为空，命令行为 "cli:<报告路径>"；重启恢复时只接管自己的任务
+        "runner": "TEXT",
+        # 批量任务的批次 ID 和任务名称（例如销售姓名，用作导出的文件名）
+        "batch_id": "TEXT",
+        "label": "TEXT",
+        "model": "TEXT",
+        "status": "TEXT",
+        "progress": "INTEGER DEFAULT 0",
+        "message": "TEXT",
+        "face_path": "TEXT",
+        "video_path": "TEXT",
+        "face_hash": "TEXT",
+        "video_hash": "TEXT",
+        "result_key": "TEXT",
+        "video_duration": "REAL",
+        "video_width": "INTEGER",
+        "video_height": "INTEGER",
+        "face_url": "TEXT",
+        "video_url": "TEXT",
+        "landmarks": "TEXT",
+        "akool_key": "TEXT",
+        "akool_id": "TEXT",
+        # 长视频分段任务：各片段的 Akool 任务 ID（JSON）
+        "akool_segments": "TEXT",
+        # 其他后端的任务 ID
+        "remote_id": "TEXT",
+        "result_url": "TEXT",
+        "result_path": "TEXT",
+        "timings": "TEXT",
+        "error": "TEXT",
+        "created_at": "REAL",
+        "started_at": "REAL",
+        "uploaded_at": "REAL",
+        "submitted_at": "REAL",
+        "finished_at": "REAL",
+    }
+
+    def __init__(self, db_path: str = DB_PATH):
+        """
+        打开（或创建）任务数据库
+
+        Args:
+            db_path: SQLite 文件路径
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        with self._lock, self._conn:
+            self._create_table()
+
+    def _create_table(self):
+        columns = ", ".join(f"{name} {sql_type}" for name, sql_type in self.COLUMNS.items())
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS jobs ({columns})")
+
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for name, sql_type in self.COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {sql_type}")
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs (owner, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, created_at)")
+
+    def insert(self, job: dict):
+        """
+        新增任务记录
+
+        Args:
+            job: 任务字段（键必须是 COLUMNS 中的列名）
+        """
+        fields = {key: value for key, value in job.items() if key in self.COLUMNS}
+        names = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({names}) VALUES ({placeholders})",
+                list(fields.values())
+            )
+
+    def update(self, job_id: str, **fields):
+        """
+        更新任务字段
+
+        Args:
+            job_id: 任务 ID
+            **fields: 要更新的列
+        """
+        fields = {key: value for key, value in fields.items() if key in self.COLUMNS and key != "job_id"}
+        if not fields:
+            return
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                list(fields.values()) + [job_id]
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        读取任务记录
+
+        Args:
+            job_id: 任务 ID
+
+        Returns:
+            dict: 任务记录，不存在时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, owner: str = None, limit: int = 100) -> list:
+        """
+        列出任务记录（按提交时间倒序）
+
+        Args:
+            owner: 只返回该用户的任务（默认返回全部）
+            limit: 最多返回条数
+
+        Returns:
+            list: 任务记录列表
+        """
+        query = "SELECT * FROM jobs"
+        params = []
+        if owner is not None:
+            query += " WHERE owner = ?"
+            params.append(owner)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_batch(self, batch_id: str) -> list:
+        """
+        列出批次中的任务
+
+        Args:
+            batch_id: 批次 ID
+
+        Returns:
+            list: 任务记录列表（按提交顺序）
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at, rowid",
+                (batch_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_batches(self, owner: str = None, limit: int = 20) -> list:
+        """
+        列出批次（按提交时间倒序）
+
+        Args:
+            owner: 只返回该用户的批次（默认返回全部）
+            limit: 最多返回条数
+
+        Returns:
+            list: [{"batch_id", "jobs", "finished", "created_at"}, ...]
+        """
+        query = """
+            SELECT batch_id, COUNT(*) AS jobs,
+                   SUM(status IN ('succeeded', 'failed')) AS finished,
+                   MIN(created_at) AS created_at
+            FROM jobs WHERE batch_id IS NOT NULL
+        """
+        params = []
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        query += " GROUP BY batch_id ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_unfinished(self, finished_statuses: tuple) -> list:
+        """
+        列出未结束的任务（用于启动时恢复）
+
+        Args:
+            finished_statuses: 视为已结束的状态值
+
+        Returns:
+            list: 任务记录列表（按提交时间正序）
+        """
+        placeholders = ", ".join("?" for _ in finished_statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status NOT IN ({placeholders}) ORDER BY created_at",
+                list(finished_statuses)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def processing_history(self, model: str, limit: int = 50) -> list:
+        """
+        最近成功任务的处理耗时（用于估算新任务的完成时间）
+
+        Args:
+            model: 模型名称
+            limit: 最多返回条数
+
+        Returns:
+            list: [(视频时长秒, 视频像素数或 None, 提交到完成的秒数), ...]
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT video_duration, video_width * video_height AS pixels,
+                       finished_at - submitted_at AS seconds
+                FROM jobs
+                WHERE model = ? AND status = 'succeeded'
+                  AND video_duration IS NOT NULL AND submitted_at IS NOT NULL
+                ORDER BY finished_at DESC LIMIT ?
+                """,
+                (model, limit)
+            ).fetchall()
+        return [(row["video_duration"], row["pixels"], row["seconds"]) for row in rows]
+
+    def preparation_history(self, model: str, limit: int = 50) -> list:
+        """
+        最近成功任务从开始处理到提交 API 的耗时（上传、检测人脸等准备工作）
+
+        Args:
+            model: 模型名称
+            limit: 最多返回条数
+
+        Returns:
+            list: [准备秒数, ...]
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT submitted_at - started_at AS seconds
+                FROM jobs
+                WHERE model = ? AND status = 'succeeded'
+                  AND started_at IS NOT NULL AND submitted_at IS NOT NULL
+                ORDER BY finished_at DESC LIMIT ?
+                """,
+                (model, limit)
+            ).fetchall()
+        return [row["seconds"] for row in rows]
+
+    def recent_outcomes(self, model: str, limit: int = 50) -> list:
+        """
+        最近结束的任务（成功和失败，用于统计各模型的失败率和耗时）
+
+        Args:
+            model: 模型名称
+            limit: 最多返回条数
+
+        Returns:
+            list: 任务记录列表（status、video_duration 和各阶段时间戳），按结束时间倒序
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT status, video_duration, started_at, submitted_at, finished_at
+                FROM jobs
+                WHERE model = ? AND status IN ('succeeded', 'failed') AND finished_at IS NOT NULL
+                ORDER BY finished_at DESC LIMIT ?
+                """,
+                (model, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """获取进程内共享的任务存储"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
@@ -0,0 +1,104 @@
+"""
+人脸关键点缓存
+按照片内容哈希保存 Akool 人脸检测结果（关键点字符串和人脸区域），
+同一张照片再次换脸时不再调用检测接口。按最近使用时间淘汰（LRU）
+"""
+import json
+import threading
+import time
+from typing import Optional
+
+from config import DB_PATH, LANDMARK_CACHE_MAX_ENTRIES
+from utils.db import connect
+
+
+class LandmarkCache:
+    """照片内容哈希 -> 人脸关键点"""
+
+    def __init__(self, db_path: str = DB_PATH, max_entries: int = LANDMARK_CACHE_MAX_ENTRIES):
+        """
+        打开（或创建）关键点缓存表
+
+        Args:
+            db_path: SQLite 文件路径
+            max_entries: 最多保存的照片数，超出后淘汰最久未使用的记录
+        """
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS landmarks (
+                    image_hash TEXT PRIMARY KEY,
+                    landmarks TEXT NOT NULL,
+                    region TEXT,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_landmarks_last_used ON landmarks (last_used)")
+
+    def get(self, image_hash: str) -> Optional[dict]:
+        """
+        查询缓存（命中时刷新最近使用时间）
+
+        Args:
+            image_hash: 照片内容哈希
+
+        Returns:
+            dict: {"landmarks": str, "region": list 或 None}，未命中返回 None
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT landmarks, region FROM landmarks WHERE image_hash = ?", (image_hash,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE landmarks SET last_used = ? WHERE image_hash = ?", (time.time(), image_hash)
+            )
+
+        return {
+            "landmarks": row["landmarks"],
+            "region": json.loads(row["region"]) if row["region"] else None,
+        }
+
+    def put(self, image_hash: str, landmarks: str, region=None):
+        """
+        写入检测结果，并淘汰超出容量的旧记录
+
+        Args:
+            image_hash: 照片内容哈希
+            landmarks: 关键点字符串 ("x1,y1:x2,y2:...")
+            region: 人脸区域（检测接口原样返回的值）
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO landmarks (image_hash, landmarks, region, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (image_hash, landmarks, json.dumps(region) if region is not None else None, now, now)
+            )
+            self._conn.execute(
+                """
+                DELETE FROM landmarks WHERE image_hash IN (
+                    SELECT image_hash FROM landmarks ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_landmark_cache() -> LandmarkCache:
+    """获取进程内共享的关键点缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LandmarkCache()
+        return _cache
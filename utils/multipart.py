@@ -0,0 +1,193 @@
+"""
+Streaming multipart/form-data encoder
+
+requests builds `files={...}` bodies fully in memory, which for a 500 MB
+video means a 500 MB buffer per concurrent upload. MultipartFileStream is a
+file-like body with a known length: requests sends it with a
+Content-Length header and reads it in fixed-size chunks, so peak memory
+stays at one chunk regardless of file size.
+"""
+
+import mimetypes
+import os
+import time
+import uuid
+
+
+class UploadCancelled(Exception):
+    """Raised from read() after cancel() to abort an in-flight upload"""
+
+
+class MultipartFileStream:
+    """
+    Multipart body for one file plus optional plain form fields
+
+    Usage:
+        with MultipartFileStream("video.mp4", fields={"expires": "1d"}) as body:
+            requests.post(url, data=body, headers={"Content-Type": body.content_type})
+    """
+
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(
+        self,
+        file_path: str,
+        field_name: str = "file",
+        fields: dict = None,
+        progress_callback=None,
+        chunk_size: int = CHUNK_SIZE,
+        cancel_event=None
+    ):
+        """
+        Initialize encoder (the file is opened lazily on first read)
+
+        Args:
+            file_path: File to upload
+            field_name: Form field name of the file part
+            fields: Extra plain form fields
+            progress_callback: Optional callback(bytes_sent, total_bytes)
+            chunk_size: Bytes read from disk per chunk
+            cancel_event: Optional threading.Event; once set, read() raises
+                UploadCancelled (lets a caller abort a body it never sees)
+        """
+        self.file_path = file_path
+        self.progress_callback = progress_callback
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        self.bytes_sent = 0
+        self._cancelled = False
+        self._cancel_event = cancel_event
+        self._file = None
+
+        filename = os.path.basename(file_path)
+        mime_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        head = b""
+        for name, value in (fields or {}).items():
+            head += (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n"
+            ).encode("utf-8")
+        head += (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+            f"Content-Type: {mime_type}\r\n\r\n"
+        ).encode("utf-8")
+
+        self._head = head
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self._file_size = os.path.getsize(file_path)
+        self.total = len(self._head) + self._file_size + len(self._tail)
+
+        # Segments are consumed in order: head bytes, file, tail bytes
+        self._segment = 0
+        self._offset = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def cancel(self):
+        """Make the next read() raise UploadCancelled (used to abort a losing upload)"""
+        self._cancelled = True
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to size bytes of the encoded body
+
+        Args:
+            size: Maximum bytes to return (-1 or None for one chunk)
+
+        Returns:
+            Next part of the body, b"" at the end
+        """
+        if self._cancelled or (self._cancel_event is not None and self._cancel_event.is_set()):
+            raise UploadCancelled(f"Upload of {self.file_path} cancelled")
+        if size is None or size < 0:
+            size = self.chunk_size
+
+        pieces = []
+        length = 0
+        while length < size and self._segment < 3:
+            want = size - length
+            if self._segment == 1:
+                if self._file is None:
+                    self._file = open(self.file_path, "rb")
+                piece = self._file.read(min(want, self.chunk_size))
+            else:
+                source = self._head if self._segment == 0 else self._tail
+                piece = source[self._offset:self._offset + want]
+                self._offset += len(piece)
+
+            if not piece:
+                self._segment += 1
+                self._offset = 0
+                continue
+            pieces.append(piece)
+            length += len(piece)
+
+        data = b"".join(pieces)
+        self.bytes_sent += len(data)
+        if data and self.progress_callback:
+            self.progress_callback(self.bytes_sent, self.total)
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def upload_progress_reporter(progress_callback, label: str, min_interval: float = 1.0):
+    """
+    Adapt a progress_callback(status, message) to MultipartFileStream's
+    callback(bytes_sent, total_bytes), throttled to one message per interval
+
+    If progress_callback has an upload_progress(bytes_sent, total, message)
+    attribute, the byte counts go there instead so the caller can turn them
+    into a progress fraction (see JobManager._progress_callback).
+
+    Args:
+        progress_callback: Callback function(status, message), may be None
+        label: Message prefix, e.g. "Uploading video"
+        min_interval: Minimum seconds between messages
+
+    Returns:
+        Callback for MultipartFileStream, or None if progress_callback is None
+    """
+    if progress_callback is None:
+        return None
+
+    upload_progress = getattr(progress_callback, "upload_progress", None)
+    last_report = [0.0]
+
+    def report(bytes_sent: int, total: int):
+        now = time.time()
+        if bytes_sent < total and now - last_report[0] < min_interval:
+            return
+        last_report[0] = now
+        percent = bytes_sent * 100 // total if total else 100
+        message = f"{label}... {percent}% ({bytes_sent / 1048576:.1f}/{total / 1048576:.1f} MB)"
+        if upload_progress:
+            upload_progress(bytes_sent, total, message)
+        else:
+            progress_callback(1, message)
+
+    return report
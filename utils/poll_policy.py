@@ -0,0 +1,156 @@
+"""
+Adaptive polling schedule for Akool face swap jobs
+
+Estimates when a job should finish from the video's duration/resolution
+(and recorded timings of past jobs), then polls sparsely early on and
+densely around the expected finish, with jitter so that jobs submitted
+together do not poll in lockstep.
+"""
+
+import random
+from typing import Optional
+
+
+class PollingPolicy:
+    """
+    Polling schedule for one job
+
+    Before the expected finish the interval is half the remaining time
+    (clamped to [min_interval, max_interval]); once the job is overdue the
+    interval grows again slowly, so a stuck job does not poll at full rate.
+    """
+
+    # Fallback model when there is no usable history:
+    # expected = OVERHEAD_SECONDS + SECONDS_PER_VIDEO_SECOND * duration * resolution factor
+    OVERHEAD_SECONDS = 30.0
+    SECONDS_PER_VIDEO_SECOND = 4.0
+    REFERENCE_PIXELS = 1920 * 1080
+    DEFAULT_EXPECTED_SECONDS = 180.0
+
+    # Need at least this many past jobs before trusting history over the defaults
+    MIN_HISTORY = 3
+
+    def __init__(
+        self,
+        expected_seconds: float,
+        min_interval: float = 2,
+        max_interval: float = 30,
+        jitter: float = 0.2,
+        timeout: Optional[float] = None,
+        min_timeout: float = 600,
+        timeout_factor: float = 3
+    ):
+        """
+        Initialize policy
+
+        Args:
+            expected_seconds: Expected processing time after submission
+            min_interval: Shortest polling interval in seconds
+            max_interval: Longest polling interval in seconds
+            jitter: Relative random spread applied to every interval (0.2 = +/-20%)
+            timeout: Explicit timeout; default scales with expected_seconds
+            min_timeout: Lower bound for the scaled timeout
+            timeout_factor: Timeout as a multiple of expected_seconds
+        """
+        self.expected_seconds = max(expected_seconds, 1.0)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.timeout = timeout or max(min_timeout, self.expected_seconds * timeout_factor)
+
+    @classmethod
+    def fixed(cls, interval: float = 5, timeout: float = 600) -> "PollingPolicy":
+        """Constant interval without jitter (the previous behaviour)"""
+        return cls(expected_seconds=interval, min_interval=interval, max_interval=interval,
+                   jitter=0, timeout=timeout)
+
+    @classmethod
+    def for_video(
+        cls,
+        duration: Optional[float] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        history: Optional[list] = None,
+        **kwargs
+    ) -> "PollingPolicy":
+        """
+        Build a policy from video metadata and past job timings
+
+        Args:
+            duration: Video duration in seconds (None if unknown)
+            width: Video width in pixels
+            height: Video height in pixels
+            history: List of (video_duration, video_pixels, processing_seconds)
+                from finished jobs (video_pixels may be None)
+            **kwargs: Passed through to the constructor
+
+        Returns:
+            PollingPolicy
+        """
+        return cls(cls.estimate_seconds(duration, width, height, history), **kwargs)
+
+    @classmethod
+    def estimate_seconds(
+        cls,
+        duration: Optional[float] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        history: Optional[list] = None
+    ) -> float:
+        """
+        Expected processing time for a video
+
+        Args:
+            duration: Video duration in seconds (None if unknown)
+            width: Video width in pixels
+            height: Video height in pixels
+            history: List of (video_duration, video_pixels, processing_seconds)
+                from finished jobs (video_pixels may be None)
+
+        Returns:
+            Expected seconds from submission to result
+        """
+        if not duration:
+            return cls.DEFAULT_EXPECTED_SECONDS
+
+        rate = cls.SECONDS_PER_VIDEO_SECOND
+        samples = [
+            (seconds - cls.OVERHEAD_SECONDS) / (video_duration * cls.resolution_factor(pixels))
+            for video_duration, pixels, seconds in (history or [])
+            if video_duration and seconds and seconds > cls.OVERHEAD_SECONDS
+        ]
+        if len(samples) >= cls.MIN_HISTORY:
+            # Median is robust against the odd job that sat in the vendor queue
+            samples.sort()
+            rate = samples[len(samples) // 2]
+
+        pixels = width * height if width and height else None
+        return cls.OVERHEAD_SECONDS + rate * duration * cls.resolution_factor(pixels)
+
+    @classmethod
+    def resolution_factor(cls, pixels: Optional[int]) -> float:
+        """Processing cost of a frame relative to 1080p (1.0 when unknown)"""
+        if not pixels:
+            return 1.0
+        return min(max(pixels / cls.REFERENCE_PIXELS, 0.5), 4.0)
+
+    def next_interval(self, elapsed: float) -> float:
+        """
+        Seconds to wait before the next poll
+
+        Args:
+            elapsed: Seconds since the job was submitted
+
+        Returns:
+            Interval in seconds (jittered)
+        """
+        remaining = self.expected_seconds - elapsed
+        if remaining > 0:
+            interval = remaining / 2
+        else:
+            interval = self.min_interval + (-remaining) * 0.25
+
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return interval
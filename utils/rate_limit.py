@@ -0,0 +1,285 @@
+"""
+Client-side rate limiting per Akool API key
+
+Bursts from many users used to hit the vendor's limits and come back as
+AkoolAPIError. Every API key gets one KeyLimiter shared by all sessions
+and threads in the process:
+
+- a token bucket smooths request bursts to a steady rate
+- a job governor caps how many face swap jobs run on Akool at once;
+  extra jobs queue in FIFO order instead of failing
+
+Both keep queue-depth metrics for the status page.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from config import AKOOL_RATE_LIMIT_PER_SECOND, AKOOL_RATE_BURST, AKOOL_MAX_CONCURRENT_JOBS
+
+
+class TokenBucket:
+    """
+    Token bucket with reservations
+
+    reserve() never blocks: it takes a token (possibly going into debt) and
+    returns how long the caller must wait before using it. That lets
+    threads (acquire) and asyncio tasks (async_acquire) share one bucket.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Tokens added per second (0 = unlimited)
+            capacity: Maximum burst size
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.waiting = 0
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take one token
+
+        Returns:
+            Seconds to wait before sending the request (0 if a token was free)
+        """
+        with self._lock:
+            self.requests += 1
+            if not self.rate:
+                return 0.0
+
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait:
+                self.throttled += 1
+                self.total_wait += wait
+            return wait
+
+    def acquire(self):
+        """Block until a token is available"""
+        wait = self.reserve()
+        if wait:
+            with self._lock:
+                self.waiting += 1
+            try:
+                time.sleep(wait)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+
+    async def async_acquire(self):
+        """Wait for a token without blocking the event loop"""
+        wait = self.reserve()
+        if wait:
+            with self._lock:
+                self.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+
+
+class JobGovernor:
+    """
+    FIFO-fair cap on concurrently running jobs
+
+    Threads wait with slot(), asyncio tasks with async_slot(); both join the
+    same queue so sync and async callers share the limit.
+    """
+
+    # How often async waiters re-check the queue
+    ASYNC_POLL_SECONDS = 0.2
+
+    def __init__(self, max_jobs: int):
+        """
+        Args:
+            max_jobs: Maximum jobs running at once (0 = unlimited)
+        """
+        self.max_jobs = max_jobs
+        self.running = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def _enqueue(self, force: bool):
+        """Returns a ticket, or None when the slot was taken immediately"""
+        with self._cond:
+            if force or not self.max_jobs:
+                self._take()
+                return None
+            ticket = object()
+            self._queue.append(ticket)
+            return ticket
+
+    def _try_enter(self, ticket) -> bool:
+        # Caller holds self._cond
+        if self._queue[0] is ticket and self.running < self.max_jobs:
+            self._queue.popleft()
+            self._take()
+            # The next ticket may also fit
+            self._cond.notify_all()
+            return True
+        return False
+
+    def _take(self):
+        self.running += 1
+        self.started += 1
+
+    def _abandon(self, ticket):
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def _release(self, enqueued_at: float, entered_at: float):
+        with self._cond:
+            self.running -= 1
+            self.total_wait += entered_at - enqueued_at
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, force: bool = False, on_queued=None):
+        """
+        Hold a job slot for the duration of the with-block
+
+        Args:
+            force: Take a slot even when full (for jobs already running on
+                the vendor side, e.g. resumed after a restart)
+            on_queued: Optional callback(position) called while waiting,
+                position 1 meaning next in line
+        """
+        enqueued_at = time.monotonic()
+        ticket = self._enqueue(force)
+        if ticket is not None:
+            try:
+                last_position = None
+                with self._cond:
+                    while not self._try_enter(ticket):
+                        position = self._queue.index(ticket) + 1
+                        if on_queued and position != last_position:
+                            last_position = position
+                            on_queued(position)
+                        self._cond.wait(timeout=5)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+        entered_at = time.monotonic()
+
+        try:
+            yield
+        finally:
+            self._release(enqueued_at, entered_at)
+
+    @asynccontextmanager
+    async def async_slot(self, on_queued=None):
+        """asyncio version of slot() (never blocks the event loop)"""
+        enqueued_at = time.monotonic()
+        ticket = self._enqueue(force=False)
+        if ticket is not None:
+            try:
+                last_position = None
+                while True:
+                    with self._cond:
+                        if self._try_enter(ticket):
+                            break
+                        position = self._queue.index(ticket) + 1
+                    if on_queued and position != last_position:
+                        last_position = position
+                        on_queued(position)
+                    await asyncio.sleep(self.ASYNC_POLL_SECONDS)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+        entered_at = time.monotonic()
+
+        try:
+            yield
+        finally:
+            self._release(enqueued_at, entered_at)
+
+
+class KeyLimiter:
+    """Request rate limiter and job governor for one API key"""
+
+    def __init__(
+        self,
+        rate: float = AKOOL_RATE_LIMIT_PER_SECOND,
+        burst: float = AKOOL_RATE_BURST,
+        max_jobs: int = AKOOL_MAX_CONCURRENT_JOBS
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.jobs = JobGovernor(max_jobs)
+
+    def acquire_request(self):
+        """Block until the next API request may be sent"""
+        self.bucket.acquire()
+
+    async def async_acquire_request(self):
+        """asyncio version of acquire_request"""
+        await self.bucket.async_acquire()
+
+    def job_slot(self, force: bool = False, on_queued=None):
+        """Context manager holding one concurrent-job slot (see JobGovernor.slot)"""
+        return self.jobs.slot(force=force, on_queued=on_queued)
+
+    def async_job_slot(self, on_queued=None):
+        """Async context manager holding one concurrent-job slot"""
+        return self.jobs.async_slot(on_queued=on_queued)
+
+    def metrics(self) -> dict:
+        bucket, jobs = self.bucket, self.jobs
+        return {
+            "requests": bucket.requests,
+            "throttled_requests": bucket.throttled,
+            "waiting_requests": bucket.waiting,
+            "avg_request_wait": bucket.total_wait / bucket.requests if bucket.requests else 0.0,
+            "running_jobs": jobs.running,
+            "queued_jobs": jobs.queued,
+            "max_jobs": jobs.max_jobs,
+            "avg_job_wait": jobs.total_wait / jobs.started if jobs.started else 0.0,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_key_limiter(api_key: str) -> KeyLimiter:
+    """Get the process-wide limiter for an API key"""
+    with _limiters_lock:
+        limiter = _limiters.get(api_key)
+        if limiter is None:
+            limiter = KeyLimiter()
+            _limiters[api_key] = limiter
+        return limiter
+
+
+def limiter_metrics() -> dict:
+    """
+    Metrics of every key used so far
+
+    Returns:
+        {key suffix: metrics dict} - keys are shortened so they can be shown
+    """
+    with _limiters_lock:
+        return {f"...{api_key[-4:]}": limiter.metrics() for api_key, limiter in _limiters.items()}
@@ -0,0 +1,140 @@
+"""
+换脸结果缓存
+以 (照片哈希, 视频哈希, 模型, 处理参数) 为键保存已完成任务的结果，
+同一组输入再次提交时直接返回之前的结果，不再产生新的付费任务
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from config import API_CONFIGS, DB_PATH, RESULT_CACHE_TTL_HOURS, VIDEO_PREPROCESS_ENABLED
+from utils.db import connect
+
+
+def result_options(model: str) -> dict:
+    """
+    影响换脸结果的处理参数（参数不同的结果不能共用）
+
+    Args:
+        model: 模型名称
+
+    Returns:
+        dict: 参数字典
+    """
+    model_config = API_CONFIGS.get(model, {})
+    return {
+        "face_enhance": model_config.get("face_enhance", False),
+        "preprocess": model_config.get("preprocess") if VIDEO_PREPROCESS_ENABLED else None,
+    }
+
+
+def result_key(face_hash: str, video_hash: str, model: str, options: dict = None) -> str:
+    """
+    生成结果缓存键
+
+    Args:
+        face_hash: 照片内容哈希
+        video_hash: 视频内容哈希
+        model: 模型名称
+        options: 处理参数（默认按模型配置生成）
+
+    Returns:
+        str: 缓存键
+    """
+    options = result_options(model) if options is None else options
+    payload = json.dumps([face_hash, video_hash, model, options], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """结果缓存键 -> 结果 URL 或本地文件"""
+
+    def __init__(self, db_path: str = DB_PATH, ttl_hours: float = RESULT_CACHE_TTL_HOURS):
+        """
+        打开（或创建）结果缓存表
+
+        Args:
+            db_path: SQLite 文件路径
+            ttl_hours: 结果 URL 的复用时长（小时）
+        """
+        self.ttl_hours = ttl_hours
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    cache_key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    job_id TEXT,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """
+        查询仍可用的结果
+
+        Args:
+            cache_key: result_key 生成的缓存键
+
+        Returns:
+            str: 结果 URL 或本地文件路径，没有可用结果时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM results WHERE cache_key = ? AND expires_at > ?",
+                (cache_key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+
+        result = row["result"]
+        # 本地文件可能已被 cleanup_old_files 清理
+        if not result.startswith(("http://", "https://")) and not os.path.isfile(result):
+            self.invalidate(cache_key)
+            return None
+        return result
+
+    def put(self, cache_key: str, result: str, job_id: str = None, ttl_hours: float = None):
+        """
+        记录任务结果
+
+        Args:
+            cache_key: 缓存键
+            result: 结果 URL 或本地文件路径
+            job_id: 产生该结果的任务 ID
+            ttl_hours: 复用时长（默认 self.ttl_hours；会过期的供应商链接应传入更短的时长）
+        """
+        ttl_hours = self.ttl_hours if ttl_hours is None else min(ttl_hours, self.ttl_hours)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (cache_key, result, job_id, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cache_key, result, job_id, now, now + ttl_hours * 3600)
+            )
+            self._conn.execute("DELETE FROM results WHERE expires_at < ?", (now,))
+
+    def invalidate(self, cache_key: str):
+        """删除记录"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results WHERE cache_key = ?", (cache_key,))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """获取进程内共享的结果缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
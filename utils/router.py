@@ -0,0 +1,179 @@
+"""
+按实时耗时选择换脸后端
+根据最近结束的任务统计每个后端的准备耗时（上传和排队）、每秒视频的处理耗时和失败率，
+加上当前本地排队的任务，为新任务选择预计最快完成、且成本不超过用户上限的后端
+"""
+import math
+import statistics
+import threading
+import time
+
+from config import FACE_SWAP_MODEL, MAX_JOB_COST_USD, USER_COST_CEILINGS, ROUTING_WINDOW
+from utils.job_store import JobStore, get_job_store
+
+# 提交时未指定模型、由路由在开始处理时选择
+AUTO_MODEL = "auto"
+
+# 统计结果缓存秒数（避免每次选择都查询数据库）
+STATS_TTL_SECONDS = 10
+# 失败率上限：全部失败的后端预期耗时按该失败率计算，仍可作为最后的选择
+MAX_FAILURE_RATE = 0.9
+
+
+def cost_ceiling(owner: str = None) -> float:
+    """
+    用户的单任务成本上限（USER_COST_CEILINGS 中没有的用户使用 MAX_JOB_COST_USD）
+
+    Returns:
+        float: 上限（美元），0 表示不限制
+    """
+    return USER_COST_CEILINGS.get(owner, MAX_JOB_COST_USD)
+
+
+class BackendRouter:
+    """换脸后端路由"""
+
+    def __init__(self, store: JobStore = None, window: int = ROUTING_WINDOW):
+        """
+        Args:
+            store: 任务存储（默认使用配置的 DB_PATH）
+            window: 每个后端统计最近多少个结束的任务
+        """
+        self.store = store or get_job_store()
+        self.window = window
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def stats(self, model: str) -> dict:
+        """
+        后端最近的耗时和失败率
+
+        Returns:
+            dict: {"jobs", "failure_rate", "prepare_seconds", "seconds_per_video_second"}，
+            样本不足时耗时为 None
+        """
+        with self._lock:
+            cached = self._stats.get(model)
+            if cached and time.time() - cached[0] < STATS_TTL_SECONDS:
+                return cached[1]
+
+        from utils.poll_policy import PollingPolicy
+
+        # 复用结果的任务（没有提交时间）不代表后端的表现
+        outcomes = [
+            row for row in self.store.recent_outcomes(model, self.window)
+            if row["status"] == "failed" or row["submitted_at"]
+        ]
+        succeeded = [row for row in outcomes if row["status"] == "succeeded"]
+        prepare = [row["submitted_at"] - row["started_at"] for row in succeeded if row["started_at"]]
+        rates = [
+            (row["finished_at"] - row["submitted_at"]) / row["video_duration"]
+            for row in succeeded if row["video_duration"]
+        ]
+
+        enough = PollingPolicy.MIN_HISTORY
+        result = {
+            "jobs": len(outcomes),
+            "failure_rate": (len(outcomes) - len(succeeded)) / len(outcomes) if outcomes else 0.0,
+            "prepare_seconds": statistics.median(prepare) if len(prepare) >= enough else None,
+            "seconds_per_video_second": statistics.median(rates) if len(rates) >= enough else None,
+        }
+        with self._lock:
+            self._stats[model] = (time.time(), result)
+        return result
+
+    def expected_seconds(self, model: str, video_info: dict) -> float:
+        """
+        预计从开始处理到完成的秒数（含当前排队和失败重试的期望开销）
+
+        Args:
+            model: 后端名称
+            video_info: 视频元数据
+
+        Returns:
+            float: 预计秒数
+        """
+        from utils.backends import get_backend
+        from utils.face_swap import estimate_processing_time
+
+        stats = self.stats(model)
+        duration = video_info.get("duration") or 0
+        if stats["prepare_seconds"] is not None and stats["seconds_per_video_second"] is not None and duration:
+            job_seconds = stats["prepare_seconds"] + stats["seconds_per_video_second"] * duration
+        else:
+            # 样本不足时使用通用预估（默认速率或较长期的历史）
+            job_seconds = estimate_processing_time(video_info, model)
+
+        # 并发名额已满时，要等前面的任务完成
+        backend = get_backend(model)
+        limit = backend.max_concurrent_jobs
+        waiting = backend.running_jobs() + backend.queued_jobs()
+        queue_seconds = 0.0
+        if limit and waiting >= limit:
+            queue_seconds = math.ceil((waiting - limit + 1) / limit) * job_seconds
+
+        # 失败的任务要切换到备用模型重来，预期耗时按成功率放大
+        failure_rate = min(stats["failure_rate"], MAX_FAILURE_RATE)
+        return (job_seconds + queue_seconds) / (1 - failure_rate)
+
+    def candidates(self, video_info: dict, owner: str = None) -> list:
+        """
+        可选的后端（已配置、未熔断、成本不超过用户上限），按预计耗时排序
+
+        Returns:
+            list: [(预计秒数, 预估成本, 后端名称), ...]
+        """
+        from utils.backends import list_backends
+        from utils.circuit_breaker import CircuitBreaker, get_breaker
+
+        ceiling = cost_ceiling(owner)
+        duration = video_info.get("duration") or 0
+
+        options = []
+        for backend in list_backends():
+            if not backend.is_available():
+                continue
+            if get_breaker(backend.name).snapshot()["state"] == CircuitBreaker.STATE_OPEN:
+                continue
+            cost = backend.estimate_cost(duration)
+            if ceiling and cost > ceiling:
+                continue
+            options.append((self.expected_seconds(backend.name, video_info), cost, backend.name))
+        return sorted(options)
+
+    def choose(self, video_info: dict, owner: str = None) -> str:
+        """
+        选择预计最快完成的后端；耗时相同时选择更便宜的
+
+        Args:
+            video_info: 视频元数据
+            owner: 提交任务的用户（决定成本上限）
+
+        Returns:
+            str: 后端名称（没有其他可用后端时返回 FACE_SWAP_MODEL，由熔断和备用模型处理）
+
+        Raises:
+            ValueError: 没有成本不超过上限的后端
+        """
+        options = self.candidates(video_info, owner)
+        if options:
+            return options[0][2]
+
+        from utils.face_swap import check_cost_limit
+
+        # 没有候选可能只是因为都在熔断，成本仍需检查
+        check_cost_limit(video_info, FACE_SWAP_MODEL, owner)
+        return FACE_SWAP_MODEL
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> BackendRouter:
+    """获取进程内共享的后端路由"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = BackendRouter()
+        return _router
@@ -0,0 +1,343 @@
+"""
+输入文件存储后端
+Akool 只接受公网 URL，本模块负责把本地文件放到可公开访问的位置。
+通过 config.STORAGE_BACKEND 选择：
+- temp_hosting: 公共临时托管（tmpfiles.org / file.io），无需配置，仅适合测试
+- local: 存到本机目录，由内置文件服务器或 nginx 对外提供
+- s3: S3 兼容对象存储（AWS S3、阿里云 OSS、MinIO 等），需要 pip install boto3
+
+任务结束后，没有其他未结束任务使用的输入文件由 JobManager 删除（temp_hosting 不支持删除，到期后自动清理）
+"""
+import http.server
+import os
+import shutil
+import threading
+import time
+from functools import partial
+from typing import Optional
+
+import requests
+
+from utils.file_handler import file_sha256
+from utils.http_session import get_session
+
+# boto3 is optional - only needed for the s3 backend
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+    ClientError = None
+
+
+class StoredFile:
+    """存储后的文件"""
+
+    def __init__(self, url: str, key: str, expires_at: Optional[float] = None, reusable: bool = True):
+        """
+        Args:
+            url: 公网 URL
+            key: 后端内部的对象名
+            expires_at: URL 失效时间（Unix 时间戳），None 表示长期有效
+            reusable: URL 能否被多次下载（file.io 下载一次即删除）
+        """
+        self.url = url
+        self.key = key
+        self.expires_at = expires_at
+        self.reusable = reusable
+
+
+class StorageBackend:
+    """存储后端接口"""
+
+    name = "base"
+    # 是否支持删除（不支持时任务结束后保留上传记录，URL 到期前继续复用）
+    can_delete = True
+
+    def put(self, file_path: str, progress_callback=None) -> StoredFile:
+        """
+        上传文件
+
+        Args:
+            file_path: 本地文件路径
+            progress_callback: 可选的进度回调(已发送字节数, 总字节数)
+
+        Returns:
+            StoredFile: 公网 URL 及有效期
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """删除文件（不支持删除的后端忽略）"""
+        raise NotImplementedError
+
+    def key_for(self, file_path: str) -> str:
+        """本地文件上传后的对象名（用于删除）"""
+        return self.content_key(file_path)
+
+    def exists(self, key: str) -> bool:
+        """文件是否仍可访问"""
+        raise NotImplementedError
+
+    @staticmethod
+    def content_key(file_path: str) -> str:
+        """按内容哈希生成对象名，相同内容只存一份"""
+        return file_sha256(file_path) + os.path.splitext(file_path)[1].lower()
+
+
+class TempHostingStorage(StorageBackend):
+    """公共临时托管服务（原 upload_to_temp_hosting 的行为）"""
+
+    name = "temp_hosting"
+    can_delete = False
+
+    def __init__(self, hedge_after: float = 15):
+        """
+        Args:
+            hedge_after: 当前服务多少秒没有进展就并行启动下一个托管服务（0 表示失败后才切换）
+        """
+        self.hedge_after = hedge_after
+
+    def put(self, file_path: str, progress_callback=None) -> StoredFile:
+        from utils.akool_client import upload_with_expiry
+
+        url, expires_at = upload_with_expiry(file_path, progress_callback, self.hedge_after)
+        return StoredFile(url, url, expires_at, reusable=expires_at is not None)
+
+    def delete(self, key: str):
+        # 临时托管服务没有删除接口，文件到期后自动删除
+        pass
+
+    def exists(self, key: str) -> bool:
+        try:
+            return get_session().head(key, timeout=10, allow_redirects=True).status_code == 200
+        except requests.RequestException:
+            return False
+
+
+class LocalStorage(StorageBackend):
+    """
+    本机目录存储
+
+    文件保存到 root_dir，URL 为 public_base_url + 文件名。
+    public_base_url 需要能被 Akool 访问（公网 IP/域名，或反向代理到 serve() 启动的端口）
+    """
+
+    name = "local"
+
+    def __init__(self, root_dir: str, public_base_url: str, retention_hours: int = 24):
+        """
+        Args:
+            root_dir: 存储目录
+            public_base_url: 对外访问地址，如 https://files.example.com/inputs/
+            retention_hours: 文件保留时长（由 cleanup_old_files 清理）
+        """
+        if not public_base_url:
+            raise ValueError("local 存储需要设置 STORAGE_PUBLIC_BASE_URL")
+
+        self.root_dir = root_dir
+        self.public_base_url = public_base_url.rstrip("/") + "/"
+        self.retention_hours = retention_hours
+        os.makedirs(root_dir, exist_ok=True)
+
+    def put(self, file_path: str, progress_callback=None) -> StoredFile:
+        key = self.content_key(file_path)
+        target = os.path.join(self.root_dir, key)
+
+        if not os.path.exists(target):
+            tmp_target = f"{target}.{threading.get_ident()}.tmp"
+            try:
+                # 同一文件系统内直接硬链接，避免复制大文件
+                os.link(file_path, tmp_target)
+            except OSError:
+                shutil.copyfile(file_path, tmp_target)
+            os.replace(tmp_target, target)
+        else:
+            # 刷新修改时间，避免刚复用就被清理
+            os.utime(target)
+
+        if progress_callback:
+            size = os.path.getsize(target)
+            progress_callback(size, size)
+
+        return StoredFile(self.public_base_url + key, key, time.time() + self.retention_hours * 3600)
+
+    def delete(self, key: str):
+        path = os.path.join(self.root_dir, os.path.basename(key))
+        if os.path.exists(path):
+            os.remove(path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.root_dir, os.path.basename(key)))
+
+    def serve(self, host: str = "0.0.0.0", port: int = 8503) -> http.server.ThreadingHTTPServer:
+        """
+        在后台线程启动只读文件服务器（无需 nginx 时使用）
+
+        Returns:
+            ThreadingHTTPServer: 已启动的服务器
+        """
+
+        class QuietHandler(http.server.SimpleHTTPRequestHandler):
+            def list_directory(self, path):
+                # 不提供目录列表：只能按内容哈希对象名下载，不能枚举已上传的照片和视频
+                self.send_error(404)
+                return None
+
+            def log_message(self, format, *args):
+                pass
+
+        handler = partial(QuietHandler, directory=self.root_dir)
+        httpd = http.server.ThreadingHTTPServer((host, port), handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, name="storage-http", daemon=True).start()
+        return httpd
+
+
+class S3Storage(StorageBackend):
+    """
+    S3 兼容对象存储
+
+    默认返回预签名 URL（存储桶无需公开）；设置 public_base_url 时返回公开 URL
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: str = None,
+        region: str = None,
+        access_key: str = None,
+        secret_key: str = None,
+        prefix: str = "changeface/",
+        public_base_url: str = None,
+        url_expiry_seconds: int = 3600
+    ):
+        """
+        Args:
+            bucket: 存储桶名称
+            endpoint_url: 自定义端点（OSS、MinIO 等；AWS 留空）
+            region: 区域
+            access_key: Access Key（留空则使用 boto3 默认凭证链）
+            secret_key: Secret Key
+            prefix: 对象名前缀
+            public_base_url: 公开访问地址（设置后不再生成预签名 URL）
+            url_expiry_seconds: 预签名 URL 有效期
+        """
+        if boto3 is None:
+            raise ImportError("boto3 模块未安装。请运行: pip install boto3")
+        if not bucket:
+            raise ValueError("s3 存储需要设置 STORAGE_S3_BUCKET")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_base_url = public_base_url.rstrip("/") + "/" if public_base_url else None
+        self.url_expiry_seconds = url_expiry_seconds
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key
+        )
+
+    def key_for(self, file_path: str) -> str:
+        return self.prefix + self.content_key(file_path)
+
+    def put(self, file_path: str, progress_callback=None) -> StoredFile:
+        key = self.key_for(file_path)
+
+        if not self.exists(key):
+            callback = None
+            if progress_callback:
+                total = os.path.getsize(file_path)
+                sent = [0]
+                lock = threading.Lock()
+
+                # boto3 分片并发上传，回调来自多个线程
+                def report(bytes_transferred):
+                    with lock:
+                        sent[0] += bytes_transferred
+                        progress_callback(sent[0], total)
+
+                callback = report
+
+            # upload_file 从磁盘分片读取，内存占用与文件大小无关
+            self.client.upload_file(file_path, self.bucket, key, Callback=callback)
+
+        if self.public_base_url:
+            return StoredFile(self.public_base_url + key, key)
+
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.url_expiry_seconds
+        )
+        return StoredFile(url, key, time.time() + self.url_expiry_seconds)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            # 只有对象不存在时返回 False；凭证、权限或网络错误照常抛出，不当作缺失重新上传
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(backend: str = None) -> StorageBackend:
+    """
+    按配置创建存储后端
+
+    Args:
+        backend: 后端名称（默认使用配置的 STORAGE_BACKEND）
+
+    Returns:
+        StorageBackend: 存储后端实例
+    """
+    import config
+
+    backend = backend or config.STORAGE_BACKEND
+
+    if backend == "temp_hosting":
+        return TempHostingStorage(hedge_after=config.UPLOAD_HEDGE_SECONDS)
+    elif backend == "local":
+        storage = LocalStorage(
+            config.STORAGE_LOCAL_DIR,
+            config.STORAGE_PUBLIC_BASE_URL,
+            retention_hours=config.STORAGE_LOCAL_RETENTION_HOURS
+        )
+        if config.STORAGE_LOCAL_SERVE_PORT:
+            storage.serve(port=config.STORAGE_LOCAL_SERVE_PORT)
+        return storage
+    elif backend == "s3":
+        return S3Storage(
+            bucket=config.STORAGE_S3_BUCKET,
+            endpoint_url=config.STORAGE_S3_ENDPOINT_URL,
+            region=config.STORAGE_S3_REGION,
+            access_key=config.STORAGE_S3_ACCESS_KEY,
+            secret_key=config.STORAGE_S3_SECRET_KEY,
+            prefix=config.STORAGE_S3_PREFIX,
+            public_base_url=config.STORAGE_PUBLIC_BASE_URL,
+            url_expiry_seconds=config.STORAGE_URL_EXPIRY_SECONDS
+        )
+    else:
+        raise ValueError(f"不支持的存储后端: {backend}")
+
+
+def get_storage() -> StorageBackend:
+    """获取进程内共享的存储后端（首次调用时按配置创建）"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
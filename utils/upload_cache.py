@@ -0,0 +1,196 @@
+"""
+上传缓存
+按文件内容的 SHA-256 记录已上传文件的公网 URL 和过期时间，
+相同的照片/视频在 URL 仍然有效时直接复用，不再重复上传
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from config import DB_PATH, UPLOAD_CACHE_MIN_VALIDITY_SECONDS
+from utils.db import connect
+from utils.file_handler import file_sha256
+
+
+class UploadCache:
+    """内容哈希 -> 托管 URL"""
+
+    def __init__(self, db_path: str = DB_PATH):
+        """
+        打开（或创建）上传缓存表
+
+        Args:
+            db_path: SQLite 文件路径
+        """
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS uploads (
+                    content_hash TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    def get(self, content_hash: str, min_validity: float = 0) -> Optional[str]:
+        """
+        查询仍然有效的 URL
+
+        Args:
+            content_hash: 文件内容哈希
+            min_validity: URL 至少还要有效的秒数（需覆盖排队和 API 下载时间）
+
+        Returns:
+            str: 托管 URL，没有可用记录时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url FROM uploads WHERE content_hash = ? AND expires_at > ?",
+                (content_hash, time.time() + min_validity)
+            ).fetchone()
+        return row["url"] if row else None
+
+    def put(self, content_hash: str, url: str, expires_at: float):
+        """
+        记录上传结果
+
+        Args:
+            content_hash: 文件内容哈希
+            url: 托管 URL
+            expires_at: URL 失效时间（Unix 时间戳）
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (content_hash, url, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (content_hash, url, expires_at, time.time())
+            )
+            self._conn.execute("DELETE FROM uploads WHERE expires_at < ?", (time.time(),))
+
+    def invalidate(self, content_hash: str):
+        """删除记录（例如 URL 已被证实不可访问）"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM uploads WHERE content_hash = ?", (content_hash,))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# 同一内容同时只上传一次，其余线程等待后直接读缓存
+# 缓存键 -> [锁, 使用中的线程数]
+_upload_locks = {}
+_upload_locks_guard = threading.Lock()
+
+
+def get_upload_cache() -> UploadCache:
+    """获取进程内共享的上传缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = UploadCache()
+        return _cache
+
+
+def cached_upload(file_path: str, progress_callback=None, content_hash: str = None,
+                  min_validity: float = UPLOAD_CACHE_MIN_VALIDITY_SECONDS) -> str:
+    """
+    上传文件到配置的存储后端并返回公网 URL，相同内容且 URL 仍有效时复用之前的上传
+
+    Args:
+        file_path: 本地文件路径
+        progress_callback: 可选的上传进度回调(已发送字节数, 总字节数)
+        content_hash: 已知的内容哈希（省去重复计算）
+        min_validity: 复用的 URL 至少还要有效的秒数
+
+    Returns:
+        str: 公网 URL
+    """
+    from utils.storage import get_storage
+
+    storage = get_storage()
+    cache_key = _cache_key(storage, file_path, content_hash)
+    cache = get_upload_cache()
+
+    with _content_lock(cache_key):
+        url = cache.get(cache_key, min_validity)
+        if url:
+            return url
+
+        stored = storage.put(file_path, progress_callback)
+        # 一次性链接不能复用；长期有效的 URL 按一年记
+        if stored.reusable:
+            cache.put(cache_key, stored.url, stored.expires_at or time.time() + 365 * 86400)
+        return stored.url
+
+
+def release_upload(file_path: str, in_use) -> bool:
+    """
+    从存储后端删除不再需要的上传文件，并删除上传记录
+
+    存储按内容命名，多个任务可能共用同一个文件：检查和删除期间持有该内容的上传锁，
+    in_use 返回 False 之后开始的任务会重新上传，不会拿到已删除的 URL
+
+    Args:
+        file_path: 本地文件路径
+        in_use: 无参函数，在锁内调用；返回 True 表示仍有任务使用该文件，不删除
+
+    Returns:
+        bool: 是否已删除
+    """
+    from utils.storage import get_storage
+
+    storage = get_storage()
+    if not storage.can_delete:
+        return False
+
+    cache_key = _cache_key(storage, file_path)
+    with _content_lock(cache_key):
+        if in_use():
+            return False
+        get_upload_cache().invalidate(cache_key)
+        storage.delete(storage.key_for(file_path))
+        return True
+
+
+@contextmanager
+def _content_lock(cache_key: str):
+    """持有该内容的上传锁；没有线程使用时删除锁，不会随上传过的文件数增长"""
+    with _upload_locks_guard:
+        entry = _upload_locks.setdefault(cache_key, [threading.Lock(), 0])
+        entry[1] += 1
+
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _upload_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _upload_locks[cache_key]
+
+
+def invalidate_upload(file_path: str, content_hash: str = None):
+    """
+    删除文件的上传记录，下次使用时重新上传
+
+    在换脸 API 拒绝或无法下载该文件的 URL 时调用（例如图床提前删除了文件）
+
+    Args:
+        file_path: 本地文件路径
+        content_hash: 已知的内容哈希（省去重复计算）
+    """
+    from utils.storage import get_storage
+
+    try:
+        get_upload_cache().invalidate(_cache_key(get_storage(), file_path, content_hash))
+    except OSError as e:
+        print(f"Failed to invalidate upload of {file_path}: {e}")
+
+
+def _cache_key(storage, file_path: str, content_hash: str = None) -> str:
+    # 不同后端的 URL 不能混用
+    return f"{storage.name}:{content_hash or file_sha256(file_path)}"
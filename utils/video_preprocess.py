@@ -0,0 +1,133 @@
+"""
+上传前的视频预处理
+4K 手机视频动辄几百 MB，而上传耗时和换脸 API 的处理耗时都随文件大小增长。
+视频分辨率或码率超过模型的预处理策略（API_CONFIGS[model]["preprocess"]）时，
+先用 ffmpeg（纯软件编码）压缩成较小的代理文件再上传
+"""
+import os
+import threading
+
+from config import API_CONFIGS, UPLOAD_DIR, VIDEO_PREPROCESS_ENABLED
+from utils.file_handler import file_sha256
+from utils.video_probe import probe_video
+from utils.video_segments import ffmpeg_path, run_ffmpeg
+
+# 代理文件的关键帧间隔（秒），便于长视频分段时按关键帧切开
+KEYFRAME_INTERVAL = 2
+
+# 同一代理文件同时只生成一次（批量任务共用一个视频），其余线程等待后直接复用
+_proxy_locks = {}
+_proxy_locks_guard = threading.Lock()
+
+
+def get_preprocess_policy(model: str) -> dict:
+    """
+    获取模型的预处理策略
+
+    Args:
+        model: 模型名称
+
+    Returns:
+        dict: {"max_short_side": 像素, "max_bit_rate": bps}，未配置时为空字典
+    """
+    return API_CONFIGS.get(model, {}).get("preprocess") or {}
+
+
+def needs_preprocess(video_info: dict, policy: dict) -> bool:
+    """
+    视频是否超出预处理策略的分辨率或码率上限
+
+    Args:
+        video_info: probe_video 的返回值
+        policy: 预处理策略
+
+    Returns:
+        bool: 是否需要压缩
+    """
+    max_short_side = policy.get("max_short_side")
+    max_bit_rate = policy.get("max_bit_rate")
+
+    if max_short_side and video_info.get("width") and video_info.get("height"):
+        if min(video_info["width"], video_info["height"]) > max_short_side:
+            return True
+    if max_bit_rate and video_info.get("bit_rate"):
+        if video_info["bit_rate"] > max_bit_rate:
+            return True
+    return False
+
+
+def preprocess_video(video_path: str, model: str, video_info: dict = None, progress_callback=None) -> tuple:
+    """
+    按模型的预处理策略压缩视频（无需压缩或 ffmpeg 不可用时原样返回）
+
+    代理文件按源文件内容哈希和策略命名并保存在 UPLOAD_DIR，同一视频再次提交时直接复用
+
+    Args:
+        video_path: 源视频路径
+        model: 模型名称
+        video_info: 源视频元数据（probe_video 的返回值），默认自动读取
+        progress_callback: 可选的进度回调函数
+
+    Returns:
+        (video_path, video_info): 实际要上传的视频路径及其元数据
+    """
+    if video_info is None:
+        video_info = probe_video(video_path)
+
+    policy = get_preprocess_policy(model)
+    if not VIDEO_PREPROCESS_ENABLED or not needs_preprocess(video_info, policy) or not ffmpeg_path():
+        return video_path, video_info
+
+    short_side = policy.get("max_short_side") or 0
+    max_bit_rate = policy.get("max_bit_rate") or 0
+    proxy_path = os.path.join(
+        UPLOAD_DIR,
+        f"proxy_{file_sha256(video_path)[:16]}_{short_side}p_{max_bit_rate // 1000}k.mp4"
+    )
+
+    with _proxy_locks_guard:
+        lock = _proxy_locks.setdefault(proxy_path, threading.Lock())
+
+    with lock:
+        if not os.path.exists(proxy_path):
+            _encode_proxy(video_path, video_info, policy, proxy_path, progress_callback)
+
+    proxy_info = probe_video(proxy_path)
+    # ffprobe 不可用时沿用源视频的时长
+    proxy_info.setdefault("duration", video_info.get("duration"))
+    return proxy_path, proxy_info
+
+
+def _encode_proxy(video_path: str, video_info: dict, policy: dict, proxy_path: str, progress_callback=None):
+    """用 ffmpeg 把视频压缩成代理文件（先写临时文件，完成后再改名）"""
+    short_side = policy.get("max_short_side") or 0
+    max_bit_rate = policy.get("max_bit_rate") or 0
+
+    if progress_callback:
+        progress_callback(0, "正在压缩视频以加快上传和处理...")
+
+    args = ["-i", video_path]
+    if short_side and min(video_info.get("width") or 0, video_info.get("height") or 0) > short_side:
+        # 按短边缩放，横竖屏都适用；-2 保证另一边为偶数
+        args += ["-vf", f"scale='if(gt(iw,ih),-2,{short_side})':'if(gt(iw,ih),{short_side},-2)'"]
+    args += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p"]
+    if max_bit_rate:
+        args += ["-maxrate", str(max_bit_rate), "-bufsize", str(max_bit_rate * 2)]
+    args += [
+        "-force_key_frames", f"expr:gte(t,n_forced*{KEYFRAME_INTERVAL})",
+        "-c:a", "aac", "-b:a", "128k",
+        "-movflags", "+faststart",
+        "-f", "mp4"
+    ]
+
+    tmp_path = f"{proxy_path}.{threading.get_ident()}.tmp"
+    try:
+        run_ffmpeg(args + [tmp_path], timeout=1800)
+        os.replace(tmp_path, proxy_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    original_size = os.path.getsize(video_path)
+    print(f"Preprocessed {video_path}: {original_size / 1048576:.1f} MB -> "
+          f"{os.path.getsize(proxy_path) / 1048576:.1f} MB")
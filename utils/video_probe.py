@@ -0,0 +1,204 @@
+"""
+视频元数据读取
+只读取容器信息（时长、分辨率、码率），不解码视频帧。
+优先使用 ffprobe；未安装时直接解析 MP4/MOV 文件头（moov/mvhd/tkhd），
+也可用于尚未保存到磁盘的上传文件对象
+"""
+import json
+import os
+import shutil
+import struct
+import subprocess
+
+# moov 通常只有几百 KB，超过该大小视为异常文件不再解析
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+
+def probe_video(video_path: str) -> dict:
+    """
+    读取视频元数据
+
+    Args:
+        video_path: 视频文件路径
+
+    Returns:
+        dict: {"duration": 秒, "width": 像素, "height": 像素, "bit_rate": bps}，
+              无法读取的字段不会出现在结果中（都无法读取时返回空字典）
+    """
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return _probe_header(video_path)
+
+    try:
+        output = subprocess.run(
+            [
+                ffprobe, "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "format=duration,bit_rate:stream=width,height",
+                "-of", "json",
+                video_path
+            ],
+            capture_output=True,
+            timeout=30,
+            check=True
+        ).stdout
+        data = json.loads(output)
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return _probe_header(video_path)
+
+    info = {}
+    fmt = data.get("format", {})
+    streams = data.get("streams") or [{}]
+
+    if fmt.get("duration"):
+        info["duration"] = float(fmt["duration"])
+    if fmt.get("bit_rate"):
+        info["bit_rate"] = int(fmt["bit_rate"])
+    if streams[0].get("width"):
+        info["width"] = int(streams[0]["width"])
+        info["height"] = int(streams[0]["height"])
+
+    return info
+
+
+def _probe_header(video_path: str) -> dict:
+    """ffprobe 不可用时解析文件头"""
+    try:
+        with open(video_path, "rb") as f:
+            return parse_mp4_header(f)
+    except OSError:
+        return {}
+
+
+def probe_video_file(file_obj) -> dict:
+    """
+    读取上传文件对象（如 Streamlit 的 UploadedFile）的元数据，不需要先保存到磁盘
+
+    Args:
+        file_obj: 支持 read/seek 的文件对象，读取后恢复原来的位置
+
+    Returns:
+        dict: 与 probe_video 相同的字段
+    """
+    position = file_obj.tell()
+    try:
+        file_obj.seek(0)
+        return parse_mp4_header(file_obj)
+    finally:
+        file_obj.seek(position)
+
+
+def parse_mp4_header(f) -> dict:
+    """
+    解析 MP4/MOV（ISO BMFF）文件头：时长取自 moov/mvhd，分辨率取自视频轨的 tkhd，
+    码率按文件大小和时长计算。只读取 moov，跳过 mdat 中的媒体数据
+
+    Args:
+        f: 以二进制方式打开、支持 seek 的文件对象
+
+    Returns:
+        dict: {"duration", "width", "height", "bit_rate"}，不是 MP4/MOV 或无法解析时返回空字典
+    """
+    try:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        f.seek(0)
+
+        moov = None
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            size, box_type, header_size = _read_box_header(f, file_size - offset)
+            if size is None:
+                break
+            if box_type == b"moov":
+                if size - header_size > MAX_MOOV_SIZE:
+                    return {}
+                moov = f.read(size - header_size)
+                break
+            offset += size
+
+        if moov is None:
+            return {}
+
+        info = {}
+        for box_type, body in _iter_boxes(moov):
+            if box_type == b"mvhd":
+                duration = _parse_mvhd(body)
+                if duration:
+                    info["duration"] = duration
+            elif box_type == b"trak" and "width" not in info:
+                size = _parse_video_trak(body)
+                if size:
+                    info["width"], info["height"] = size
+
+        if info.get("duration"):
+            info["bit_rate"] = int(file_size * 8 / info["duration"])
+        return info
+    except (OSError, struct.error, ValueError, IndexError):
+        return {}
+
+
+def _read_box_header(f, remaining: int) -> tuple:
+    """读取 box 头，返回 (box 总大小, 类型, 头部大小)"""
+    header = f.read(8)
+    if len(header) < 8:
+        return None, None, None
+    size, box_type = struct.unpack(">I4s", header)
+    header_size = 8
+    if size == 1:
+        size = struct.unpack(">Q", f.read(8))[0]
+        header_size = 16
+    elif size == 0:
+        # 延伸到文件末尾
+        size = remaining
+    if size < header_size:
+        return None, None, None
+    return size, box_type, header_size
+
+
+def _iter_boxes(data: bytes):
+    """遍历内存中一层 box，产出 (类型, 内容)"""
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = len(data) - offset
+        if size < header_size:
+            return
+        yield box_type, data[offset + header_size:offset + size]
+        offset += size
+
+
+def _parse_mvhd(body: bytes) -> float:
+    """mvhd: 影片时长（秒），内容不完整时返回 0"""
+    if not body:
+        return 0
+    version = body[0]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", body, 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", body, 12)
+    return duration / timescale if timescale else 0
+
+
+def _parse_video_trak(trak: bytes):
+    """trak: 视频轨返回 tkhd 中的 (宽, 高)，其他轨道返回 None"""
+    size = None
+    is_video = False
+    for box_type, body in _iter_boxes(trak):
+        if box_type == b"tkhd":
+            # 宽高为 16.16 定点数，位于 tkhd 末尾
+            width, height = struct.unpack_from(">II", body, len(body) - 8)
+            size = (width >> 16, height >> 16)
+        elif box_type == b"mdia":
+            for sub_type, sub_body in _iter_boxes(body):
+                if sub_type == b"hdlr" and sub_body[8:12] == b"vide":
+                    is_video = True
+    if is_video and size and size[0] and size[1]:
+        return size
+    return None
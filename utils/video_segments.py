@@ -0,0 +1,103 @@
+"""
+长视频分段处理
+用 ffmpeg 按关键帧把视频切成若干段（流复制，不重新编码），各段并行换脸后
+再无损拼接，并混入原视频的音轨。需要本机安装 ffmpeg
+"""
+import os
+import shutil
+import subprocess
+from typing import Optional
+
+
+def ffmpeg_path() -> Optional[str]:
+    """返回 ffmpeg 可执行文件路径，未安装时返回 None"""
+    return shutil.which("ffmpeg")
+
+
+def run_ffmpeg(args: list, timeout: int = 600):
+    """运行 ffmpeg，失败时抛出带错误输出的异常"""
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg:
+        raise RuntimeError("未找到 ffmpeg，请先安装 ffmpeg")
+
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-y"] + args,
+        capture_output=True,
+        timeout=timeout
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg 执行失败: {result.stderr.decode('utf-8', 'replace').strip()}")
+
+
+def split_video(video_path: str, segment_seconds: float, output_dir: str) -> list:
+    """
+    按关键帧把视频切成约 segment_seconds 秒的片段（只保留画面，不含音轨）
+
+    流复制只能在关键帧处切开，所以实际片段长度会略长于 segment_seconds
+
+    Args:
+        video_path: 源视频路径
+        segment_seconds: 目标片段时长（秒）
+        output_dir: 片段输出目录
+
+    Returns:
+        list: 按顺序排列的片段路径
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    ext = os.path.splitext(video_path)[1].lower() or ".mp4"
+    pattern = os.path.join(output_dir, f"segment_%03d{ext}")
+
+    run_ffmpeg([
+        "-i", video_path,
+        "-map", "0:v:0",
+        "-c", "copy",
+        "-an",
+        "-f", "segment",
+        "-segment_time", str(segment_seconds),
+        "-reset_timestamps", "1",
+        pattern
+    ])
+
+    segments = sorted(
+        os.path.join(output_dir, name)
+        for name in os.listdir(output_dir)
+        if name.startswith("segment_") and name.endswith(ext)
+    )
+    if not segments:
+        raise RuntimeError("视频分段失败：没有生成任何片段")
+    return segments
+
+
+def concat_segments(segment_paths: list, audio_source: str, output_path: str) -> str:
+    """
+    无损拼接片段，并使用原视频的音轨（原视频没有音轨时输出无声视频）
+
+    Args:
+        segment_paths: 按顺序排列的片段路径（编码参数需一致）
+        audio_source: 提供音轨的原视频路径
+        output_path: 输出文件路径
+
+    Returns:
+        str: 输出文件路径
+    """
+    list_path = output_path + ".txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    try:
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-i", audio_source,
+            "-map", "0:v:0",
+            "-map", "1:a:0?",
+            "-c", "copy",
+            "-shortest",
+            output_path
+        ])
+    finally:
+        os.remove(list_path)
+
+    return output_path
+
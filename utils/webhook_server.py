@@ -0,0 +1,251 @@
+"""
+Embedded webhook receiver for Akool job callbacks
+
+When enabled, swap_face_akool passes this receiver's public URL as
+webhookUrl and the shared poller is woken as soon as Akool POSTs the
+result; polling keeps running only as a slow fallback.
+
+Akool signs and AES-encrypts callback bodies
+({"signature", "dataEncrypt", "timestamp", "nonce"}) with the account's
+clientId/clientSecret. Unsigned plain JSON bodies ({"_id", "status", "url"})
+could be forged by anyone who can reach the port, so they are rejected
+unless explicitly allowed (WEBHOOK_ALLOW_UNSIGNED, meant for a local fake
+Akool in tests).
+"""
+
+import base64
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from utils.akool_client import AkoolClient
+
+# cryptography is optional - only needed to decrypt real Akool callbacks
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+
+class WebhookError(Exception):
+    """Callback body could not be verified or decoded"""
+
+
+# Webhook status values (different from faceswap_status in listbyids results)
+WEBHOOK_STATUS_QUEUEING = 1
+WEBHOOK_STATUS_PROCESSING = 2
+WEBHOOK_STATUS_COMPLETED = 3
+WEBHOOK_STATUS_FAILED = 4
+
+_STATUS_MAP = {
+    WEBHOOK_STATUS_QUEUEING: AkoolClient.STATUS_PENDING,
+    WEBHOOK_STATUS_PROCESSING: AkoolClient.STATUS_PENDING,
+    WEBHOOK_STATUS_COMPLETED: AkoolClient.STATUS_SUCCESS,
+    WEBHOOK_STATUS_FAILED: AkoolClient.STATUS_FAILED,
+}
+
+
+def decode_callback(body: dict, client_id: str = None, client_secret: str = None,
+                    allow_unsigned: bool = False) -> dict:
+    """
+    Verify and decode an Akool callback body
+
+    Args:
+        body: Parsed JSON body of the callback request
+        client_id: Akool clientId (AES IV, required for encrypted bodies)
+        client_secret: Akool clientSecret (AES key, required for encrypted bodies)
+        allow_unsigned: Accept plain unsigned bodies (testing only)
+
+    Returns:
+        Decoded event: {"_id", "status", "url", ...}
+
+    Raises:
+        WebhookError: If the body is unsigned (and not allowed), the signature
+            is wrong or the body cannot be decrypted
+    """
+    if "dataEncrypt" not in body:
+        if allow_unsigned:
+            return body
+        raise WebhookError("Unsigned callback rejected (set WEBHOOK_ALLOW_UNSIGNED=true only for testing)")
+
+    if not (client_id and client_secret):
+        raise WebhookError("Encrypted callback received but AKOOL_CLIENT_ID/AKOOL_CLIENT_SECRET are not set")
+    if Cipher is None:
+        raise WebhookError("cryptography is not installed. Run: pip install cryptography")
+
+    data_encrypt = body["dataEncrypt"]
+    parts = sorted([client_id, str(body.get("timestamp", "")), str(body.get("nonce", "")), data_encrypt])
+    if hashlib.sha1("".join(parts).encode("utf-8")).hexdigest() != body.get("signature"):
+        raise WebhookError("Invalid callback signature")
+
+    try:
+        decryptor = Cipher(
+            algorithms.AES(client_secret.encode("utf-8")),
+            modes.CBC(client_id.encode("utf-8"))
+        ).decryptor()
+        padded = decryptor.update(base64.b64decode(data_encrypt)) + decryptor.finalize()
+        plain = padded[:-padded[-1]]  # PKCS#7
+        return json.loads(plain.decode("utf-8"))
+    except (ValueError, IndexError) as e:
+        raise WebhookError(f"Failed to decrypt callback: {e}")
+
+
+class WebhookServer:
+    """
+    Threaded HTTP server that turns Akool callbacks into poller results
+
+    Every POST (any path) is decoded with decode_callback() and passed to
+    on_event(job_id, status, video_url, error_msg) with status mapped to
+    AkoolClient.STATUS_*.
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8502,
+        on_event: Callable = None,
+        client_id: str = None,
+        client_secret: str = None,
+        allow_unsigned: bool = False
+    ):
+        """
+        Initialize receiver (call start() to begin listening)
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            on_event: Callback(job_id, status, video_url, error_msg);
+                default delivers to utils.akool_poller
+            client_id: Akool clientId for encrypted callbacks
+            client_secret: Akool clientSecret for encrypted callbacks
+            allow_unsigned: Accept plain unsigned bodies (testing only)
+        """
+        if on_event is None:
+            from utils.akool_poller import deliver_result
+            on_event = deliver_result
+
+        self.on_event = on_event
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.allow_unsigned = allow_unsigned
+        self.events_received = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    @property
+    def url(self) -> str:
+        """Local URL of the receiver (use WEBHOOK_PUBLIC_URL when behind a proxy)"""
+        host = self._httpd.server_address[0]
+        if host in ("0.0.0.0", ""):
+            host = "127.0.0.1"
+        return f"http://{host}:{self.port}/akool/webhook"
+
+    def start(self) -> "WebhookServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="akool-webhook", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def handle(self, body: dict):
+        """Decode one callback body and dispatch it"""
+        event = decode_callback(body, self.client_id, self.client_secret, self.allow_unsigned)
+
+        job_id = event.get("_id")
+        if not job_id:
+            raise WebhookError("Callback has no _id")
+
+        status = _STATUS_MAP.get(event.get("status"), AkoolClient.STATUS_PENDING)
+        error_msg = None
+        if status == AkoolClient.STATUS_FAILED:
+            error_msg = event.get("msg") or event.get("alg_msg") or "Processing failed"
+
+        self.events_received += 1
+        self.on_event(job_id, status, event.get("url"), error_msg)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    server.handle(json.loads(self.rfile.read(length) or b"{}"))
+                except (WebhookError, ValueError) as e:
+                    self._reply(400, {"error": str(e)})
+                    return
+                self._reply(200, {"ok": True})
+
+            def _reply(self, code: int, payload: dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # Keep callbacks out of the Streamlit console
+                pass
+
+        return Handler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_webhook_server() -> Optional[WebhookServer]:
+    """
+    Start (once) and return the process-wide webhook receiver
+
+    Returns:
+        WebhookServer, or None if webhooks are disabled or the port is taken
+        (jobs then fall back to polling)
+    """
+    from config import (
+        WEBHOOK_ENABLED, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_ALLOW_UNSIGNED,
+        AKOOL_CLIENT_ID, AKOOL_CLIENT_SECRET
+    )
+
+    global _server
+    if not WEBHOOK_ENABLED:
+        return None
+
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = WebhookServer(
+                    WEBHOOK_HOST, WEBHOOK_PORT,
+                    client_id=AKOOL_CLIENT_ID,
+                    client_secret=AKOOL_CLIENT_SECRET,
+                    allow_unsigned=WEBHOOK_ALLOW_UNSIGNED
+                ).start()
+            except OSError as e:
+                print(f"Webhook receiver not started ({WEBHOOK_HOST}:{WEBHOOK_PORT}): {e}")
+                _server = False  # Don't retry on every job
+        return _server or None
+
+
+def get_webhook_url() -> Optional[str]:
+    """
+    URL to pass to Akool as webhookUrl
+
+    Returns:
+        WEBHOOK_PUBLIC_URL (or the receiver's local URL), None if webhooks are off
+    """
+    from config import WEBHOOK_PUBLIC_URL
+
+    server = get_webhook_server()
+    if server is None:
+        return None
+    return WEBHOOK_PUBLIC_URL or server.url